@@ -1,11 +1,14 @@
 from __future__ import absolute_import, unicode_literals
 import os
 from celery import Celery
-from django.conf import settings
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_travel_app.settings')
 
+# Workers skip Django's system checks, which would import the URLconf and
+# every view; `manage.py check` and the web process still run them.
+os.environ.setdefault('CELERY_SKIP_CHECKS', 'true')
+
 app = Celery('alx_travel_app')
 
 # Using a string here means the worker doesn't have to serialize
@@ -0,0 +1,170 @@
+"""
+OpenAPI schema served from a prebuilt artifact.
+
+drf_yasg introspects every view and serializer to build the schema, which
+is far too slow to repeat on each request. ``generate_schema`` writes the
+schema once per ``APP_VERSION`` to ``SCHEMA_ARTIFACT_DIR``; each process
+loads it on first use (building it if the artifact is missing) and serves
+the bytes from memory with an ETag and a precompressed gzip variant.
+
+With DEBUG on, the artifact is skipped and the schema is rebuilt once per
+process, so code changes show up after a restart.
+"""
+import gzip
+import hashlib
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, Http404
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_safe
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+
+FORMATS = {
+    '.json': 'application/json',
+    '.yaml': 'application/yaml',
+}
+
+_artifacts = {}
+_lock = threading.Lock()
+
+
+def api_info():
+    from drf_yasg import openapi
+
+    return openapi.Info(
+        title="ALX Travel App API",
+        default_version='v1',
+        description="API documentation for ALX Travel App",
+        terms_of_service="https://www.google.com/policies/terms/",
+        contact=openapi.Contact(email="contact@alxtravel.local"),
+        license=openapi.License(name="BSD License"),
+    )
+
+
+class SchemaArtifact:
+    """Encoded schema plus what is needed to serve it"""
+
+    def __init__(self, body, content_type):
+        self.body = body
+        self.gzipped = gzip.compress(body, mtime=0)
+        self.content_type = content_type
+        self.etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+
+
+def artifact_path(fmt):
+    return Path(settings.SCHEMA_ARTIFACT_DIR) / f'openapi-{settings.APP_VERSION}{fmt}'
+
+
+def build_schema(fmt):
+    """Generate the public schema without a request, encoded as ``fmt``"""
+    from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+    from drf_yasg.generators import OpenAPISchemaGenerator
+
+    schema = OpenAPISchemaGenerator(api_info()).get_schema(request=None, public=True)
+    codec = OpenAPICodecJson if fmt == '.json' else OpenAPICodecYaml
+    return codec(validators=[]).encode(schema)
+
+
+def write_artifacts():
+    """Write every format for the current APP_VERSION; returns the paths"""
+    paths = []
+    for fmt in FORMATS:
+        path = artifact_path(fmt)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        body = build_schema(fmt)
+        # Write then rename so a running server never reads half a file.
+        descriptor, temporary = tempfile.mkstemp(dir=path.parent, prefix='.openapi-')
+        with os.fdopen(descriptor, 'wb') as handle:
+            handle.write(body)
+        os.replace(temporary, path)
+        paths.append(path)
+    return paths
+
+
+def _load(fmt):
+    if not settings.DEBUG:
+        try:
+            return artifact_path(fmt).read_bytes()
+        except FileNotFoundError:
+            pass
+    return build_schema(fmt)
+
+
+def get_artifact(fmt):
+    """Return the in-memory ``SchemaArtifact`` for ``fmt``, loading it once"""
+    artifact = _artifacts.get(fmt)
+    if artifact is None:
+        with _lock:
+            artifact = _artifacts.get(fmt)
+            if artifact is None:
+                artifact = SchemaArtifact(_load(fmt), FORMATS[fmt])
+                _artifacts[fmt] = artifact
+    return artifact
+
+
+def accepts_gzip(accept_encoding):
+    """Whether an Accept-Encoding value allows gzip, honouring q-values such as ``gzip;q=0``"""
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding.lower()] = quality
+    return qualities.get('gzip', qualities.get('x-gzip', qualities.get('*', 0.0))) > 0
+
+
+@require_safe
+def schema_file_view(request, format):
+    """Serve the schema artifact, honouring If-None-Match and gzip"""
+    if format not in FORMATS:
+        raise Http404
+    artifact = get_artifact(format)
+
+    if artifact.etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    elif accepts_gzip(request.headers.get('Accept-Encoding', '')):
+        response = HttpResponse(artifact.gzipped, content_type=artifact.content_type)
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(artifact.body, content_type=artifact.content_type)
+    response['ETag'] = artifact.etag
+    response['Cache-Control'] = 'public, max-age=300'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+class SchemaUIView(APIView):
+    """
+    Swagger UI or ReDoc page that loads the schema from its spec URL.
+
+    drf_yasg's own UI views build the whole schema just to read its title,
+    so this passes a stub with the title and version only.
+    """
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+    ui = 'swagger'
+
+    def get_renderers(self):
+        from drf_yasg.renderers import SwaggerUIRenderer, ReDocRenderer
+
+        return [SwaggerUIRenderer() if self.ui == 'swagger' else ReDocRenderer()]
+
+    def get(self, request):
+        from drf_yasg import openapi
+
+        return Response(openapi.Swagger(info=api_info(), _prefix='/', paths=openapi.Paths(paths={})))
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import environ
+from celery.schedules import crontab
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -21,20 +22,11 @@ env = environ.Env(
     DEBUG=(bool, False)
 )
 
-# Read .env file
-env_file = BASE_DIR.parent / '.env'
-if env_file.exists():
-    environ.Env.read_env(env_file)
-    print(f"Loading .env from: {env_file}")
-else:
-    print(f"Warning: .env file not found at {env_file}")
-    # Try alternative location
-    alt_env_file = BASE_DIR / '.env'
-    if alt_env_file.exists():
-        environ.Env.read_env(alt_env_file)
-        print(f"Loading .env from alternative location: {alt_env_file}")
-    else:
-        print(f"Warning: .env file not found at {alt_env_file} either")
+# Read the first .env file found, next to the repository root or the project
+for env_file in (BASE_DIR.parent / '.env', BASE_DIR / '.env'):
+    if env_file.exists():
+        environ.Env.read_env(env_file)
+        break
 
 
 # Quick-start development settings - unsuitable for production
@@ -52,7 +44,9 @@ ALLOWED_HOSTS = env.list('ALLOWED_HOSTS', default=['localhost', '127.0.0.1'])
 # Application definition
 
 INSTALLED_APPS = [
-    'django.contrib.admin',
+    # Admin modules are discovered from urls.py, so workers and management
+    # commands that never route a request do not import them
+    'django.contrib.admin.apps.SimpleAdminConfig',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -60,6 +54,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     # Third party apps
     'rest_framework',
+    'rest_framework.authtoken',
     'corsheaders',
     'drf_yasg',
     'django_filters',
@@ -70,6 +65,9 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'listings.profiling.ProfilingMiddleware',
+    'listings.middleware.CompressionMiddleware',
+    'listings.middleware.RateLimitHeadersMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -116,6 +114,14 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -161,17 +167,33 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'listings.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
-    'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
+    # The browsable API is a development aid; production only speaks JSON
+    'DEFAULT_RENDERER_CLASSES': ['listings.renderers.ORJSONRenderer'] + (
+        ['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []
+    ),
+    # Token buckets: a client may burst up to N requests, then N per period
+    'DEFAULT_THROTTLE_CLASSES': [
+        'listings.throttling.AnonTokenBucketThrottle',
+        'listings.throttling.UserTokenBucketThrottle',
+        'listings.throttling.ScopedTokenBucketThrottle',
+        'listings.throttling.SearchTokenBucketThrottle',
     ],
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': env('THROTTLE_RATE_ANON', default='120/min'),
+        'user': env('THROTTLE_RATE_USER', default='300/min'),
+        # Each payment request calls Chapa
+        'payments': env('THROTTLE_RATE_PAYMENTS', default='10/min'),
+        'search': env('THROTTLE_RATE_SEARCH', default='30/min'),
+    },
+    # Proxies in front of the app that append to X-Forwarded-For
+    'NUM_PROXIES': env.int('NUM_PROXIES', default=None),
 }
 
 # CORS Configuration
@@ -183,6 +205,7 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True
+CORS_EXPOSE_HEADERS = ['RateLimit-Limit', 'RateLimit-Remaining', 'RateLimit-Reset', 'Retry-After']
 
 # Swagger Configuration
 SWAGGER_SETTINGS = {
@@ -208,12 +231,21 @@ SWAGGER_SETTINGS = {
     'DEEP_LINKING': True,
     'SHOW_EXTENSIONS': True,
     'SHOW_COMMON_EXTENSIONS': True,
+    'SPEC_URL': ('schema-json', {'format': '.json'}),
 }
 
 REDOC_SETTINGS = {
     'LAZY_RENDERING': False,
+    'SPEC_URL': ('schema-json', {'format': '.json'}),
 }
 
+# Prebuilt OpenAPI schema (see alx_travel_app/schema.py); run
+# `manage.py generate_schema` on deploy whenever APP_VERSION changes.
+# Required without DEBUG: a stale version would serve a stale schema and
+# cached responses under an unchanged ETag and key
+APP_VERSION = env('APP_VERSION', default='dev') if DEBUG else env('APP_VERSION')
+SCHEMA_ARTIFACT_DIR = env('SCHEMA_ARTIFACT_DIR', default=str(BASE_DIR / 'openapi'))
+
 # Celery Configuration
 CELERY_BROKER_URL = env('CELERY_BROKER_URL', default='redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = env('CELERY_RESULT_BACKEND', default='redis://localhost:6379/0')
@@ -221,3 +253,164 @@ CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+
+# Separate queues so slow email or maintenance work never delays payments.
+# Run one worker per queue, e.g.:
+#   celery -A alx_travel_app worker -Q payments -c 4 --prefetch-multiplier 1 -n payments@%h
+#   celery -A alx_travel_app worker -Q email -c 8 --prefetch-multiplier 4 -n email@%h
+#   celery -A alx_travel_app worker -Q maintenance -c 1 --prefetch-multiplier 1 -n maintenance@%h
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_ROUTES = {
+    'listings.tasks.send_payment_confirmation': {'queue': 'payments'},
+    'listings.tasks.send_listing_notification': {'queue': 'email'},
+    'listings.tasks.process_review_activity': {'queue': 'email'},
+    'listings.tasks.cleanup_inactive_listings': {'queue': 'maintenance'},
+    'listings.tasks.rollup_listing_stats': {'queue': 'maintenance'},
+    'listings.tasks.rebuild_trending_scores': {'queue': 'maintenance'},
+    'listings.tasks.compute_similar_listings': {'queue': 'maintenance'},
+    'listings.tasks.archive_bookings': {'queue': 'maintenance'},
+    'listings.tasks.refresh_exchange_rates': {'queue': 'maintenance'},
+    'listings.tasks.warm_caches': {'queue': 'maintenance'},
+}
+CELERY_WORKER_PREFETCH_MULTIPLIER = env.int('CELERY_WORKER_PREFETCH_MULTIPLIER', default=1)
+# Email and maintenance tasks ignore their results; the rest expire after a day.
+CELERY_RESULT_EXPIRES = env.int('CELERY_RESULT_EXPIRES', default=60 * 60 * 24)
+CELERY_BEAT_SCHEDULE = {
+    'rollup-listing-stats-incremental': {
+        'task': 'listings.tasks.rollup_listing_stats',
+        'schedule': 15 * 60,
+    },
+    'rollup-listing-stats-nightly': {
+        'task': 'listings.tasks.rollup_listing_stats',
+        'schedule': crontab(hour=2, minute=0),
+        'kwargs': {'full': True},
+    },
+    'rebuild-trending-scores': {
+        'task': 'listings.tasks.rebuild_trending_scores',
+        'schedule': 60 * 60,
+    },
+    'compute-similar-listings': {
+        'task': 'listings.tasks.compute_similar_listings',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'archive-bookings': {
+        'task': 'listings.tasks.archive_bookings',
+        'schedule': crontab(hour=4, minute=0),
+    },
+    # Normally scheduled by new reviews; this catches up after a lost run
+    'process-review-activity': {
+        'task': 'listings.tasks.process_review_activity',
+        'schedule': 10 * 60,
+    },
+    'refresh-exchange-rates': {
+        'task': 'listings.tasks.refresh_exchange_rates',
+        'schedule': 60 * 60,
+    },
+}
+
+# Idempotency-Key support for retried POST requests
+IDEMPOTENCY_KEY_TTL = env.int('IDEMPOTENCY_KEY_TTL', default=60 * 60 * 24)
+IDEMPOTENCY_LOCK_TIMEOUT = env.int('IDEMPOTENCY_LOCK_TIMEOUT', default=60)
+IDEMPOTENCY_WAIT_TIMEOUT = env.float('IDEMPOTENCY_WAIT_TIMEOUT', default=10.0)
+
+# Host analytics rollups: window rebuilt by the nightly full run
+ROLLUP_FULL_PAST_DAYS = env.int('ROLLUP_FULL_PAST_DAYS', default=90)
+ROLLUP_FULL_FUTURE_DAYS = env.int('ROLLUP_FULL_FUTURE_DAYS', default=365)
+HOST_STATS_MAX_DAYS = 366
+
+# Trending listings: how fast popularity decays and how far back it looks
+TRENDING_HALF_LIFE_DAYS = env.float('TRENDING_HALF_LIFE_DAYS', default=7.0)
+TRENDING_WINDOW_DAYS = env.int('TRENDING_WINDOW_DAYS', default=60)
+
+# Similar listings batch job: neighbours kept per listing and rows per
+# sparse matrix product (lower it to cap the job's peak memory)
+SIMILAR_LISTINGS_K = env.int('SIMILAR_LISTINGS_K', default=10)
+SIMILAR_LISTINGS_CHUNK_SIZE = env.int('SIMILAR_LISTINGS_CHUNK_SIZE', default=256)
+
+# Admin changelists: largest exact COUNT(*) before falling back to table
+# statistics, and how long cached filter choices live
+ADMIN_EXACT_COUNT_LIMIT = env.int('ADMIN_EXACT_COUNT_LIMIT', default=10000)
+ADMIN_FILTER_CACHE_TIMEOUT = env.int('ADMIN_FILTER_CACHE_TIMEOUT', default=60 * 10)
+
+# Cached token authentication: shared cache lifetime, and size and lifetime
+# of the per-process copy (other processes see revocations after at most
+# AUTH_TOKEN_LOCAL_TTL seconds)
+AUTH_TOKEN_CACHE_TIMEOUT = env.int('AUTH_TOKEN_CACHE_TIMEOUT', default=60 * 5)
+AUTH_TOKEN_LOCAL_TTL = env.int('AUTH_TOKEN_LOCAL_TTL', default=30)
+AUTH_TOKEN_LOCAL_SIZE = env.int('AUTH_TOKEN_LOCAL_SIZE', default=10000)
+
+# Booking and payment status events (/api/events/, ASGI only). memory://
+# only reaches streams in the publishing process; use a redis:// URL when
+# more than one process serves or changes bookings
+EVENTS_BROKER_URL = env('EVENTS_BROKER_URL', default='memory://')
+# Seconds between keep-alive comments on an idle stream
+EVENTS_HEARTBEAT_SECONDS = env.int('EVENTS_HEARTBEAT_SECONDS', default=20)
+# Messages a slow stream may fall behind before it is ended
+EVENTS_QUEUE_SIZE = env.int('EVENTS_QUEUE_SIZE', default=64)
+
+# Response compression: bodies under COMPRESSION_MIN_SIZE bytes are sent as
+# they are. Brotli quality 5 compresses close to gzip -9 at a fraction of
+# the cost of the default 11, which is meant for static assets
+COMPRESSION_MIN_SIZE = env.int('COMPRESSION_MIN_SIZE', default=1024)
+COMPRESSION_BROTLI_QUALITY = env.int('COMPRESSION_BROTLI_QUALITY', default=5)
+COMPRESSION_GZIP_LEVEL = env.int('COMPRESSION_GZIP_LEVEL', default=6)
+
+# Booking archive: finished stays that ended this many days ago move to
+# ArchivedBooking (never inside the analytics or trending windows), in
+# batches of BOOKING_ARCHIVE_BATCH_SIZE, at most BOOKING_ARCHIVE_MAX_BATCHES
+# per nightly run
+BOOKING_ARCHIVE_AFTER_DAYS = env.int('BOOKING_ARCHIVE_AFTER_DAYS', default=365)
+BOOKING_ARCHIVE_BATCH_SIZE = env.int('BOOKING_ARCHIVE_BATCH_SIZE', default=1000)
+BOOKING_ARCHIVE_MAX_BATCHES = env.int('BOOKING_ARCHIVE_MAX_BATCHES', default=500)
+
+# Throttle buckets (see DEFAULT_THROTTLE_RATES). memory:// keeps them per
+# process; use a redis:// URL so every process shares the same buckets
+THROTTLE_STORE_URL = env('THROTTLE_STORE_URL', default='memory://')
+
+# Sampling profiler, off by default. A PROFILING_SAMPLE_RATE fraction of
+# requests under PROFILING_PATHS, requests whose X-Profile header equals
+# PROFILING_TOKEN and a PROFILING_TASK_SAMPLE_RATE fraction of the runs of
+# the tasks in PROFILING_TASKS are sampled every PROFILING_INTERVAL
+# seconds and written to PROFILING_DIR; see `manage.py profile_report`
+PROFILING_SAMPLE_RATE = env.float('PROFILING_SAMPLE_RATE', default=0.0)
+PROFILING_PATHS = env.list('PROFILING_PATHS', default=['/api/'])
+PROFILING_TOKEN = env('PROFILING_TOKEN', default='')
+PROFILING_TASKS = env.list('PROFILING_TASKS', default=[])
+PROFILING_TASK_SAMPLE_RATE = env.float('PROFILING_TASK_SAMPLE_RATE', default=1.0)
+PROFILING_INTERVAL = env.float('PROFILING_INTERVAL', default=0.005)
+PROFILING_MAX_CONCURRENT = env.int('PROFILING_MAX_CONCURRENT', default=2)
+PROFILING_DIR = env('PROFILING_DIR', default=str(BASE_DIR / 'profiles'))
+
+# Review side effects: the first new review schedules a run this many
+# seconds later that handles every review written by then, in batches of
+# REVIEW_ACTIVITY_BATCH_SIZE; owner emails quote up to
+# REVIEW_DIGEST_MAX_REVIEWS of a listing's new reviews
+REVIEW_ACTIVITY_DELAY = env.int('REVIEW_ACTIVITY_DELAY', default=30)
+REVIEW_ACTIVITY_BATCH_SIZE = env.int('REVIEW_ACTIVITY_BATCH_SIZE', default=1000)
+REVIEW_DIGEST_MAX_REVIEWS = env.int('REVIEW_DIGEST_MAX_REVIEWS', default=10)
+
+# Exchange rates for ?currency= on listing and booking reads: fetched
+# hourly from FX_RATES_URL ({base} is replaced by FX_BASE_CURRENCY; the
+# response must carry a "rates" object of units per base unit). Each
+# process checks for a new version at most every FX_VERSION_CHECK_SECONDS
+FX_BASE_CURRENCY = env('FX_BASE_CURRENCY', default='USD')
+FX_RATES_URL = env('FX_RATES_URL', default='https://open.er-api.com/v6/latest/{base}')
+FX_RATES_TIMEOUT = env.float('FX_RATES_TIMEOUT', default=10.0)
+FX_VERSION_CHECK_SECONDS = env.int('FX_VERSION_CHECK_SECONDS', default=60)
+
+# Response cache for anonymous listing reads, and warming it (see
+# listings/warming.py). Needs a shared CACHE_URL to help more than one
+# process. Reads are counted per CACHE_STATS_BUCKET_SECONDS bucket and
+# kept for CACHE_STATS_RETENTION_DAYS; a warm-up replays the
+# WARMING_TOP_QUERIES most read queries of the last WARMING_LOOKBACK_HOURS,
+# WARMING_CONCURRENCY at a time, starting at most WARMING_RATE a second
+RESPONSE_CACHE_TIMEOUT = env.int('RESPONSE_CACHE_TIMEOUT', default=300)
+CACHE_STATS_BUCKET_SECONDS = env.int('CACHE_STATS_BUCKET_SECONDS', default=300)
+CACHE_STATS_FLUSH_SECONDS = env.int('CACHE_STATS_FLUSH_SECONDS', default=60)
+CACHE_STATS_RETENTION_DAYS = env.int('CACHE_STATS_RETENTION_DAYS', default=7)
+WARMING_TOP_QUERIES = env.int('WARMING_TOP_QUERIES', default=200)
+WARMING_LOOKBACK_HOURS = env.int('WARMING_LOOKBACK_HOURS', default=24)
+WARMING_CONCURRENCY = env.int('WARMING_CONCURRENCY', default=4)
+WARMING_RATE = env.float('WARMING_RATE', default=20.0)
+WARMING_DELAY = env.int('WARMING_DELAY', default=60)
+WARMING_ON_DEPLOY = env.bool('WARMING_ON_DEPLOY', default=not DEBUG)
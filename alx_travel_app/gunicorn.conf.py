@@ -0,0 +1,43 @@
+"""
+Gunicorn settings for the web process.
+
+    gunicorn -c gunicorn.conf.py alx_travel_app.wsgi
+
+The application, URLconf, views and OpenAPI schema are imported once in the
+master and then forked, so workers start instantly and share those pages of
+memory instead of each importing everything again.
+"""
+import gc
+import multiprocessing
+import os
+
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+
+def when_ready(server):
+    """Import everything a request needs before the first fork"""
+    if not preload_app:
+        return
+    from django.db import connections
+    from django.urls import get_resolver
+    from alx_travel_app import schema
+
+    get_resolver().url_patterns
+    schema.get_artifact('.json')
+    # Forked workers must not share the master's database connections.
+    connections.close_all()
+    # Keep the collector from touching (and so copying) preloaded objects.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from django.db import connections
+
+    connections.close_all()
@@ -1,21 +1,111 @@
-from django.contrib import admin
-from .models import Listing, Review, Booking
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.http import HttpResponseRedirect
+from django.utils import timezone
+from django.utils.functional import cached_property
+from . import transitions, warming
+from .models import Listing, Review, Booking, ArchivedBooking, RateRule, ListingPopularity
+
+
+LOCATION_CHOICES_CACHE_KEY = 'admin:listing-locations'
+MAX_LOCATION_CHOICES = 500
+
+
+def estimated_row_count(model, using):
+    """Row count from table statistics, or None where the database has none"""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT TABLE_ROWS FROM information_schema.TABLES '
+                'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+                [table]
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that never runs an unbounded COUNT(*).
+
+    Unfiltered changelists use the table statistics once the table is larger
+    than ADMIN_EXACT_COUNT_LIMIT; filtered ones count at most that many rows.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        limit = settings.ADMIN_EXACT_COUNT_LIMIT
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > limit:
+                return estimate
+        return queryset.order_by()[:limit].count()
+
+
+class HighVolumeAdmin(admin.ModelAdmin):
+    """Changelist defaults for tables with millions of rows"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class LocationFilter(admin.SimpleListFilter):
+    """Location filter whose choices are cached instead of scanned per request"""
+    title = 'location'
+    parameter_name = 'location'
+    
+    def lookups(self, request, model_admin):
+        locations = cache.get(LOCATION_CHOICES_CACHE_KEY)
+        if locations is None:
+            locations = list(
+                Listing.objects.order_by('location')
+                .values_list('location', flat=True)
+                .distinct()[:MAX_LOCATION_CHOICES]
+            )
+            cache.set(LOCATION_CHOICES_CACHE_KEY, locations, settings.ADMIN_FILTER_CACHE_TIMEOUT)
+        return [(location, location) for location in locations]
+    
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(location=self.value())
+        return queryset
+
+
+class RateRuleInline(admin.TabularInline):
+    model = RateRule
+    extra = 0
+    fields = ['name', 'start_date', 'end_date', 'weekdays', 'multiplier']
 
 
 @admin.register(Listing)
-class ListingAdmin(admin.ModelAdmin):
-    list_display = ['title', 'listing_type', 'location', 'price', 'created_by', 'is_active', 'created_at']
-    list_filter = ['listing_type', 'is_active', 'created_at', 'location']
+class ListingAdmin(HighVolumeAdmin):
+    list_display = ['title', 'listing_type', 'location', 'price', 'currency', 'created_by', 'is_active', 'created_at']
+    list_filter = ['listing_type', 'is_active', 'created_at', LocationFilter]
+    list_select_related = ['created_by']
     search_fields = ['title', 'description', 'location']
     list_editable = ['is_active']
     readonly_fields = ['created_at', 'updated_at']
+    autocomplete_fields = ['created_by']
+    actions = ['activate_listings', 'deactivate_listings']
     
     fieldsets = (
         ('Basic Information', {
             'fields': ('title', 'description', 'listing_type')
         }),
         ('Pricing & Location', {
-            'fields': ('price', 'location')
+            'fields': ('price', 'currency', 'included_guests', 'extra_guest_fee', 'location')
         }),
         ('Status', {
             'fields': ('is_active', 'created_by')
@@ -25,14 +115,35 @@ class ListingAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+    inlines = [RateRuleInline]
+    
+    def _set_active(self, request, queryset, is_active):
+        """Flip is_active with one UPDATE, keeping the trending rows in step"""
+        queryset = queryset.exclude(is_active=is_active)
+        ListingPopularity.objects.filter(listing__in=queryset.values('pk')).update(is_active=is_active)
+        updated = queryset.update(is_active=is_active, updated_at=timezone.now())
+        if updated:
+            warming.invalidate()
+        state = 'activated' if is_active else 'deactivated'
+        self.message_user(request, f'{updated} listing(s) {state}.')
+    
+    @admin.action(description='Activate selected listings')
+    def activate_listings(self, request, queryset):
+        self._set_active(request, queryset, True)
+    
+    @admin.action(description='Deactivate selected listings')
+    def deactivate_listings(self, request, queryset):
+        self._set_active(request, queryset, False)
 
 
 @admin.register(Review)
-class ReviewAdmin(admin.ModelAdmin):
+class ReviewAdmin(HighVolumeAdmin):
     list_display = ['listing', 'reviewer', 'rating', 'created_at']
     list_filter = ['rating', 'created_at']
+    list_select_related = ['listing', 'reviewer']
     search_fields = ['listing__title', 'reviewer__username', 'comment']
     readonly_fields = ['created_at']
+    autocomplete_fields = ['listing', 'reviewer']
     
     fieldsets = (
         ('Review Information', {
@@ -45,20 +156,63 @@ class ReviewAdmin(admin.ModelAdmin):
     )
 
 
+class BookingAdminForm(forms.ModelForm):
+    """
+    Posts back the status and version the page showed, so a save over a
+    change made since is refused instead of undoing it.
+    """
+    expected_version = forms.IntegerField(widget=forms.HiddenInput, required=False)
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk is not None:
+            self.initial.setdefault('expected_version', self.instance.version)
+        if 'status' in self.fields:
+            # Also makes changed_data compare with the status shown, not the stored one.
+            self.fields['status'].show_hidden_initial = True
+    
+    def shown_status(self):
+        """The status the page showed; None when the form has no status"""
+        if 'status' not in self.fields:
+            return None
+        widget = self.fields['status'].hidden_widget()
+        return widget.value_from_datadict(self.data, self.files, self.add_initial_prefix('status')) or None
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        if self.instance.pk is None:
+            return cleaned_data
+        
+        # The instance still holds what is stored until the form is saved.
+        stored = self.instance.status
+        field = 'status' if 'status' in self.fields else None
+        shown = self.shown_status()
+        version = cleaned_data.get('expected_version')
+        if (shown is not None and shown != stored) or (version is not None and version != self.instance.version):
+            self.add_error(field, f'This booking was changed since the page was loaded and is now {stored}; reload it.')
+        elif 'status' in self.changed_data and not transitions.allowed(Booking, stored, cleaned_data.get('status')):
+            self.add_error(field, f'A booking cannot go from {stored} to {cleaned_data.get("status")}.')
+        return cleaned_data
+
+
 @admin.register(Booking)
-class BookingAdmin(admin.ModelAdmin):
+class BookingAdmin(HighVolumeAdmin):
     list_display = ['listing', 'user', 'check_in_date', 'check_out_date', 'status', 'total_price', 'created_at']
     list_filter = ['status', 'created_at', 'check_in_date']
+    list_select_related = ['listing', 'user']
     search_fields = ['listing__title', 'user__username', 'user__email']
     readonly_fields = ['created_at', 'updated_at', 'duration_days']
     list_editable = ['status']
+    form = BookingAdminForm
+    autocomplete_fields = ['listing', 'user']
+    actions = ['mark_confirmed', 'mark_cancelled', 'mark_completed']
     
     fieldsets = (
         ('Booking Information', {
             'fields': ('listing', 'user', 'check_in_date', 'check_out_date', 'number_of_guests')
         }),
         ('Pricing & Status', {
-            'fields': ('total_price', 'status')
+            'fields': ('total_price', 'status', 'expected_version')
         }),
         ('Additional Information', {
             'fields': ('special_requests',)
@@ -73,3 +227,82 @@ class BookingAdmin(admin.ModelAdmin):
         """Display booking duration in admin"""
         return obj.duration_days()
     duration_days.short_description = 'Duration (days)'
+    
+    def get_changelist_form(self, request, **kwargs):
+        kwargs.setdefault('form', BookingAdminForm)
+        return super().get_changelist_form(request, **kwargs)
+    
+    def save_model(self, request, obj, form, change):
+        """
+        Write only what the form changed, over the status and version the
+        page showed. A StatusConflict propagates to the view, which rolls
+        the save back.
+        """
+        if not change:
+            return super().save_model(request, obj, form, change)
+        transitions.save(
+            obj,
+            [name for name in form.changed_data if name != 'expected_version'],
+            expected_status=form.shown_status(),
+            expected_version=form.cleaned_data.get('expected_version'),
+        )
+    
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except transitions.StatusConflict:
+            return self.conflict_response(request)
+    
+    def changelist_view(self, request, extra_context=None):
+        try:
+            return super().changelist_view(request, extra_context)
+        except transitions.StatusConflict:
+            return self.conflict_response(request)
+    
+    def conflict_response(self, request):
+        """
+        Send the user back to the page after a StatusConflict. The admin
+        saves inside a transaction, so the write and its history entry were
+        rolled back and no success message was added.
+        """
+        self.message_user(
+            request, 'A booking was changed by someone else while saving; nothing was saved. Reload it and try again.',
+            messages.ERROR
+        )
+        return HttpResponseRedirect(request.get_full_path())
+    
+    def _set_status(self, request, queryset, status):
+        """Move the selected bookings that may go to ``status`` in one UPDATE"""
+        moved, not_allowed = transitions.move_all(queryset, status)
+        self.message_user(request, f'{moved} booking(s) marked {status}.')
+        if not_allowed:
+            self.message_user(
+                request, f'{not_allowed} booking(s) cannot be marked {status} from their status.', messages.WARNING
+            )
+    
+    @admin.action(description='Mark selected bookings as confirmed')
+    def mark_confirmed(self, request, queryset):
+        self._set_status(request, queryset, 'confirmed')
+    
+    @admin.action(description='Mark selected bookings as cancelled')
+    def mark_cancelled(self, request, queryset):
+        self._set_status(request, queryset, 'cancelled')
+    
+    @admin.action(description='Mark selected bookings as completed')
+    def mark_completed(self, request, queryset):
+        self._set_status(request, queryset, 'completed')
+
+
+@admin.register(ArchivedBooking)
+class ArchivedBookingAdmin(HighVolumeAdmin):
+    """Read-only view of bookings moved out by the archive job"""
+    list_display = ['id', 'listing', 'user', 'check_in_date', 'check_out_date', 'status', 'total_price', 'archived_at']
+    list_filter = ['status', 'check_in_date']
+    list_select_related = ['listing', 'user']
+    search_fields = ['user__username', 'user__email', 'payment_transaction_id']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
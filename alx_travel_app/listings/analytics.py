@@ -0,0 +1,225 @@
+"""
+Daily rollups of bookings and reviews for host analytics.
+
+``ListingDailyStats`` holds one row per listing per day with activity:
+booked nights, revenue per booking status and the reviews written that
+day. A booking counts on every night from check-in up to check-out and its
+total price is spread evenly over those nights, to the cent.
+
+Incremental runs rebuild only the listing-days touched by bookings and
+reviews changed since the previous run. The days a booking or review stops
+counting on (dates or listing moved, rating edited, row deleted) are
+recorded as ``StaleStatsRange`` rows when the change is saved, and every
+run rebuilds and then removes the ones it read. Full runs rebuild a fixed
+window around today. Stale days older than the archive cutoff are rebuilt
+from ``ArchivedBooking`` as well, so archiving never drops revenue.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .archive import archive_cutoff
+from .models import (
+    Listing, Review, Booking, ArchivedBooking, ListingDailyStats, JobCheckpoint, StaleStatsRange,
+)
+
+
+CHECKPOINT_NAME = 'listing_daily_stats'
+LISTING_CHUNK_SIZE = 500
+OCCUPYING_STATUSES = ('pending', 'confirmed', 'completed')
+REVENUE_FIELDS = {status: f'revenue_{status}' for status, _ in Booking.STATUS_CHOICES}
+COUNTER_FIELDS = ['nights_booked', 'new_reviews', 'rating_sum']
+
+
+def _day_bounds(first, last):
+    """Aware datetimes covering the local days ``first`` to ``last`` inclusive"""
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(first, time.min), tz)
+    end = timezone.make_aware(datetime.combine(last + timedelta(days=1), time.min), tz)
+    return start, end
+
+
+def _extend(ranges, listing_id, first, last):
+    """Add ``first..last`` to the listing's sorted day ranges, merging only those it overlaps or touches"""
+    kept = []
+    for start, end in ranges.get(listing_id, ()):
+        if end + timedelta(days=1) < first or last + timedelta(days=1) < start:
+            kept.append((start, end))
+        else:
+            first, last = min(first, start), max(last, end)
+    kept.append((first, last))
+    kept.sort()
+    ranges[listing_id] = kept
+
+
+def _covers(spans, day):
+    return any(start <= day <= end for start, end in spans)
+
+
+def touched_ranges(since):
+    """Return ``{listing_id: [(first_day, last_day), ...]}`` changed since ``since``"""
+    ranges = {}
+    changed_bookings = Booking.objects.filter(updated_at__gte=since).values_list(
+        'listing_id', 'check_in_date', 'check_out_date'
+    )
+    for listing_id, check_in, check_out in changed_bookings.iterator():
+        _extend(ranges, listing_id, *booking_days(check_in, check_out))
+    new_reviews = Review.objects.filter(created_at__gte=since).values_list('listing_id', 'created_at')
+    for listing_id, created_at in new_reviews.iterator():
+        day = timezone.localdate(created_at)
+        _extend(ranges, listing_id, day, day)
+    return ranges
+
+
+def booking_days(check_in, check_out):
+    """The ``(first_day, last_day)`` nights a stay counts on"""
+    return check_in, check_out - timedelta(days=1)
+
+
+def mark_stale(listing_id, first, last):
+    """Have the next run rebuild ``listing_id`` from ``first`` to ``last``"""
+    StaleStatsRange.objects.create(listing_id=listing_id, first_day=first, last_day=last)
+
+
+def stale_ranges():
+    """Return ``(ranges, pks)``: the recorded stale days per listing and the rows they came from"""
+    ranges = {}
+    pks = []
+    rows = StaleStatsRange.objects.values_list('pk', 'listing_id', 'first_day', 'last_day')
+    for pk, listing_id, first, last in rows.iterator():
+        _extend(ranges, listing_id, first, last)
+        pks.append(pk)
+    return ranges, pks
+
+
+def full_ranges(first, last):
+    """Return the full window for every listing with activity inside it"""
+    window_start, window_end = _day_bounds(first, last)
+    booked = Booking.objects.filter(
+        check_in_date__lte=last, check_out_date__gt=first
+    ).values_list('listing_id', flat=True)
+    reviewed = Review.objects.filter(
+        created_at__gte=window_start, created_at__lt=window_end
+    ).values_list('listing_id', flat=True)
+    existing = ListingDailyStats.objects.filter(
+        date__range=(first, last)
+    ).values_list('listing_id', flat=True)
+    listing_ids = set(booked.distinct()) | set(reviewed.distinct()) | set(existing.distinct())
+    return {listing_id: [(first, last)] for listing_id in listing_ids}
+
+
+def _spread_cents(total, nights):
+    """Split a price into per-night cents that add back up to the total"""
+    cents = int(total * 100)
+    base, remainder = divmod(cents, nights)
+    return [base + 1 if night < remainder else base for night in range(nights)]
+
+
+def _rebuild_chunk(ranges):
+    """Recompute and replace the rollup rows of one chunk of listings"""
+    listing_ids = list(ranges)
+    spans = [span for listing_spans in ranges.values() for span in listing_spans]
+    first = min(start for start, _ in spans)
+    last = max(end for _, end in spans)
+    hosts = dict(Listing.objects.filter(pk__in=listing_ids).values_list('pk', 'created_by_id'))
+
+    counters = defaultdict(lambda: defaultdict(int))
+    sources = [Booking.objects]
+    if first < archive_cutoff():
+        # Only stale ranges reach back this far; the cold table is read then alone.
+        sources.append(ArchivedBooking.objects)
+    for source in sources:
+        bookings = source.filter(
+            listing_id__in=listing_ids,
+            check_in_date__lte=last,
+            check_out_date__gt=first,
+        ).values_list('listing_id', 'check_in_date', 'check_out_date', 'status', 'total_price')
+        for listing_id, check_in, check_out, status, total_price in bookings.iterator():
+            nights = (check_out - check_in).days
+            revenue_field = REVENUE_FIELDS[status]
+            for offset, cents in enumerate(_spread_cents(total_price, nights)):
+                day = check_in + timedelta(days=offset)
+                if day < first or day > last:
+                    continue
+                row = counters[(listing_id, day)]
+                row[revenue_field] += cents
+                if status in OCCUPYING_STATUSES:
+                    row['nights_booked'] += 1
+
+    window_start, window_end = _day_bounds(first, last)
+    reviews = Review.objects.filter(
+        listing_id__in=listing_ids,
+        created_at__gte=window_start,
+        created_at__lt=window_end,
+    ).values_list('listing_id', 'created_at', 'rating')
+    for listing_id, created_at, rating in reviews.iterator():
+        row = counters[(listing_id, timezone.localdate(created_at))]
+        row['new_reviews'] += 1
+        row['rating_sum'] += rating
+
+    rows = []
+    for (listing_id, day), values in counters.items():
+        if listing_id not in hosts or not _covers(ranges[listing_id], day):
+            continue
+        stats = ListingDailyStats(listing_id=listing_id, host_id=hosts[listing_id], date=day)
+        for field, value in values.items():
+            if field in COUNTER_FIELDS:
+                setattr(stats, field, value)
+            else:
+                setattr(stats, field, Decimal(value).scaleb(-2))
+        rows.append(stats)
+
+    stale = Q()
+    for listing_id, listing_spans in ranges.items():
+        for start, end in listing_spans:
+            stale |= Q(listing_id=listing_id, date__range=(start, end))
+    with transaction.atomic():
+        ListingDailyStats.objects.filter(stale).delete()
+        ListingDailyStats.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def rebuild(ranges):
+    """Rebuild rollups for ``{listing_id: [(first_day, last_day), ...]}``; returns rows written"""
+    listing_ids = sorted(ranges)
+    written = 0
+    for offset in range(0, len(listing_ids), LISTING_CHUNK_SIZE):
+        chunk = {listing_id: ranges[listing_id] for listing_id in listing_ids[offset:offset + LISTING_CHUNK_SIZE]}
+        written += _rebuild_chunk(chunk)
+    return written
+
+
+def run_rollup(full=False):
+    """
+    Bring ``ListingDailyStats`` up to date.
+
+    Without a previous checkpoint the run is always full. Returns
+    ``(listings_recomputed, rows_written)``.
+    """
+    started = timezone.now()
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(name=CHECKPOINT_NAME)
+    if full or checkpoint.last_run_at is None:
+        today = timezone.localdate()
+        ranges = full_ranges(
+            today - timedelta(days=settings.ROLLUP_FULL_PAST_DAYS),
+            today + timedelta(days=settings.ROLLUP_FULL_FUTURE_DAYS),
+        )
+    else:
+        ranges = touched_ranges(checkpoint.last_run_at)
+    stale, stale_pks = stale_ranges()
+    for listing_id, listing_spans in stale.items():
+        for first, last in listing_spans:
+            _extend(ranges, listing_id, first, last)
+
+    written = rebuild(ranges)
+    # Ranges recorded while this run read the others stay for the next one.
+    for offset in range(0, len(stale_pks), LISTING_CHUNK_SIZE):
+        StaleStatsRange.objects.filter(pk__in=stale_pks[offset:offset + LISTING_CHUNK_SIZE]).delete()
+    checkpoint.last_run_at = started
+    checkpoint.save(update_fields=['last_run_at'])
+    return len(ranges), written
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ListingsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'listings'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from . import task_metrics  # noqa: F401
+        from . import profiling  # noqa: F401
+        from . import warming  # noqa: F401
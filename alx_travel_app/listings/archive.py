@@ -0,0 +1,127 @@
+"""
+Hot/cold split of bookings.
+
+Finished bookings (completed or cancelled) whose stay ended more than
+``BOOKING_ARCHIVE_AFTER_DAYS`` ago are moved, with their payment, from
+``Booking`` into ``ArchivedBooking`` in small batches. Everything that
+works on live bookings (the bookings API, availability checks, analytics
+and trending windows, the admin) then scans only the hot set, while
+``booking_history`` reads both tables for a user's full history.
+
+The cutoff never falls inside the analytics full-run or trending windows,
+so those jobs only read archived rows when an analytics run rebuilds stale
+days older than the cutoff.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Value, BooleanField
+from django.db.models.functions import NullIf
+from django.utils import timezone
+
+from .models import Booking, Payment, ArchivedBooking
+
+
+ARCHIVED_STATUSES = ('completed', 'cancelled')
+HISTORY_FIELDS = (
+    'id', 'listing', 'check_in_date', 'check_out_date', 'number_of_guests', 'total_price',
+    'status', 'special_requests', 'created_at', 'updated_at', 'payment_state', 'archived',
+)
+
+
+def archive_cutoff(today=None):
+    """Bookings that checked out before this date can be archived"""
+    days = max(
+        settings.BOOKING_ARCHIVE_AFTER_DAYS,
+        settings.ROLLUP_FULL_PAST_DAYS + 1,
+        settings.TRENDING_WINDOW_DAYS + 1,
+    )
+    return (today or timezone.localdate()) - timedelta(days=days)
+
+
+def _copy_sql():
+    """INSERT ... SELECT that copies bookings and their payments by id"""
+    quote = connection.ops.quote_name
+    # The version only guards writes to live bookings, so it is not kept.
+    columns = {
+        field.column: f'b.{quote(field.column)}'
+        for field in Booking._meta.concrete_fields if field.name != 'version'
+    }
+    columns.update({
+        'payment_id': 'p.id',
+        'payment_amount': 'p.amount',
+        'payment_transaction_id': "COALESCE(p.transaction_id, '')",
+        'payment_status': "COALESCE(p.status, '')",
+        'archived_at': '%s',
+    })
+    return (
+        f'INSERT INTO {quote(ArchivedBooking._meta.db_table)} ({", ".join(map(quote, columns))}) '
+        f'SELECT {", ".join(columns.values())} FROM {quote(Booking._meta.db_table)} b '
+        f'LEFT JOIN {quote(Payment._meta.db_table)} p ON p.booking_id = b.id '
+        f'WHERE b.id IN ({{ids}})'
+    )
+
+
+def archive_batch(status, cutoff, batch_size):
+    """
+    Move up to ``batch_size`` bookings in ``status`` that ended before ``cutoff``.
+    
+    Copy and delete happen in one transaction, and the rows are locked while
+    they are copied, so a concurrent run or status change cannot leave a
+    booking in both tables. Rows are copied inside the database rather
+    than loaded as models. Returns the number of bookings moved.
+    """
+    changed_before = timezone.make_aware(datetime.combine(cutoff, time.min))
+    with transaction.atomic():
+        # One status at a time, so the (status, check_out_date) index
+        # returns rows already in order.
+        ids = list(
+            Booking.objects.filter(
+                status=status, check_out_date__lt=cutoff, updated_at__lt=changed_before
+            ).order_by('check_out_date').select_for_update().values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+        placeholders = ', '.join(['%s'] * len(ids))
+        with connection.cursor() as cursor:
+            cursor.execute(_copy_sql().format(ids=placeholders), [timezone.now(), *ids])
+            # With the payments gone first, the bookings can go in one plain
+            # DELETE instead of being loaded for the cascade and its signals.
+            Payment.objects.filter(booking_id__in=ids).delete()
+            cursor.execute(
+                f'DELETE FROM {connection.ops.quote_name(Booking._meta.db_table)} WHERE id IN ({placeholders})',
+                ids,
+            )
+    return len(ids)
+
+
+def archive_old_bookings(batch_size=None, max_batches=None, cutoff=None):
+    """Archive finished bookings in batches; returns how many were moved"""
+    batch_size = batch_size or settings.BOOKING_ARCHIVE_BATCH_SIZE
+    max_batches = max_batches or settings.BOOKING_ARCHIVE_MAX_BATCHES
+    cutoff = cutoff or archive_cutoff()
+
+    moved = 0
+    batches = 0
+    for status in ARCHIVED_STATUSES:
+        while batches < max_batches:
+            count = archive_batch(status, cutoff, batch_size)
+            moved += count
+            batches += 1
+            if count < batch_size:
+                break
+    return moved
+
+
+def booking_history(user):
+    """Every booking of ``user``, live and archived, newest first, as one queryset"""
+    live = Booking.objects.filter(user=user).annotate(
+        payment_state=F('payment__status'),
+        archived=Value(False, output_field=BooleanField()),
+    ).values(*HISTORY_FIELDS)
+    archived = ArchivedBooking.objects.filter(user=user).annotate(
+        payment_state=NullIf(F('payment_status'), Value('')),
+        archived=Value(True, output_field=BooleanField()),
+    ).values(*HISTORY_FIELDS)
+    return live.order_by().union(archived.order_by(), all=True).order_by('-created_at', '-id')
@@ -0,0 +1,180 @@
+"""
+Async read-only listing endpoints for the ASGI deployment.
+
+The listing list, detail and reviews reads under ``/api/async/`` check the
+anonymous throttle buckets on the event loop, so a throttled client never
+costs a thread, and then answer through ``ListingViewSet`` itself in one
+trip to a pool thread. The trip is not thread-sensitive, so requests never
+queue for the one shared sync thread; each pool thread keeps its own
+database connection, closed by the same rules as a request's. Filters,
+search, ordering, pagination, sparse fields, ``?currency=`` and the
+response cache are the viewset's own, so the two sets of endpoints cannot
+drift apart; Django's async ORM would make a trip for every query anyway.
+They only accept GET and HEAD and always read as an anonymous client;
+writes keep going through the DRF viewset.
+
+``event_stream`` serves booking and payment status changes as server-sent
+events, so clients can wait on a payment without polling. An idle stream
+is one suspended coroutine and a small queue.
+"""
+import asyncio
+import json
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_safe
+from rest_framework import exceptions
+from rest_framework.settings import api_settings
+from . import events
+from .authentication import CachedTokenAuthentication
+from .throttling import anonymous_wait, get_store
+from .models import Booking
+from .views import ListingViewSet
+
+# Bookings whose current status a new event stream may ask for.
+MAX_SNAPSHOT_BOOKINGS = 50
+
+
+def json_response(data, status=200):
+    body = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return HttpResponse(body, status=status, content_type='application/json')
+
+
+async def throttled(request, search=False):
+    """A 429 response if the client's anon (and search) bucket is empty, else None"""
+    scopes = ['anon', 'search'] if search else ['anon']
+    if get_store().is_local:
+        wait = anonymous_wait(request, scopes)
+    else:
+        # The shared store is a network round trip; keep it off the loop.
+        wait = await sync_to_async(anonymous_wait, thread_sensitive=False)(request, scopes)
+    if wait is None:
+        return None
+    response = json_response({'detail': exceptions.Throttled(wait).detail}, status=429)
+    response['Retry-After'] = str(wait)
+    return response
+
+
+def _viewset_action(action):
+    # Throttling is done above; no authentication keeps every read anonymous and cacheable.
+    return ListingViewSet.as_view({'get': action}, authentication_classes=[], throttle_classes=[])
+
+
+_list_view = _viewset_action('list')
+_detail_view = _viewset_action('retrieve')
+_reviews_view = _viewset_action('reviews')
+
+
+def _replayable(view):
+    """Give an async view the attributes cache warming replays ``view`` by, as ``as_view`` would"""
+    def decorate(func):
+        func.cls, func.initkwargs, func.actions = view.cls, view.initkwargs, view.actions
+        return func
+    return decorate
+
+
+def _render(view, request, kwargs):
+    try:
+        response = view(request, **kwargs)
+        response.render()
+        return response
+    finally:
+        # Pool threads see no request_finished, so apply CONN_MAX_AGE here.
+        close_old_connections()
+
+
+async def _serve(request, view, search=False, **kwargs):
+    response = await throttled(request, search=search)
+    if response:
+        return response
+    return await sync_to_async(_render, thread_sensitive=False)(view, request, kwargs)
+
+
+@_replayable(_list_view)
+@require_safe
+async def listing_list(request):
+    """Paginated active listings, as ``GET /api/listings/`` serves them"""
+    search = bool(request.GET.get(api_settings.SEARCH_PARAM, '').strip())
+    return await _serve(request, _list_view, search=search)
+
+
+@_replayable(_detail_view)
+@require_safe
+async def listing_detail(request, pk):
+    """One active listing with its reviews, as ``GET /api/listings/<pk>/`` serves it"""
+    return await _serve(request, _detail_view, pk=pk)
+
+
+@_replayable(_reviews_view)
+@require_safe
+async def listing_reviews(request, pk):
+    """All reviews of one active listing, as ``GET /api/listings/<pk>/reviews/`` serves them"""
+    return await _serve(request, _reviews_view, pk=pk)
+
+
+async def _authenticated_user(request):
+    user = await request.auser()
+    if user.is_authenticated:
+        return user
+    try:
+        result = await sync_to_async(CachedTokenAuthentication().authenticate)(request)
+    except exceptions.AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+async def _snapshot(user, params):
+    """Current status of the requested bookings and their payments"""
+    ids = [value for value in params.get('bookings', '').split(',') if value.isdigit()]
+    rows = Booking.objects.filter(user=user, pk__in=ids[:MAX_SNAPSHOT_BOOKINGS]).values_list(
+        'pk', 'status', 'payment__pk', 'payment__status'
+    )
+    messages = []
+    async for booking_id, status, payment_id, payment_status in rows:
+        messages.append(events.booking_status_event(booking_id, status))
+        if payment_id is not None:
+            messages.append(events.payment_status_event(payment_id, booking_id, payment_status))
+    return messages
+
+
+async def _stream(user, params):
+    async with events.get_broker().subscribe(events.channel_for(user.pk)) as subscription:
+        # Subscribe first, so no change slips in between the snapshot and the stream.
+        yield f'retry: {settings.EVENTS_HEARTBEAT_SECONDS * 1000}\n\n'
+        for message in await _snapshot(user, params):
+            yield message
+        while True:
+            try:
+                message = await asyncio.wait_for(subscription.get(), settings.EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            if message is None:
+                return
+            yield message
+
+
+@require_safe
+async def event_stream(request):
+    """
+    Server-sent ``booking.status`` and ``payment.status`` events for the user.
+    
+    Pass ``?bookings=1,2`` to get the current status of those bookings
+    first. Needs the ASGI app; the stream stays open until the client
+    leaves.
+    """
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI the stream would hold a sync worker for as long as the client stays.
+        return json_response({'detail': 'Event streams are only served by the ASGI app.'}, status=501)
+    user = await _authenticated_user(request)
+    if user is None:
+        return json_response({'detail': 'Authentication credentials were not provided.'}, status=401)
+    response = StreamingHttpResponse(_stream(user, request.GET), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
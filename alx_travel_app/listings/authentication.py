@@ -0,0 +1,105 @@
+"""
+Token authentication without a database query on every request.
+
+``CachedTokenAuthentication`` keeps token -> user lookups in a bounded
+in-process LRU backed by the shared Django cache. The shared cache holds
+the user row without its password hash, so a process that misses locally
+builds the user from it without a query. Such a user has the password
+deferred: saving it writes the other fields and keeps the stored hash.
+Deleting a token, or saving or deleting its user, removes the entry from
+the shared cache and from this process straight away. Other processes
+may keep serving their local copy for up to ``AUTH_TOKEN_LOCAL_TTL``
+seconds, so keep that short.
+"""
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+
+_local_tokens = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def _cache_key(key):
+    # Never put the raw credential into cache keys.
+    return 'auth:token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def _user_fields(user_model):
+    """The user columns kept in the shared cache: all but the password hash"""
+    return [field.attname for field in user_model._meta.concrete_fields if field.name != 'password']
+
+
+def _remember(key, token):
+    with _local_lock:
+        _local_tokens[key] = (time.monotonic() + settings.AUTH_TOKEN_LOCAL_TTL, token)
+        _local_tokens.move_to_end(key)
+        while len(_local_tokens) > settings.AUTH_TOKEN_LOCAL_SIZE:
+            _local_tokens.popitem(last=False)
+
+
+def _recall(key):
+    with _local_lock:
+        entry = _local_tokens.get(key)
+        if entry is None:
+            return None
+        expires_at, token = entry
+        if expires_at < time.monotonic():
+            del _local_tokens[key]
+            return None
+        _local_tokens.move_to_end(key)
+        return token
+
+
+def invalidate_tokens(keys):
+    """Forget cached lookups for the given token keys"""
+    keys = list(keys)
+    if not keys:
+        return
+    with _local_lock:
+        for key in keys:
+            _local_tokens.pop(key, None)
+    cache.delete_many([_cache_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """``TokenAuthentication`` that caches the token and its user"""
+
+    def authenticate_credentials(self, key):
+        token = _recall(key)
+        if token is None:
+            token = self.load_token(key)
+            _remember(key, token)
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        # Hand out copies so one request cannot change another's request.user.
+        token = copy.copy(token)
+        token.user = copy.copy(token.user)
+        return (token.user, token)
+
+    def load_token(self, key):
+        """The token for ``key`` with its user, going through the shared cache"""
+        model = self.get_model()
+        user_model = model._meta.get_field('user').related_model
+        cached = cache.get(_cache_key(key))
+        if cached is None:
+            try:
+                token = model.objects.select_related('user').get(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            row = {name: getattr(token.user, name) for name in _user_fields(user_model)}
+            cache.set(_cache_key(key), (token.user._state.db, row), settings.AUTH_TOKEN_CACHE_TIMEOUT)
+            return token
+
+        db, row = cached
+        return model(key=key, user=user_model.from_db(db, list(row), list(row.values())))
@@ -0,0 +1,461 @@
+"""
+Bulk data helpers for listings, bookings and reviews.
+
+Exports stream rows in primary-key order using keyset pagination so memory
+stays constant no matter how large the table is. Imports and the bulk write
+APIs validate rows in batches, resolve foreign keys and conflicts with a
+fixed number of set-based queries and insert the valid rows with
+``bulk_create``.
+"""
+import bisect
+import csv
+import json
+import time
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+
+from . import pricing, reviews, trending
+from .models import Listing, Review, Booking
+from .serializers import BookingBulkItemSerializer, ReviewBulkItemSerializer
+
+
+EXPORT_CHUNK_SIZE = 2000
+IMPORT_BATCH_SIZE = 1000
+BULK_WRITE_MAX_ITEMS = 1000
+
+# Bookings in these states hold the listing for their dates.
+BLOCKING_BOOKING_STATUSES = ('pending', 'confirmed')
+
+DATASETS = {
+    'listings': {
+        'model': Listing,
+        'fields': [
+            'id', 'title', 'description', 'listing_type', 'price', 'location',
+            'created_by_id', 'created_at', 'updated_at', 'is_active',
+        ],
+        'foreign_keys': {'created_by_id': User},
+    },
+    'bookings': {
+        'model': Booking,
+        'fields': [
+            'id', 'listing_id', 'user_id', 'check_in_date', 'check_out_date',
+            'number_of_guests', 'total_price', 'status', 'special_requests',
+            'created_at', 'updated_at',
+        ],
+        'foreign_keys': {'listing_id': Listing, 'user_id': User},
+    },
+}
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Timestamps are set by the models on insert, so they are never imported.
+NON_IMPORTABLE_FIELDS = {'created_at', 'updated_at'}
+
+
+class Echo:
+    """File-like object whose write() hands the value straight back."""
+
+    def write(self, value):
+        return value
+
+
+def iter_rows(dataset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield chunks of value tuples for a dataset in primary-key order.
+
+    Each chunk is a separate ``pk > last_pk`` query, so the database driver
+    never buffers more than ``chunk_size`` rows (MySQL client-side cursors
+    would otherwise load the whole result set for ``.iterator()``).
+    """
+    spec = DATASETS[dataset]
+    queryset = spec['model'].objects.order_by('pk').values_list(*spec['fields'])
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1][0]
+
+
+def iter_csv(dataset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield a CSV export one chunk of rows at a time."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(DATASETS[dataset]['fields'])
+    for chunk in iter_rows(dataset, chunk_size):
+        yield ''.join(writer.writerow(row) for row in chunk)
+
+
+def iter_ndjson(dataset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield a newline-delimited JSON export one chunk of rows at a time."""
+    fields = DATASETS[dataset]['fields']
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for chunk in iter_rows(dataset, chunk_size):
+        yield ''.join(encoder.encode(dict(zip(fields, row))) + '\n' for row in chunk)
+
+
+EXPORTERS = {
+    'csv': iter_csv,
+    'ndjson': iter_ndjson,
+}
+
+
+def read_rows(fileobj, fmt):
+    """Yield row dicts from an open CSV or NDJSON text file."""
+    if fmt == 'csv':
+        yield from csv.DictReader(fileobj)
+    else:
+        for line in fileobj:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+class ImportResult:
+    """Outcome of a bulk import run."""
+
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+        self.elapsed = 0.0
+
+    @property
+    def processed(self):
+        return self.created + len(self.errors)
+
+    @property
+    def rows_per_second(self):
+        if not self.elapsed:
+            return 0.0
+        return self.processed / self.elapsed
+
+
+def _build_instance(spec, row, keep_ids):
+    """Build and validate an unsaved model instance from one raw row."""
+    model = spec['model']
+    foreign_keys = spec['foreign_keys']
+    values = {}
+    for field in spec['fields']:
+        if field in NON_IMPORTABLE_FIELDS or field not in row:
+            continue
+        if field == 'id' and not keep_ids:
+            continue
+        value = row[field]
+        if field in foreign_keys:
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise ValidationError({field: ['Must be an integer id.']})
+        values[field] = value
+
+    instance = model(**values)
+    # Foreign keys are checked per batch, so skip their per-row lookups here.
+    exclude = [model._meta.get_field(name[:-3]).name for name in foreign_keys]
+    instance.clean_fields(exclude=exclude)
+    if model is Booking:
+        # The check constraints, in Python; a row breaking one would fail the whole batch's INSERT.
+        if instance.check_out_date <= instance.check_in_date:
+            raise ValidationError('Check-out date must be after check-in date.')
+        if instance.number_of_guests < 1:
+            raise ValidationError({'number_of_guests': ['Must be at least 1.']})
+        if instance.total_price < 0:
+            raise ValidationError({'total_price': ['Cannot be negative.']})
+    return instance
+
+
+def _import_batch(spec, batch, keep_ids, result):
+    """Validate one batch of (line, row) pairs and insert the valid rows."""
+    candidates = []
+    for line, row in batch:
+        try:
+            candidates.append((line, _build_instance(spec, row, keep_ids)))
+        except ValidationError as exc:
+            result.errors.append((line, _error_messages(exc)))
+
+    # One existence query per foreign key for the whole batch.
+    existing = {}
+    for field, related_model in spec['foreign_keys'].items():
+        ids = {getattr(instance, field) for _, instance in candidates}
+        existing[field] = set(
+            related_model.objects.filter(pk__in=ids).values_list('pk', flat=True)
+        )
+
+    model = spec['model']
+    # Kept ids that are already taken, in one query for the whole batch.
+    ids = {instance.pk for _, instance in candidates if instance.pk is not None}
+    taken_ids = set(model.objects.filter(pk__in=ids).values_list('pk', flat=True)) if ids else set()
+
+    valid = []
+    seen_ids = set()
+    for line, instance in candidates:
+        missing = [
+            field for field in spec['foreign_keys']
+            if getattr(instance, field) not in existing[field]
+        ]
+        if missing:
+            result.errors.append((line, {field: ['Does not exist.'] for field in missing}))
+        elif instance.pk in taken_ids:
+            result.errors.append((line, {'id': ['Already exists.']}))
+        elif instance.pk is not None and instance.pk in seen_ids:
+            result.errors.append((line, {'id': ['Repeats the id of an earlier row.']}))
+        else:
+            seen_ids.add(instance.pk)
+            valid.append((line, instance))
+
+    try:
+        with transaction.atomic():
+            model.objects.bulk_create([instance for _, instance in valid], batch_size=IMPORT_BATCH_SIZE)
+        result.created += len(valid)
+    except IntegrityError:
+        # A concurrent writer took an id since the rows were checked; find the rows it hit.
+        for line, instance in valid:
+            try:
+                with transaction.atomic():
+                    model.objects.bulk_create([instance])
+            except IntegrityError as exc:
+                result.errors.append((line, {'__all__': [str(exc)]}))
+            else:
+                result.created += 1
+
+
+def _error_messages(exc):
+    if hasattr(exc, 'error_dict'):
+        return exc.message_dict
+    return {'__all__': exc.messages}
+
+
+def import_rows(dataset, rows, batch_size=IMPORT_BATCH_SIZE, keep_ids=False, progress=None):
+    """
+    Validate and insert rows for a dataset in batches.
+
+    ``rows`` is any iterable of dicts keyed by export field names. Invalid
+    rows are skipped and reported in ``ImportResult.errors`` together with
+    their 1-based row number. ``progress`` is called with the running result
+    after every batch.
+    """
+    spec = DATASETS[dataset]
+    result = ImportResult()
+    started = time.perf_counter()
+    batch = []
+    for line, row in enumerate(rows, start=1):
+        batch.append((line, row))
+        if len(batch) >= batch_size:
+            _import_batch(spec, batch, keep_ids, result)
+            batch = []
+            result.elapsed = time.perf_counter() - started
+            if progress:
+                progress(result)
+    if batch:
+        _import_batch(spec, batch, keep_ids, result)
+    result.elapsed = time.perf_counter() - started
+    if progress:
+        progress(result)
+    return result
+
+
+def _validate_items(serializer_class, items):
+    """
+    Run field-level validation on every item of a bulk request.
+
+    Returns ``(results, valid)`` where ``results`` has one dict per item
+    (errors already filled in) and ``valid`` is a list of
+    ``(index, validated_data)`` pairs still to be checked against the DB.
+    """
+    results = []
+    valid = []
+    for index, item in enumerate(items):
+        serializer = serializer_class(data=item)
+        if serializer.is_valid():
+            results.append({'index': index, 'status': 'created'})
+            valid.append((index, serializer.validated_data))
+        else:
+            results.append({'index': index, 'status': 'error', 'errors': serializer.errors})
+    return results, valid
+
+
+def _reject(results, index, errors):
+    results[index]['status'] = 'error'
+    results[index]['errors'] = errors
+
+
+def _lock_active_listings(listing_ids, fields=('id',)):
+    """
+    Lock the listed rows for the rest of the transaction and return
+    ``{pk: listing}`` for those that exist and are active.
+
+    Locking the parent listing serializes concurrent bulk writers that
+    target the same listing, so the conflict checks below cannot race.
+    """
+    listings = (
+        Listing.objects.select_for_update()
+        .filter(pk__in=listing_ids, is_active=True)
+        .only(*fields)
+    )
+    return {listing.pk: listing for listing in listings}
+
+
+class _Occupancy:
+    """
+    Sorted, disjoint date ranges held on one listing.
+
+    Overlapping ranges are merged on the way in, so an availability check is
+    a single bisect instead of a scan over every booking.
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+
+    def is_free(self, check_in, check_out):
+        index = bisect.bisect_left(self.starts, check_out)
+        return index == 0 or self.ends[index - 1] <= check_in
+
+    def add(self, check_in, check_out):
+        left = bisect.bisect_left(self.ends, check_in)
+        right = bisect.bisect_right(self.starts, check_out)
+        if left < right:
+            check_in = min(check_in, self.starts[left])
+            check_out = max(check_out, self.ends[right - 1])
+        self.starts[left:right] = [check_in]
+        self.ends[left:right] = [check_out]
+
+
+def _fill_pks(objects, key_fields, **filters):
+    """
+    Set the primary keys ``bulk_create`` could not return (MySQL) by
+    reading the rows back; ``key_fields`` must be unique among the rows
+    ``filters`` matches.
+    """
+    if not objects or objects[0].pk is not None:
+        return
+    model = type(objects[0])
+    pks = {tuple(key): pk for pk, *key in model.objects.filter(**filters).values_list('pk', *key_fields)}
+    for obj in objects:
+        obj.pk = pks.get(tuple(getattr(obj, field) for field in key_fields))
+
+
+def bulk_create_bookings(user, items):
+    """
+    Validate and insert a batch of bookings for ``user``.
+
+    Regardless of batch size this runs one locking query for the listings,
+    one query for overlapping bookings already in the database and one
+    multi-row INSERT (plus one rate-rule query when price calendars are not
+    cached, and one query reading back the new ids where the database
+    cannot return them from the INSERT). Items that overlap an existing booking or an earlier item of
+    the same batch are rejected, as are totals that disagree with the
+    pricing engine. Returns one result per item.
+    """
+    results, valid = _validate_items(BookingBulkItemSerializer, items)
+    if not valid:
+        return results
+
+    listing_ids = {data['listing'] for _, data in valid}
+    with transaction.atomic():
+        active = _lock_active_listings(listing_ids, pricing.LISTING_FIELDS)
+        calendars = pricing.get_calendars(active.values())
+
+        taken = defaultdict(_Occupancy)
+        earliest = min(data['check_in_date'] for _, data in valid)
+        latest = max(data['check_out_date'] for _, data in valid)
+        existing = Booking.objects.filter(
+            listing_id__in=active,
+            status__in=BLOCKING_BOOKING_STATUSES,
+            check_in_date__lt=latest,
+            check_out_date__gt=earliest,
+        ).values_list('listing_id', 'check_in_date', 'check_out_date')
+        for listing_id, check_in, check_out in existing:
+            taken[listing_id].add(check_in, check_out)
+
+        accepted = []
+        for index, data in valid:
+            listing_id = data['listing']
+            check_in = data['check_in_date']
+            check_out = data['check_out_date']
+            if listing_id not in active:
+                _reject(results, index, {'listing': ['Listing does not exist or is not active.']})
+                continue
+            if not taken[listing_id].is_free(check_in, check_out):
+                _reject(results, index, {'non_field_errors': ['Listing is not available for these dates.']})
+                continue
+            total = calendars[listing_id].quote(check_in, check_out, data.get('number_of_guests', 1)).total
+            if data.get('total_price', total) != total:
+                _reject(results, index, {'total_price': [f'Total price for this stay is {total}.']})
+                continue
+            taken[listing_id].add(check_in, check_out)
+            fields = dict(data, total_price=total)
+            fields['listing_id'] = fields.pop('listing')
+            accepted.append((index, Booking(user=user, **fields)))
+
+        created = Booking.objects.bulk_create([booking for _, booking in accepted])
+        # Within one request a user's new bookings never share a listing and dates.
+        _fill_pks(
+            created, ('listing_id', 'check_in_date', 'check_out_date'),
+            user=user, listing_id__in=active,
+            created_at__gte=min((booking.created_at for booking in created), default=None),
+        )
+        # bulk_create skips post_save, so feed the trending scores directly.
+        events = trending.booking_events(created)
+        transaction.on_commit(lambda: trending.record_events(events))
+
+    for (index, _), booking in zip(accepted, created):
+        results[index]['id'] = booking.pk
+    return results
+
+
+def bulk_create_reviews(user, items):
+    """
+    Validate and insert a batch of reviews written by ``user``.
+
+    Regardless of batch size this runs one locking query for the listings,
+    one query for reviews ``user`` already wrote on them and one multi-row
+    INSERT, plus one query for the new ids where the INSERT cannot return
+    them. A second review of the same listing, in the database or earlier
+    in the batch, is rejected as the ``unique_together`` constraint would.
+    """
+    results, valid = _validate_items(ReviewBulkItemSerializer, items)
+    if not valid:
+        return results
+
+    listing_ids = {data['listing'] for _, data in valid}
+    with transaction.atomic():
+        active = _lock_active_listings(listing_ids)
+        reviewed = set(
+            Review.objects.filter(reviewer=user, listing_id__in=active)
+            .values_list('listing_id', flat=True)
+        )
+
+        accepted = []
+        for index, data in valid:
+            listing_id = data['listing']
+            if listing_id not in active:
+                _reject(results, index, {'listing': ['Listing does not exist or is not active.']})
+                continue
+            if listing_id in reviewed:
+                _reject(results, index, {'listing': ['You have already reviewed this listing.']})
+                continue
+            reviewed.add(listing_id)
+            accepted.append((index, Review(
+                listing_id=listing_id,
+                reviewer=user,
+                rating=data['rating'],
+                comment=data.get('comment', ''),
+            )))
+
+        created = Review.objects.bulk_create([review for _, review in accepted])
+        _fill_pks(created, ('listing_id',), reviewer=user, listing_id__in=active)
+        events = trending.review_events(created)
+        transaction.on_commit(lambda: trending.record_events(events))
+        if created:
+            transaction.on_commit(reviews.schedule)
+
+    for (index, _), review in zip(accepted, created):
+        results[index]['id'] = review.pk
+    return results
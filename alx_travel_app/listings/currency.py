@@ -0,0 +1,177 @@
+"""
+Exchange rates and prices shown in the visitor's currency.
+
+``ExchangeRate`` holds units of each currency per one ``FX_BASE_CURRENCY``
+and is refreshed by the ``refresh_exchange_rates`` task, which then bumps
+a version stamp in the shared cache. Each process keeps the whole table
+in memory and checks the stamp at most every ``FX_VERSION_CHECK_SECONDS``
+seconds, reloading only when it changed, so converting costs no query.
+
+``?currency=EUR`` on the listing and booking reads adds ``display_*``
+amounts and ``display_currency`` next to the stored ones. The factor
+from every currency to the requested one is worked out once per rates
+version, so a page costs one multiply and round per amount.
+"""
+import threading
+import time
+from decimal import Decimal, ROUND_HALF_EVEN
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+from .models import ExchangeRate
+
+CURRENCY_PARAM = 'currency'
+VERSION_KEY = 'fx:rates-version'
+CENT = Decimal('0.01')
+
+
+class Rates:
+    """One version of the rates table"""
+
+    def __init__(self, version, rates):
+        self.version = version
+        self.rates = rates
+        self._factors = {}
+
+    def factors(self, target):
+        """``{currency: factor}`` that turns amounts in each currency into ``target``"""
+        factors = self._factors.get(target)
+        if factors is None:
+            target_rate = self.rates[target]
+            factors = {code: target_rate / rate for code, rate in self.rates.items() if rate}
+            self._factors[target] = factors
+        return factors
+
+
+_rates = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def _load(version):
+    rates = dict(ExchangeRate.objects.values_list('currency', 'rate'))
+    rates.setdefault(settings.FX_BASE_CURRENCY, Decimal(1))
+    return Rates(version, rates)
+
+
+def _stored_version():
+    last = ExchangeRate.objects.aggregate(last=Max('updated_at'))['last']
+    return last.isoformat() if last else ''
+
+
+def current_rates():
+    """This process's copy of the rates, reloaded when the shared version moves"""
+    global _rates, _checked_at
+    now = time.monotonic()
+    if _rates is not None and now - _checked_at < settings.FX_VERSION_CHECK_SECONDS:
+        return _rates
+    with _lock:
+        if _rates is not None and now - _checked_at < settings.FX_VERSION_CHECK_SECONDS:
+            return _rates
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            # The stamp was evicted; the table itself knows when it changed.
+            version = _stored_version()
+            cache.add(VERSION_KEY, version, None)
+        if _rates is None or _rates.version != version:
+            _rates = _load(version)
+        _checked_at = now
+        return _rates
+
+
+def refresh_rates():
+    """Fetch the latest rates from ``FX_RATES_URL`` and store them; returns how many"""
+    import requests
+
+    base = settings.FX_BASE_CURRENCY
+    response = requests.get(settings.FX_RATES_URL.format(base=base), timeout=settings.FX_RATES_TIMEOUT)
+    response.raise_for_status()
+    # Parse numbers straight to Decimal so no float rounding creeps in.
+    rates = response.json(parse_float=Decimal)['rates']
+
+    now = timezone.now()
+    rows = [
+        ExchangeRate(currency=code.upper(), rate=Decimal(str(rate)), updated_at=now)
+        for code, rate in rates.items()
+        if len(code) == 3 and Decimal(str(rate)) > 0
+    ]
+    store_rates(rows)
+    cache.set(VERSION_KEY, now.isoformat(), None)
+    return len(rows)
+
+
+def store_rates(rows):
+    """Insert ``rows``, updating the rate of currencies already stored"""
+    # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target.
+    target = {'unique_fields': ['currency']} if connection.features.supports_update_conflicts_with_target else {}
+    ExchangeRate.objects.bulk_create(rows, update_conflicts=True, update_fields=['rate', 'updated_at'], **target)
+
+
+class Converter:
+    """Converts amounts into one currency with the factors of one rates version"""
+
+    def __init__(self, rates, target):
+        self.target = target
+        self.factors = rates.factors(target)
+
+    def convert(self, amount, currency):
+        """``amount`` in ``currency`` as ``target``, to the cent; None when no rate is known"""
+        factor = self.factors.get(currency)
+        if amount is None or factor is None:
+            return None
+        return (Decimal(amount) * factor).quantize(CENT, rounding=ROUND_HALF_EVEN)
+
+
+def requested_converter(request):
+    """A ``Converter`` for the request's ``?currency=``, or None without one"""
+    code = request.query_params.get(CURRENCY_PARAM)
+    if not code:
+        return None
+    code = code.strip().upper()
+    rates = current_rates()
+    if code not in rates.rates:
+        raise serializers.ValidationError({CURRENCY_PARAM: f'No exchange rate for {code}.'})
+    return Converter(rates, code)
+
+
+class DisplayCurrencyMixin:
+    """
+    Serializer mixin adding ``display_<field>`` for each field in
+    ``display_amounts`` and ``display_currency`` when the context carries
+    a ``converter``.
+    """
+    display_amounts = ()
+
+    def source_currency(self, instance):
+        return instance.currency
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        converter = self.context.get('converter')
+        amounts = [name for name in self.display_amounts if name in data]
+        if converter is None or not amounts:
+            return data
+        currency = self.source_currency(instance)
+        for name in amounts:
+            converted = converter.convert(data[name], currency)
+            data[f'display_{name}'] = None if converted is None else str(converted)
+        data['display_currency'] = converter.target
+        return data
+
+
+class DisplayCurrencyViewMixin:
+    """Viewset mixin that passes a ``?currency=`` converter to the serializers of reads"""
+    display_currency_actions = ('list', 'retrieve')
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        request = context.get('request')
+        if request is not None and request.method in SAFE_METHODS and self.action in self.display_currency_actions:
+            context['converter'] = requested_converter(request)
+        return context
@@ -0,0 +1,192 @@
+"""
+Booking and payment status events pushed to their owners.
+
+Status changes are published on a per-user channel once the transaction
+commits. Each process keeps one local registry of open streams and fans
+every message out to the streams subscribed to its channel; the broker
+only decides how messages reach that registry:
+
+* ``memory://`` delivers within the publishing process. It needs no
+  server and is what tests and single-process setups use.
+* ``redis://...`` publishes through Redis pub/sub. Each process holds a
+  single pattern subscription for every user channel, however many
+  streams it serves, so Celery workers and WSGI processes can publish to
+  clients connected to the ASGI app.
+
+Messages are encoded as server-sent events once, when published.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = 'events:user:'
+
+
+def channel_for(user_id):
+    return f'{CHANNEL_PREFIX}{user_id}'
+
+
+def encode_event(event, data):
+    """Format one server-sent event"""
+    return f'event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder, separators=(",", ":"))}\n\n'
+
+
+def booking_status_event(booking_id, status):
+    return encode_event('booking.status', {'id': booking_id, 'status': status})
+
+
+def payment_status_event(payment_id, booking_id, status):
+    return encode_event('payment.status', {'id': payment_id, 'booking': booking_id, 'status': status})
+
+
+class Subscription:
+    """
+    One open stream's queue of messages, bound to the loop that reads it.
+
+    A stream that falls ``EVENTS_QUEUE_SIZE`` messages behind is ended
+    rather than buffered further; ``get`` then returns None and the
+    client reconnects and fetches the current state again.
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+
+    def deliver(self, message):
+        """Hand a message to the stream from any thread"""
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # The stream's loop has already closed.
+            pass
+
+    def _put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class InMemoryBroker:
+    """Fans messages out to the streams open in this process"""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        self.dispatch(channel, message)
+
+    def dispatch(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(message)
+
+    def disconnect_all(self):
+        """End every open stream so its client reconnects"""
+        with self._lock:
+            subscribers = [subscription for group in self._subscribers.values() for subscription in group]
+        for subscription in subscribers:
+            subscription.deliver(None)
+
+    def listening(self):
+        """Hook for brokers that must start receiving before the first stream"""
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        subscription = Subscription(channel)
+        self.listening()
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                subscribers = self._subscribers[channel]
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+
+class RedisBroker(InMemoryBroker):
+    """Publishes through Redis; one pattern subscription per process and loop"""
+
+    def __init__(self, url):
+        import redis
+
+        super().__init__()
+        self.url = url
+        self._client = redis.Redis.from_url(url)
+        self._listeners = {}
+
+    def publish(self, channel, message):
+        self._client.publish(channel, message)
+
+    def listening(self):
+        loop = asyncio.get_running_loop()
+        listener = self._listeners.get(loop)
+        if listener is None or listener.done():
+            self._listeners[loop] = loop.create_task(self._listen())
+
+    async def _listen(self):
+        import redis.asyncio
+
+        while True:
+            client = redis.asyncio.Redis.from_url(self.url)
+            try:
+                async with client.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.psubscribe(f'{CHANNEL_PREFIX}*')
+                    async for message in pubsub.listen():
+                        self.dispatch(message['channel'].decode(), message['data'].decode())
+            except (redis.RedisError, OSError):
+                logger.warning('Lost the event subscription; reconnecting', exc_info=True)
+                # Messages sent while disconnected are gone, so make every
+                # client reconnect and read the current state again.
+                self.disconnect_all()
+                await asyncio.sleep(1)
+            finally:
+                await client.aclose()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Return this process's broker for ``EVENTS_BROKER_URL``"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                url = settings.EVENTS_BROKER_URL
+                _broker = InMemoryBroker() if url.startswith('memory://') else RedisBroker(url)
+    return _broker
+
+
+def publish(user_id, message):
+    """Send an encoded event to every stream the user has open"""
+    try:
+        get_broker().publish(channel_for(user_id), message)
+    except Exception:
+        # Events only spare clients a poll; never fail the change over one.
+        logger.exception('Could not publish an event to user %s', user_id)
+
+
+def publish_on_commit(user_id, message):
+    transaction.on_commit(lambda: publish(user_id, message))
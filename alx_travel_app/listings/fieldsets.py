@@ -0,0 +1,96 @@
+"""
+Sparse fieldsets: ``?fields=`` and ``?omit=`` on read endpoints.
+
+``SparseFieldsMixin`` trims a serializer's output to the requested
+top-level fields. ``SparseQueryMixin`` pushes the same selection down to
+the queryset: only the columns behind the kept fields are loaded, and the
+joins and prefetches for relations nobody asked for are skipped.
+"""
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+
+def _names(request, param):
+    value = request.query_params.get(param)
+    if value is None:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def selected_fields(request, available):
+    """
+    Names from ``available`` that the request's ``fields`` and ``omit`` keep.
+
+    Raises ``ValidationError`` for names the serializer does not have.
+    """
+    fields = _names(request, FIELDS_PARAM)
+    omit = _names(request, OMIT_PARAM) or set()
+    unknown = ((fields or set()) | omit) - set(available)
+    if unknown:
+        raise serializers.ValidationError(
+            {FIELDS_PARAM: f'Unknown field(s): {", ".join(sorted(unknown))}'}
+        )
+    return [name for name in available if (fields is None or name in fields) and name not in omit]
+
+
+class SparseFieldsMixin:
+    """Serializer mixin that drops the fields a read request did not ask for"""
+
+    def _is_top_level(self):
+        parent = self.parent
+        return parent is None or (isinstance(parent, serializers.ListSerializer) and parent.parent is None)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        # Writes validate every field, and nested serializers keep theirs.
+        if request is None or request.method not in SAFE_METHODS or not self._is_top_level():
+            return fields
+        return {name: fields[name] for name in selected_fields(request, fields)}
+
+
+class SparseQueryMixin:
+    """
+    Viewset mixin that loads only what the selected fields need.
+
+    Plain model fields are found from each serializer field's ``source``.
+    Relations and computed fields are declared per serializer field name:
+    ``sparse_select_related`` and ``sparse_prefetch_related`` list the
+    lookups they need, ``sparse_columns`` the extra columns they read.
+    When several selected fields prefetch the same relation, the first
+    one's lookup is used, so declare the fullest one on the earliest field.
+    """
+    sparse_actions = ('list', 'retrieve')
+    sparse_select_related = {}
+    sparse_prefetch_related = {}
+    sparse_columns = {}
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action in self.sparse_actions and self.request.method in SAFE_METHODS:
+            queryset = self.prune_queryset(queryset)
+        return queryset
+
+    def prune_queryset(self, queryset):
+        """Restrict ``queryset`` to the columns and relations of the selected fields"""
+        fields = self.get_serializer_class()(context=self.get_serializer_context()).fields
+        model_fields = {field.name for field in queryset.model._meta.concrete_fields}
+
+        only = {queryset.model._meta.pk.name}
+        select_related = set()
+        prefetch_related = {}
+        for name, field in fields.items():
+            if field.source in model_fields:
+                only.add(field.source)
+            only.update(self.sparse_columns.get(name, ()))
+            for lookup in self.sparse_select_related.get(name, ()):
+                select_related.add(lookup)
+                only.add(lookup.split('__')[0])
+            for lookup in self.sparse_prefetch_related.get(name, ()):
+                prefetch_related.setdefault(getattr(lookup, 'prefetch_to', lookup), lookup)
+        queryset = queryset.only(*only).prefetch_related(*prefetch_related.values())
+        # select_related() without arguments would follow every foreign key.
+        return queryset.select_related(*select_related) if select_related else queryset
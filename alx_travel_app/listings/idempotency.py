@@ -0,0 +1,175 @@
+"""
+Idempotency-Key support for POST endpoints.
+
+A client that retries a write sends the same ``Idempotency-Key`` header on
+every attempt. The first attempt runs the view and its response is stored in
+the cache for ``IDEMPOTENCY_KEY_TTL`` seconds, with the status, the headers
+the view set (``Location`` for example) and its content type; later
+attempts are answered from the cache without running the view again.
+Headers added on the way out, such as ``RateLimit-*``, are added afresh to
+a replay. While the first attempt is still running, duplicates wait for
+its result instead of racing it.
+
+The lock is released only by the request holding it. With Django's Redis
+cache backend this is one compare-and-delete script; other backends check
+and delete in two steps, so a lock that expires in between and is taken
+by a duplicate can still be deleted, letting a third request run the
+view. ``IDEMPOTENCY_LOCK_TIMEOUT`` is meant to be well above any view's
+run time, which keeps that window closed in practice.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+import zlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework import status
+from rest_framework.response import Response
+
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.05
+REDIS_CACHE_BACKEND = 'django.core.cache.backends.redis.RedisCache'
+
+# Deletes the lock only while it still holds this request's token.
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_release_script = None
+_release_script_lock = threading.Lock()
+
+
+def _cache_key(request, key):
+    user = request.user.pk if request.user.is_authenticated else 'anon'
+    scope = f'{user}:{request.method}:{request.path}:{key}'
+    return 'idempotency:' + hashlib.sha256(scope.encode()).hexdigest()
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def _pack(fingerprint, response):
+    """Return a compact cache record of a response"""
+    payload = json.dumps(response.data, cls=DjangoJSONEncoder, separators=(',', ':'))
+    # Rendering sets Content-Type again from the content type and the renderer.
+    headers = [(name, value) for name, value in response.items() if name.lower() != 'content-type']
+    return (fingerprint, response.status_code, zlib.compress(payload.encode()), headers, response.content_type)
+
+
+def _replay(record, fingerprint):
+    stored_fingerprint, status_code, payload, headers, content_type = record
+    if stored_fingerprint != fingerprint:
+        return Response(
+            {'error': 'Idempotency-Key was already used with a different request body'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    response = Response(json.loads(zlib.decompress(payload)), status=status_code, content_type=content_type)
+    for name, value in headers:
+        response[name] = value
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _get_release_script():
+    """The compare-and-delete script on the default cache's Redis server, or None for other backends"""
+    global _release_script
+    config = settings.CACHES['default']
+    if config['BACKEND'] != REDIS_CACHE_BACKEND:
+        return None
+    if _release_script is None:
+        with _release_script_lock:
+            if _release_script is None:
+                import redis
+
+                location = config['LOCATION']
+                # Like the backend, write to the first server listed.
+                url = re.split('[;,]', location)[0] if isinstance(location, str) else location[0]
+                _release_script = redis.Redis.from_url(url).register_script(RELEASE_SCRIPT)
+    return _release_script
+
+
+def _release(lock_key, token):
+    """Delete the lock unless it expired and another request holds it now"""
+    script = _get_release_script()
+    if script is None:
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+    else:
+        # The token is an int, which the backend stores as is rather than pickled.
+        script(keys=[cache.make_and_validate_key(lock_key)], args=[token])
+
+
+def _wait_for(cache_key, lock_key):
+    """Poll until the in-flight request stores its response or gives up"""
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        record = cache.get(cache_key)
+        if record is not None:
+            return record
+        if cache.get(lock_key) is None:
+            # The first request finished without storing a response (it
+            # failed with a 5xx); let this retry run the view itself.
+            return None
+    return None
+
+
+def idempotent(view_method):
+    """
+    Make a DRF view method honour the ``Idempotency-Key`` request header.
+
+    Requests without the header run normally. Responses with a 5xx status
+    are not stored, so a retry after a server error runs the view again.
+    """
+    @wraps(view_method)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.META.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view_method(view, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        cache_key = _cache_key(request, key)
+        lock_key = cache_key + ':lock'
+        fingerprint = _fingerprint(request)
+        token = uuid.uuid4().int
+
+        record = cache.get(cache_key)
+        if record is not None:
+            return _replay(record, fingerprint)
+
+        while not cache.add(lock_key, token, settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            record = _wait_for(cache_key, lock_key)
+            if record is not None:
+                return _replay(record, fingerprint)
+            if cache.get(lock_key) is not None:
+                return Response(
+                    {'error': 'A request with this Idempotency-Key is still in progress'},
+                    status=status.HTTP_409_CONFLICT
+                )
+
+        try:
+            response = view_method(view, request, *args, **kwargs)
+            if response.status_code < 500 and hasattr(response, 'data'):
+                cache.set(cache_key, _pack(fingerprint, response), settings.IDEMPOTENCY_KEY_TTL)
+        finally:
+            _release(lock_key, token)
+        return response
+
+    return wrapper
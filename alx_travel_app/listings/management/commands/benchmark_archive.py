@@ -0,0 +1,192 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from listings import bulk
+from listings.archive import archive_cutoff, archive_old_bookings, booking_history
+from listings.models import Listing, Booking, Payment, ArchivedBooking
+
+
+class Rollback(Exception):
+    """Raised to undo the seeded bookings."""
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed historical bookings, then time the live booking queries before and after '
+        'archiving and the unified history read'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--bookings',
+            type=int,
+            default=200000,
+            help='Historical bookings to seed (default: 200000)'
+        )
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=2000,
+            help='Guests the bookings are spread over (default: 2000)'
+        )
+        parser.add_argument(
+            '--years',
+            type=int,
+            default=5,
+            help='How far back the seeded stays go (default: 5)'
+        )
+        parser.add_argument(
+            '--samples',
+            type=int,
+            default=200,
+            help='Randomly chosen guests and listings timed per query (default: 200)'
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Commit the seeded and archived rows instead of rolling them back'
+        )
+
+    def handle(self, *args, **options):
+        listing_ids = list(Listing.objects.filter(is_active=True).values_list('pk', flat=True)[:10000])
+        if not listing_ids:
+            raise CommandError('No active listings to book; run the seed command first.')
+
+        try:
+            with transaction.atomic():
+                users = self.seed(listing_ids, options)
+                self.report('before archiving', users, listing_ids, options['samples'])
+
+                began = time.perf_counter()
+                moved = archive_old_bookings(max_batches=10 ** 9)
+                elapsed = time.perf_counter() - began
+                self.stdout.write(self.style.SUCCESS(
+                    f'Archived {moved} bookings in {elapsed:.1f}s ({moved / max(elapsed, 1e-9):.0f} rows/s)'
+                ))
+
+                self.report('after archiving', users, listing_ids, options['samples'])
+                self.time_query('history page (live + archived)', users, options['samples'], self.history_page)
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            self.stdout.write('Seeded rows rolled back.')
+
+    def seed(self, listing_ids, options):
+        """Insert the benchmark guests, bookings and their payments"""
+        stamp = int(time.time())
+        User.objects.bulk_create(
+            [User(username=f'archive_bench_{stamp}_{i}') for i in range(options['users'])],
+            batch_size=1000,
+        )
+        users = list(User.objects.filter(username__startswith=f'archive_bench_{stamp}_').values_list('pk', flat=True))
+
+        today = timezone.localdate()
+        span = options['years'] * 365
+        rng = random.Random(42)
+        began = time.perf_counter()
+        batch = []
+        for i in range(options['bookings']):
+            # Mostly past stays, plus a slice of upcoming ones that stay hot.
+            offset = rng.randint(-span, 180)
+            check_in = today + timedelta(days=offset)
+            nights = rng.randint(1, 14)
+            if offset + nights < 0:
+                status = 'completed' if rng.random() < 0.8 else 'cancelled'
+            else:
+                status = 'pending' if rng.random() < 0.5 else 'confirmed'
+            batch.append(Booking(
+                listing_id=rng.choice(listing_ids),
+                user_id=rng.choice(users),
+                check_in_date=check_in,
+                check_out_date=check_in + timedelta(days=nights),
+                number_of_guests=rng.randint(1, 4),
+                total_price=Decimal(nights * 100),
+                status=status,
+            ))
+            if len(batch) == 5000:
+                Booking.objects.bulk_create(batch)
+                batch = []
+        Booking.objects.bulk_create(batch)
+
+        # bulk_create does not fill auto_now fields the archive job looks at.
+        created = timezone.now() - timedelta(days=span)
+        Booking.objects.filter(user_id__in=users).update(created_at=created, updated_at=created)
+        completed = Booking.objects.filter(user_id__in=users, status='completed').values_list('pk', 'total_price')
+        Payment.objects.bulk_create(
+            [
+                Payment(booking_id=pk, amount=total, transaction_id=f'archive_bench_{stamp}_{pk}', status='completed')
+                for pk, total in completed.iterator()
+            ],
+            batch_size=5000,
+        )
+        self.stdout.write(
+            f'Seeded {options["bookings"]} bookings for {len(users)} guests in '
+            f'{time.perf_counter() - began:.1f}s; archive cutoff is {archive_cutoff()}'
+        )
+        return users
+
+    def analyze(self):
+        # Production databases keep planner statistics current; freshly
+        # seeded tables have none until they are analysed.
+        tables = [Booking._meta.db_table, ArchivedBooking._meta.db_table]
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute('ANALYZE TABLE ' + ', '.join(tables))
+                cursor.fetchall()
+            elif connection.vendor in ('sqlite', 'postgresql'):
+                for table in tables:
+                    cursor.execute(f'ANALYZE {connection.ops.quote_name(table)}')
+
+    def report(self, label, users, listing_ids, samples):
+        self.analyze()
+        self.stdout.write(self.style.SUCCESS(
+            f'\n{label}: {Booking.objects.count()} live, {ArchivedBooking.objects.count()} archived'
+        ))
+        self.time_query('guest bookings page', users, samples, self.bookings_page)
+        self.time_query('availability check', listing_ids, samples, self.availability)
+        self.time_query('admin pending filter count', [None], samples, self.pending_count)
+
+    def time_query(self, label, choices, samples, query):
+        rng = random.Random(7)
+        timings = []
+        for _ in range(samples):
+            argument = rng.choice(choices)
+            began = time.perf_counter()
+            query(argument)
+            timings.append((time.perf_counter() - began) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f'  {label:>32}: median {statistics.median(timings):.2f}ms, '
+            f'p95 {timings[int(len(timings) * 0.95) - 1]:.2f}ms'
+        )
+
+    def bookings_page(self, user_id):
+        # What BookingViewSet.list runs for one guest.
+        queryset = Booking.objects.filter(user_id=user_id)
+        queryset.count()
+        list(queryset.order_by('-created_at')[:20])
+
+    def availability(self, listing_id):
+        # The overlap query of the bulk booking path.
+        start = timezone.localdate() + timedelta(days=30)
+        list(Booking.objects.filter(
+            listing_id=listing_id,
+            status__in=bulk.BLOCKING_BOOKING_STATUSES,
+            check_in_date__lt=start + timedelta(days=7),
+            check_out_date__gt=start,
+        ).values_list('check_in_date', 'check_out_date'))
+
+    def pending_count(self, _):
+        Booking.objects.filter(status='pending').count()
+
+    def history_page(self, user_id):
+        queryset = booking_history(User(pk=user_id))
+        queryset.count()
+        list(queryset[:20])
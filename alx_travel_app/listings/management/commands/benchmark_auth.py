@@ -0,0 +1,66 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from listings.authentication import CachedTokenAuthentication, invalidate_tokens
+from listings.views import HostStatsView
+
+
+class Rollback(Exception):
+    """Raised to undo the benchmark user and token."""
+
+
+class Command(BaseCommand):
+    help = 'Compare queries and time per request for plain and cached token authentication'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=1000,
+            help='Requests made with each authentication class (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        token = None
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(username='auth_benchmark_user')
+                token = Token.objects.create(user=user)
+                for authentication in (TokenAuthentication, CachedTokenAuthentication):
+                    self.measure(authentication, token.key, options['requests'])
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            if token is not None:
+                invalidate_tokens([token.key])
+
+    def measure(self, authentication, key, count):
+        """Call the host stats endpoint ``count`` times with one token"""
+        view = HostStatsView.as_view(authentication_classes=[authentication])
+        factory = RequestFactory()
+        invalidate_tokens([key])
+
+        with CaptureQueriesContext(connection) as queries:
+            began = time.perf_counter()
+            for _ in range(count):
+                request = factory.get(
+                    '/api/hosts/me/stats/',
+                    {'from': '2025-01-01', 'to': '2025-01-31'},
+                    HTTP_AUTHORIZATION=f'Token {key}',
+                )
+                response = view(request)
+                if response.status_code != 200:
+                    raise RuntimeError(f'Benchmark request failed: {response.status_code} {response.data}')
+            elapsed = time.perf_counter() - began
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{authentication.__name__:>26}: {len(queries) / count:.3f} queries/request, '
+            f'{elapsed / count * 1e6:.0f}us/request'
+        ))
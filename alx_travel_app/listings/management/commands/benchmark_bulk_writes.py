@@ -0,0 +1,90 @@
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from listings import bulk
+from listings.models import Listing
+from listings.serializers import BookingSerializer
+
+
+class Rollback(Exception):
+    """Raised to undo everything a benchmark round wrote."""
+
+
+class Command(BaseCommand):
+    help = 'Measure bookings created per second through the bulk API versus one-at-a-time creates'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='1,100,1000',
+            help='Comma-separated batch sizes to measure (default: 1,100,1000)'
+        )
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=1000,
+            help='Bookings written per measurement (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        rows = options['rows']
+
+        self.stdout.write(f'Writing {rows} bookings per run; every run is rolled back.')
+        self.stdout.write(self.style.SUCCESS(
+            f"{'one-at-a-time':>16}: {self.measure(rows, self.create_singly):>10.0f} rows/s"
+        ))
+        for size in sizes:
+            rate = self.measure(rows, lambda user, items: self.create_in_batches(user, items, size))
+            self.stdout.write(self.style.SUCCESS(f'{f"batch={size}":>16}: {rate:>10.0f} rows/s'))
+
+    def measure(self, rows, create):
+        """Return rows/s for creating ``rows`` bookings with ``create``"""
+        elapsed = 0.0
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(username='bulk_benchmark_user')
+                listing = Listing.objects.create(
+                    title='Bulk benchmark listing',
+                    description='Temporary listing for benchmark_bulk_writes',
+                    listing_type='hotel',
+                    price=Decimal('100.00'),
+                    location='Benchmark',
+                    created_by=user,
+                )
+                start = date.today() + timedelta(days=1)
+                items = [
+                    {
+                        'listing': listing.pk,
+                        'check_in_date': (start + timedelta(days=i)).isoformat(),
+                        'check_out_date': (start + timedelta(days=i + 1)).isoformat(),
+                        'number_of_guests': 1,
+                        'total_price': '100.00',
+                    }
+                    for i in range(rows)
+                ]
+                began = time.perf_counter()
+                create(user, items)
+                elapsed = time.perf_counter() - began
+                raise Rollback
+        except Rollback:
+            pass
+        return rows / elapsed if elapsed else 0.0
+
+    def create_in_batches(self, user, items, size):
+        for offset in range(0, len(items), size):
+            results = bulk.bulk_create_bookings(user, items[offset:offset + size])
+            failed = [result for result in results if result['status'] != 'created']
+            if failed:
+                raise RuntimeError(f'Benchmark item rejected: {failed[0]}')
+
+    def create_singly(self, user, items):
+        for item in items:
+            serializer = BookingSerializer(data=item)
+            serializer.is_valid(raise_exception=True)
+            with transaction.atomic():
+                serializer.save(user=user)
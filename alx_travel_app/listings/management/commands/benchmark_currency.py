@@ -0,0 +1,141 @@
+import statistics
+import time
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+from listings import currency
+from listings.models import ExchangeRate
+
+# Used when the table has no rates yet; only lives inside the benchmark.
+SAMPLE_RATES = {'USD': '1', 'EUR': '0.92', 'GBP': '0.79', 'ETB': '57.5', 'KES': '129.3'}
+
+
+class Rollback(Exception):
+    """Raised to undo the sample rates."""
+
+
+class Command(BaseCommand):
+    help = 'Measure what ?currency= adds to listing pages, per page and per converted row'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='*',
+            default=['/api/listings/?fields=id,title,price,currency', '/api/listings/'],
+            help='Anonymous GET paths to time (default: a sparse and a full listing page)'
+        )
+        parser.add_argument(
+            '--currency',
+            default='EUR',
+            help='Currency to convert to (default: EUR)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=50,
+            help='Requests timed per page and variant (default: 50)'
+        )
+
+    def handle(self, *args, **options):
+        target = options['currency'].upper()
+        try:
+            # Time the views, not the response cache.
+            with transaction.atomic(), override_settings(RESPONSE_CACHE_TIMEOUT=0):
+                if not ExchangeRate.objects.filter(currency=target).exists():
+                    self.seed_rates()
+                self.reset_rates()
+                for path in options['paths']:
+                    self.compare(path, target, options['repeat'])
+                self.convert_rows(target)
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            self.reset_rates()
+
+    def seed_rates(self):
+        now = timezone.now()
+        currency.store_rates(
+            [ExchangeRate(currency=code, rate=Decimal(rate), updated_at=now) for code, rate in SAMPLE_RATES.items()]
+        )
+        self.stdout.write(f'Using sample rates for {", ".join(SAMPLE_RATES)} (rolled back afterwards)')
+
+    def reset_rates(self):
+        """Make every later read reload the rates from the table"""
+        cache.set(currency.VERSION_KEY, uuid.uuid4().hex, None)
+        currency._checked_at = 0.0
+
+    def compare(self, path, target, repeat):
+        separator = '&' if '?' in path else '?'
+        plain = self.request_runner(path)
+        converted = self.request_runner(f'{path}{separator}currency={target}')
+        # The first requests load the rates; later ones only convert.
+        rows = plain()
+        converted()
+        plain_queries = self.queries(plain)
+        converted_queries = self.queries(converted)
+
+        # Alternate the variants so drift in the database hits both alike.
+        plain_times, converted_times = [], []
+        for _ in range(repeat):
+            plain_times.append(self.timed(plain))
+            converted_times.append(self.timed(converted))
+        plain_ms = statistics.median(plain_times)
+        converted_ms = statistics.median(converted_times)
+        extra = converted_ms - plain_ms
+        self.stdout.write(self.style.SUCCESS(f'{path} ({rows} rows)'))
+        self.stdout.write(f'  without ?currency=: {plain_ms:.3f}ms, {plain_queries} queries')
+        self.stdout.write(
+            f'  with ?currency={target}: {converted_ms:.3f}ms, {converted_queries} queries '
+            f'({extra:+.3f}ms per page, {extra / max(rows, 1) * 1000:+.1f}µs per row)'
+        )
+
+    def request_runner(self, path):
+        """A function that serves ``path`` anonymously, unthrottled, and returns its row count"""
+        match = resolve(path.split('?')[0])
+        actions = getattr(match.func, 'actions', None)
+        initkwargs = {'throttle_classes': []}
+        view = match.func.cls.as_view(actions, **initkwargs) if actions else match.func.cls.as_view(**initkwargs)
+        # Pages build absolute links, so the host has to be one the settings accept.
+        factory = APIRequestFactory(
+            SERVER_NAME=next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+        )
+
+        def run():
+            response = view(factory.get(path), *match.args, **match.kwargs)
+            if response.status_code != 200:
+                raise CommandError(f'{path} answered {response.status_code}: {response.data}')
+            data = response.data
+            return len(data['results']) if isinstance(data, dict) and 'results' in data else 1
+        return run
+
+    def queries(self, run):
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        return len(queries)
+
+    def timed(self, run):
+        began = time.perf_counter()
+        run()
+        return (time.perf_counter() - began) * 1000
+
+    def convert_rows(self, target):
+        converter = currency.Converter(currency.current_rates(), target)
+        codes = list(converter.factors)
+        self.stdout.write(self.style.SUCCESS(f'Converter alone ({len(codes)} currencies)'))
+        for count in (20, 100, 1000):
+            amounts = [(f'{100 + i * 7 % 900}.50', codes[i % len(codes)]) for i in range(count)]
+            began = time.perf_counter()
+            for _ in range(20):
+                for amount, code in amounts:
+                    converter.convert(amount, code)
+            elapsed = (time.perf_counter() - began) / 20 * 1000
+            self.stdout.write(f'  {count:>5} amounts: {elapsed:.3f}ms ({elapsed / count * 1000:.2f}µs each)')
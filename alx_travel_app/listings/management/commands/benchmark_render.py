@@ -0,0 +1,72 @@
+import gzip
+import time
+
+import brotli
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import resolve
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+from listings.renderers import ORJSONRenderer
+
+
+class Command(BaseCommand):
+    help = 'Compare render time and bytes on the wire for API pages with each renderer and encoding'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='*',
+            default=['/api/listings/', '/api/listings/?omit=reviews', '/api/reviews/'],
+            help='Anonymous GET paths to render (default: listing and review pages)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=200,
+            help='Renders and compressions timed per page (default: 200)'
+        )
+
+    def handle(self, *args, **options):
+        for path in options['paths']:
+            data = self.page_data(path)
+            repeat = options['repeat']
+
+            stdlib_body, stdlib_ms = self.timed(lambda: JSONRenderer().render(data), repeat)
+            body, orjson_ms = self.timed(lambda: ORJSONRenderer().render(data), repeat)
+            if body != stdlib_body:
+                self.stderr.write(self.style.WARNING(f'{path}: the renderers produced different bytes'))
+            gzipped, gzip_ms = self.timed(
+                lambda: gzip.compress(body, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0), repeat
+            )
+            brotlied, brotli_ms = self.timed(
+                lambda: brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY), repeat
+            )
+
+            self.stdout.write(self.style.SUCCESS(path))
+            self.stdout.write(
+                f'  render:   JSONRenderer {stdlib_ms:.3f}ms, ORJSONRenderer {orjson_ms:.3f}ms '
+                f'({stdlib_ms / orjson_ms:.1f}x faster)'
+            )
+            self.stdout.write(
+                f'  on wire:  identity {len(body)} B, '
+                f'gzip {len(gzipped)} B ({len(gzipped) / len(body):.0%}) in {gzip_ms:.3f}ms, '
+                f'br {len(brotlied)} B ({len(brotlied) / len(body):.0%}) in {brotli_ms:.3f}ms'
+            )
+
+    def page_data(self, path):
+        """Run the view for ``path`` and return its unrendered response data"""
+        request = APIRequestFactory().get(path, HTTP_ACCEPT='application/json')
+        match = resolve(path.split('?')[0])
+        response = match.func(request, *match.args, **match.kwargs)
+        if response.status_code != 200 or not hasattr(response, 'data'):
+            raise CommandError(f'{path} answered {response.status_code}; only anonymous DRF reads can be rendered.')
+        return response.data
+
+    def timed(self, render, repeat):
+        """Return the result of ``render`` and its mean time in milliseconds"""
+        result = render()
+        began = time.perf_counter()
+        for _ in range(repeat):
+            render()
+        return result, (time.perf_counter() - began) / repeat * 1000
@@ -0,0 +1,89 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from listings import reviews
+from listings.models import Listing, Review
+
+
+class Rollback(Exception):
+    """Raised to undo the benchmark reviews."""
+
+
+class Command(BaseCommand):
+    help = (
+        'Write a burst of reviews and compare the queries and emails of one notification task '
+        'per review with the coalesced review job'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reviews',
+            type=int,
+            default=1000,
+            help='Reviews in the burst (default: 1000)'
+        )
+        parser.add_argument(
+            '--listings',
+            type=int,
+            default=1,
+            help='Listings the burst is spread over (default: 1)'
+        )
+
+    def handle(self, *args, **options):
+        listings = list(
+            Listing.objects.filter(is_active=True).exclude(created_by__email='')[:options['listings']]
+        )
+        if not listings:
+            raise CommandError('No active listings whose owner has an email; run the seed command first.')
+
+        # Keep the emails in memory whatever EMAIL_BACKEND says.
+        backend = mail.get_connection
+        mail.get_connection = lambda *args, **kwargs: backend('django.core.mail.backends.locmem.EmailBackend')
+        try:
+            with transaction.atomic():
+                self.write_burst(listings, options['reviews'])
+                self.measure('one task per review', self.per_review)
+                self.measure('coalesced review job', reviews.process_new_reviews)
+                raise Rollback
+        except Rollback:
+            self.stdout.write('Benchmark reviews rolled back.')
+        finally:
+            mail.get_connection = backend
+
+    def write_burst(self, listings, count):
+        # Earlier reviews are not part of the burst.
+        reviews.process_new_reviews()
+        stamp = int(time.time())
+        users = User.objects.bulk_create([User(username=f'review_bench_{stamp}_{i}') for i in range(count)])
+        self.burst = Review.objects.bulk_create([
+            Review(listing=listings[i % len(listings)], reviewer=user, rating=i % 5 + 1, comment='Lovely stay')
+            for i, user in enumerate(users)
+        ])
+        self.stdout.write(f'Wrote {count} reviews on {len(listings)} listings')
+
+    def per_review(self):
+        """What each review's notification task used to do"""
+        for created in self.burst:
+            review = Review.objects.get(id=created.pk)
+            listing = review.listing
+            if listing.created_by.email:
+                mail.send_mail(
+                    f'New Review for {listing.title}',
+                    f'Reviewer: {review.reviewer.username}\nRating: {review.rating}/5 stars\nComment: {review.comment}',
+                    None,
+                    [listing.created_by.email],
+                )
+
+    def measure(self, label, run):
+        mail.outbox = []
+        began = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        elapsed = time.perf_counter() - began
+        self.stdout.write(
+            f'  {label:>22}: {len(queries)} queries, {len(mail.outbox)} emails, {elapsed * 1000:.0f}ms'
+        )
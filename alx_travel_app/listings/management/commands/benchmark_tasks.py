@@ -0,0 +1,107 @@
+import time
+from contextlib import ExitStack
+
+from celery.contrib.testing.worker import start_worker
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from alx_travel_app.celery import app
+from listings import task_metrics
+from listings.models import Listing
+from listings.tasks import send_listing_notification, send_payment_confirmation, cleanup_inactive_listings
+
+
+class Command(BaseCommand):
+    help = (
+        'Run one in-process worker per queue on an in-memory broker and report '
+        'throughput, queue wait and latency per task'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tasks',
+            type=int,
+            default=200,
+            help='Tasks published to each queue (default: 200)'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=4,
+            help='Workers per queue (default: 4)'
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=120.0,
+            help='Seconds to wait for all tasks to finish (default: 120)'
+        )
+
+    def handle(self, *args, **options):
+        listing = Listing.objects.only('id').first()
+        if listing is None:
+            raise CommandError('No listings to notify about; run the seed command first.')
+
+        count = options['tasks']
+        # Payments that do not exist return straight away, so the payments
+        # queue measures broker and worker overhead rather than email.
+        work = [
+            (send_payment_confirmation, lambda i: (-i - 1,)),
+            (send_listing_notification, lambda i: (listing.pk,)),
+            (cleanup_inactive_listings, lambda i: ()),
+        ]
+        queues = sorted({settings.CELERY_TASK_ROUTES[task.name]['queue'] for task, _ in work})
+
+        # Settings read from Django keep their CELERY_ prefix and take
+        # precedence, so override them under the same names.
+        prefix = f'{app.namespace}_' if app.namespace else ''
+        app.conf.update({
+            f'{prefix}BROKER_URL': 'memory://',
+            # The memory transport polls; the default 1s interval would dominate.
+            f'{prefix}BROKER_TRANSPORT_OPTIONS': {'polling_interval': 0.001},
+            f'{prefix}RESULT_BACKEND': 'cache+memory://',
+            f'{prefix}TASK_ALWAYS_EAGER': False,
+        })
+        task_metrics.reset()
+
+        with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'), ExitStack() as stack:
+            # Several solo workers per queue: the thread pool stalls on the
+            # polling memory transport.
+            for queue in queues:
+                for _ in range(options['concurrency']):
+                    stack.enter_context(start_worker(
+                        app,
+                        pool='solo',
+                        queues=[queue],
+                        perform_ping_check=False,
+                        shutdown_timeout=options['timeout'],
+                    ))
+
+            began = time.perf_counter()
+            for i in range(count):
+                for task, arguments in work:
+                    task.delay(*arguments(i))
+            expected = count * len(work)
+            deadline = time.monotonic() + options['timeout']
+            while self.finished() < expected:
+                if time.monotonic() > deadline:
+                    raise CommandError(f'Only {self.finished()} of {expected} tasks finished in time.')
+                time.sleep(0.05)
+            elapsed = time.perf_counter() - began
+
+        self.stdout.write(
+            f'{expected} tasks on queues {", ".join(queues)} in {elapsed:.2f}s '
+            f'({expected / elapsed:.0f} tasks/s)'
+        )
+        for name, stats in sorted(task_metrics.snapshot().items()):
+            self.stdout.write(self.style.SUCCESS(
+                f"{name.rsplit('.', 1)[-1]:>28}: {stats['count']:>5} runs, {stats['failures']} failed, "
+                f"runtime avg {stats['runtime_avg'] * 1000:.2f}ms max {stats['runtime_max'] * 1000:.2f}ms, "
+                f"queue wait avg {self.ms(stats['queue_wait_avg'])} max {self.ms(stats['queue_wait_max'])}"
+            ))
+
+    def finished(self):
+        return sum(stats['count'] for stats in task_metrics.snapshot().values())
+
+    def ms(self, seconds):
+        return '-' if seconds is None else f'{seconds * 1000:.2f}ms'
@@ -0,0 +1,122 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management.base import BaseCommand
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework.throttling import AnonRateThrottle, ScopedRateThrottle, UserRateThrottle
+from listings import throttling
+from listings.views import ListingViewSet, PaymentVerifyView
+
+
+DRF_THROTTLES = [AnonRateThrottle, UserRateThrottle, ScopedRateThrottle]
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the token-bucket throttles per request against DRF\'s cache-based ones and check '
+        'that concurrent clients cannot overdraw a bucket'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--store',
+            default=None,
+            help='Bucket store URL to measure (default: THROTTLE_STORE_URL)'
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=20000,
+            help='Throttle checks timed per case (default: 20000)'
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=16,
+            help='Threads racing for one bucket in the concurrency check (default: 16)'
+        )
+
+    def handle(self, *args, **options):
+        url = options['store'] or settings.THROTTLE_STORE_URL
+        store = throttling.LocalBucketStore() if url.startswith('memory://') else throttling.RedisBucketStore(url)
+        throttling._store = store
+        self.run_id = uuid.uuid4().hex[:8]
+        try:
+            self.stdout.write(self.style.SUCCESS(f'Store: {url}'))
+            self.time_store(store, options['requests'])
+            self.time_views(options['requests'])
+            self.race(store, options['threads'])
+        finally:
+            throttling._store = None
+
+    def time_store(self, store, count):
+        began = time.perf_counter()
+        for i in range(count):
+            store.take(f'throttle:bench:{self.run_id}:{i % 1000}', 100, 1.0)
+        self.report('one bucket operation', began, count)
+
+    def time_views(self, count):
+        factory = APIRequestFactory()
+        cases = [
+            ('anonymous listing page', ListingViewSet, '/api/listings/', False),
+            ('anonymous search', ListingViewSet, '/api/listings/?search=villa', False),
+            ('signed-in payment check', PaymentVerifyView, '/api/payments/verify/1/', True),
+        ]
+        for label, view_class, path, signed_in in cases:
+            requests = []
+            for i in range(count):
+                # A new client every time, so no bucket runs dry.
+                request = Request(factory.get(path, REMOTE_ADDR=f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}'))
+                request.user = User(pk=10 ** 9 + i) if signed_in else AnonymousUser()
+                # Parsed once per request anyway, by CORS and the filters.
+                request.headers, request.query_params
+                requests.append(request)
+
+            timings = []
+            for throttle_classes in (view_class.throttle_classes, DRF_THROTTLES):
+                view = view_class()
+                view.action = 'list'
+                view.headers = {}
+                view.throttle_classes = throttle_classes
+                began = time.perf_counter()
+                for request in requests:
+                    view.check_throttles(request)
+                timings.append((time.perf_counter() - began) / count * 1e6)
+            self.stdout.write(
+                f'  {"all throttles, " + label:>40}: {timings[0]:.1f}us per request '
+                f'(DRF cache throttles: {timings[1]:.1f}us)'
+            )
+
+    def race(self, store, threads):
+        """Many threads draining one bucket may not take more than it holds"""
+        capacity = 1000
+        key = f'throttle:bench:{self.run_id}:race'
+        allowed = []
+        start = threading.Barrier(threads)
+
+        def drain():
+            start.wait()
+            taken = 0
+            for _ in range(capacity // threads * 2):
+                # Refills one token per 1000 seconds, so none arrive mid-race.
+                taken += store.take(key, capacity, 0.001).allowed
+            allowed.append(taken)
+
+        workers = [threading.Thread(target=drain) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        outcome = self.style.SUCCESS('ok') if sum(allowed) == capacity else self.style.ERROR('overdrawn')
+        self.stdout.write(
+            f'  {threads} threads, {capacity // threads * 2 * threads} takes from a {capacity}-token bucket: '
+            f'{sum(allowed)} allowed ({outcome})'
+        )
+
+    def report(self, label, began, count):
+        elapsed = time.perf_counter() - began
+        self.stdout.write(f'  {label:>40}: {elapsed / count * 1e6:.1f}us per request')
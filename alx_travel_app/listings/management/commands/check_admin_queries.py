@@ -0,0 +1,73 @@
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.base import SessionBase
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from listings.models import Listing, Review, Booking
+
+
+MODELS = {'listing': Listing, 'review': Review, 'booking': Booking}
+
+
+class Command(BaseCommand):
+    help = 'Render the Listing, Review and Booking admin changelists and fail if any exceeds a query budget'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--budget',
+            type=int,
+            default=12,
+            help='Maximum queries allowed per changelist page (default: 12)'
+        )
+        parser.add_argument(
+            '--model',
+            choices=sorted(MODELS),
+            help='Only check this changelist (default: all of them)'
+        )
+        parser.add_argument(
+            '--query',
+            default='',
+            help='Changelist query string, e.g. "q=beach" or "status__exact=pending"'
+        )
+
+    def handle(self, *args, **options):
+        # Admin modules load with the URLconf, which commands do not import.
+        admin.autodiscover()
+        superuser = User.objects.filter(is_superuser=True, is_active=True).first()
+        if superuser is None:
+            raise CommandError('No active superuser to render the admin as; create one first.')
+
+        factory = RequestFactory()
+        over_budget = []
+        models = [MODELS[options['model']]] if options['model'] else MODELS.values()
+        for model in models:
+            model_admin = admin.site._registry[model]
+            request = factory.get('/admin/', data=self.parse_query(options['query']))
+            request.user = superuser
+            request.session = SessionBase()
+            request._messages = FallbackStorage(request)
+
+            with CaptureQueriesContext(connection) as queries:
+                response = model_admin.changelist_view(request)
+                if not hasattr(response, 'render'):
+                    raise CommandError(
+                        f'The {model._meta.verbose_name} changelist rejected the query {options["query"]!r}.'
+                    )
+                response.render()
+            count = len(queries)
+
+            line = f'{model._meta.verbose_name_plural:>10}: {count:>3} queries'
+            if count > options['budget']:
+                over_budget.append(str(model._meta.verbose_name_plural))
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(self.style.SUCCESS(line))
+
+        if over_budget:
+            raise CommandError(f"Over the budget of {options['budget']} queries: {', '.join(over_budget)}")
+
+    def parse_query(self, query):
+        return dict(pair.split('=', 1) for pair in query.split('&') if '=' in pair)
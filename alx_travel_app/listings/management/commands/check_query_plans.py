@@ -0,0 +1,245 @@
+import re
+from datetime import timedelta
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from listings import trending
+from listings.models import Listing, ListingPopularity, Review, Booking
+
+# Planners rightly scan tiny tables, so scans of those are not failures, and
+# plans are only telling on seeded data.
+MIN_ROWS = 1000
+
+# Prefetches fetch rows for a page's worth of keys; sorting those is cheap.
+KEY_LIST = re.compile(r'\bIN \((?!SELECT)', re.IGNORECASE)
+# An index scan reads the whole index unless a LIMIT stops it early.
+LIMITED = re.compile(r'\bLIMIT \d+', re.IGNORECASE)
+SQLITE_SCAN = re.compile(r'^SCAN (\w+)(?: USING (COVERING )?INDEX \w+)?$')
+SQLITE_SORT = re.compile(r'USE TEMP B-TREE FOR (ORDER BY|GROUP BY|DISTINCT)')
+
+
+class Rollback(Exception):
+    """Raised to undo the writes of the checked POST requests."""
+
+
+class Command(BaseCommand):
+    help = (
+        'EXPLAIN the queries behind the listing, review and booking endpoints and fail if any '
+        'scans a whole table or sorts rows outside an index'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--plans',
+            action='store_true',
+            help='Print every statement with its plan, not only the failing ones'
+        )
+        parser.add_argument(
+            '--analyze',
+            action='store_true',
+            help='Refresh the planner statistics of the checked tables first'
+        )
+        parser.add_argument(
+            '--case',
+            help='Only check cases whose label contains this text'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'mysql'):
+            raise CommandError(f'Plans can be read on SQLite and MySQL, not {connection.vendor}.')
+        self.warn_if_small()
+        if options['analyze']:
+            self.analyze()
+
+        self.row_counts = {}
+        failures = []
+        for label, method, path, user, data in self.cases():
+            if options['case'] and options['case'] not in label:
+                continue
+            problems = []
+            statements = self.capture(method, path, user, data)
+            for sql in statements:
+                plan = self.explain(sql)
+                found = self.problems(plan, sql)
+                problems.extend(found)
+                if found or options['plans']:
+                    style = self.style.ERROR if found else str
+                    self.stdout.write(style(f'    {sql[:300]}'))
+                    for line in plan:
+                        self.stdout.write(f'      {line}')
+            line = f'{label:>44}: {len(statements):>2} statements'
+            if problems:
+                failures.append(label)
+                self.stdout.write(self.style.ERROR(f'{line}, {"; ".join(sorted(set(problems)))}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(line))
+
+        if failures:
+            raise CommandError(f'Full scans or sorts in: {", ".join(failures)}')
+
+    def warn_if_small(self):
+        for model in (Listing, Review, Booking):
+            count = model.objects.count()
+            if count < MIN_ROWS:
+                self.stderr.write(self.style.WARNING(
+                    f'Only {count} {model._meta.verbose_name_plural}; seed more data for plans '
+                    f'that match production.'
+                ))
+
+    def analyze(self):
+        """Refresh the statistics the planner picks indexes by"""
+        tables = [model._meta.db_table for model in (Listing, ListingPopularity, Review, Booking, User)]
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                for table in tables:
+                    cursor.execute(f'ANALYZE {connection.ops.quote_name(table)}')
+            else:
+                cursor.execute(f'ANALYZE TABLE {", ".join(connection.ops.quote_name(table) for table in tables)}')
+                cursor.fetchall()
+
+    def cases(self):
+        """``(label, method, path, user, data)`` for each request to check"""
+        listing = (
+            Listing.objects.filter(is_active=True).annotate(reviewed=Count('reviews'))
+            .order_by('-reviewed').first()
+        )
+        if listing is None:
+            raise CommandError('No active listings; run the seed command first.')
+        location = (
+            Listing.objects.filter(is_active=True).values('location').annotate(count=Count('id'))
+            .order_by('-count').values_list('location', flat=True).first()
+        )
+        guest = (
+            User.objects.filter(is_active=True).annotate(booked=Count('bookings'))
+            .order_by('-booked').first()
+        )
+        check_in = timezone.now().date() + timedelta(days=400)
+        bulk_booking = [{
+            'listing': listing.pk,
+            'check_in_date': str(check_in),
+            'check_out_date': str(check_in + timedelta(days=3)),
+            'number_of_guests': 1,
+        }]
+
+        top = trending.trending_queryset().first()
+
+        cases = [
+            ('listings', 'get', '/api/listings/', None, None),
+            ('listings by type', 'get', f'/api/listings/?listing_type={listing.listing_type}', None, None),
+            ('listings by location', 'get', f'/api/listings/?location={location}', None, None),
+            (
+                'listings by type and location', 'get',
+                f'/api/listings/?listing_type={listing.listing_type}&location={location}', None, None,
+            ),
+            ('listings by price', 'get', '/api/listings/?ordering=price', None, None),
+            ('listings by price, highest first', 'get', '/api/listings/?ordering=-price', None, None),
+            ('listing', 'get', f'/api/listings/{listing.pk}/', None, None),
+            ('listing reviews', 'get', f'/api/listings/{listing.pk}/reviews/', None, None),
+            ('similar listings', 'get', f'/api/listings/{listing.pk}/similar/', None, None),
+            ('trending listings', 'get', '/api/listings/trending/', None, None),
+            ('reviews', 'get', '/api/reviews/', None, None),
+            ('reviews of a listing', 'get', f'/api/reviews/?listing={listing.pk}', None, None),
+            ('bookings', 'get', '/api/bookings/', guest, None),
+            ('bookings by status', 'get', '/api/bookings/?status=confirmed', guest, None),
+            ('bulk bookings', 'post', '/api/bookings/bulk/', guest, bulk_booking),
+        ]
+        if top is not None:
+            cursor = urlencode({'cursor': trending.encode_cursor(top)})
+            cases.append(('trending listings, next page', 'get', f'/api/listings/trending/?{cursor}', None, None))
+        return cases
+
+    def capture(self, method, path, user, data):
+        """Serve one request, unthrottled, and return the SELECTs it ran"""
+        match = resolve(path.split('?')[0])
+        view = match.func.cls.as_view(
+            **({'actions': match.func.actions} if hasattr(match.func, 'actions') else {}),
+            **{**match.func.initkwargs, 'throttle_classes': []},
+        )
+        # The factory's default host, testserver, is not in ALLOWED_HOSTS.
+        factory = APIRequestFactory(SERVER_NAME=next(
+            (host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost'
+        ))
+        if method == 'get':
+            request = factory.get(path)
+        else:
+            request = factory.post(path, data, format='json')
+        if user is not None:
+            force_authenticate(request, user)
+
+        try:
+            # A cached response would leave nothing to explain.
+            with transaction.atomic(), override_settings(RESPONSE_CACHE_TIMEOUT=0):
+                with CaptureQueriesContext(connection) as queries:
+                    response = view(request, *match.args, **match.kwargs)
+                    if hasattr(response, 'render'):
+                        response.render()
+                raise Rollback
+        except Rollback:
+            pass
+        if response.status_code >= 400:
+            raise CommandError(f'{method.upper()} {path} answered {response.status_code}: {response.data}')
+        return [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].lstrip().upper().startswith('SELECT')
+        ]
+
+    def explain(self, sql):
+        """The plan of ``sql`` as readable lines"""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                return [row[3] for row in cursor.fetchall()]
+            cursor.execute(f'EXPLAIN {sql}')
+            columns = [column[0] for column in cursor.description]
+            return [
+                ', '.join(f'{name}={value}' for name, value in zip(columns, row) if value is not None)
+                for row in cursor.fetchall()
+            ]
+
+    def is_small(self, table):
+        """Whether ``table`` has fewer than MIN_ROWS rows; aliases of joined tables count as large"""
+        if table not in self.row_counts:
+            if table in connection.introspection.table_names():
+                with connection.cursor() as cursor:
+                    cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+                    self.row_counts[table] = cursor.fetchone()[0]
+            else:
+                self.row_counts[table] = None
+        count = self.row_counts[table]
+        return count is not None and count < MIN_ROWS
+
+    def problems(self, plan, sql):
+        """
+        Full scans of large tables, and sorts unless the statement fetches
+        rows for a list of keys. Walking an index in order is fine under a
+        LIMIT, and reading a whole covering index is how counts are done.
+        """
+        sort_allowed = bool(KEY_LIST.search(sql))
+        limited = bool(LIMITED.search(sql))
+        found = []
+        for line in plan:
+            if connection.vendor == 'sqlite':
+                scan = SQLITE_SCAN.match(line)
+                index_ok = scan and ('COVERING' in line or (limited and 'INDEX' in line))
+                if scan and not index_ok and not self.is_small(scan.group(1)):
+                    found.append(f'full scan of {scan.group(1)}')
+                sort = SQLITE_SORT.search(line)
+                if sort and not sort_allowed:
+                    found.append(f'sort for {sort.group(1)}')
+            else:
+                fields = dict(part.split('=', 1) for part in line.split(', ') if '=' in part)
+                extra = fields.get('Extra', '')
+                index_ok = fields.get('type') == 'index' and ('Using index' in extra or limited)
+                if fields.get('type') in ('ALL', 'index') and not index_ok and not self.is_small(fields.get('table')):
+                    found.append(f'full scan of {fields.get("table")}')
+                if ('Using filesort' in extra or 'Using temporary' in extra) and not sort_allowed:
+                    found.append(f'sort on {fields.get("table")}')
+        return found
@@ -0,0 +1,47 @@
+import sys
+
+from django.core.management.base import BaseCommand
+from listings import bulk
+
+
+class Command(BaseCommand):
+    help = 'Stream listings or bookings to a CSV or NDJSON file with constant memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'dataset',
+            choices=sorted(bulk.DATASETS),
+            help='Which table to export'
+        )
+        parser.add_argument(
+            '--format',
+            choices=sorted(bulk.EXPORT_FORMATS),
+            default='csv',
+            help='Output format (default: csv)'
+        )
+        parser.add_argument(
+            '--output',
+            help='File to write to (default: stdout)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=bulk.EXPORT_CHUNK_SIZE,
+            help=f'Rows fetched per query (default: {bulk.EXPORT_CHUNK_SIZE})'
+        )
+
+    def handle(self, *args, **options):
+        exporter = bulk.EXPORTERS[options['format']]
+        output = options['output']
+        stream = open(output, 'w', newline='', encoding='utf-8') if output else sys.stdout
+        try:
+            for piece in exporter(options['dataset'], options['chunk_size']):
+                stream.write(piece)
+        finally:
+            if output:
+                stream.close()
+
+        if output:
+            self.stderr.write(
+                self.style.SUCCESS(f"Exported {options['dataset']} to {output}")
+            )
@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from alx_travel_app import schema
+
+
+class Command(BaseCommand):
+    help = 'Write the OpenAPI schema artifacts for the current APP_VERSION'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate even if artifacts for this APP_VERSION already exist'
+        )
+
+    def handle(self, *args, **options):
+        existing = [schema.artifact_path(fmt) for fmt in schema.FORMATS]
+        if not options['force'] and all(path.exists() for path in existing):
+            self.stdout.write(f'Schema for version {settings.APP_VERSION} is up to date.')
+            return
+
+        began = time.perf_counter()
+        paths = schema.write_artifacts()
+        elapsed = time.perf_counter() - began
+        for path in paths:
+            self.stdout.write(self.style.SUCCESS(f'Wrote {path} ({path.stat().st_size} bytes)'))
+        self.stdout.write(f'Generated in {elapsed:.2f}s')
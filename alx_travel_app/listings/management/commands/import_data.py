@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand
+from listings import bulk
+
+
+class Command(BaseCommand):
+    help = 'Bulk import listings or bookings from a CSV or NDJSON export'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'dataset',
+            choices=sorted(bulk.DATASETS),
+            help='Which table to import into'
+        )
+        parser.add_argument(
+            'path',
+            help='File produced by export_data'
+        )
+        parser.add_argument(
+            '--format',
+            choices=sorted(bulk.EXPORT_FORMATS),
+            help='Input format (default: guessed from the file extension)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=bulk.IMPORT_BATCH_SIZE,
+            help=f'Rows validated and inserted per batch (default: {bulk.IMPORT_BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--keep-ids',
+            action='store_true',
+            help='Insert rows with their exported primary keys'
+        )
+        parser.add_argument(
+            '--max-errors',
+            type=int,
+            default=50,
+            help='Number of row errors to print (default: 50)'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('ndjson' if path.endswith('.ndjson') else 'csv')
+
+        def progress(result):
+            self.stdout.write(
+                f'{result.processed} rows processed, {result.created} created, '
+                f'{len(result.errors)} errors ({result.rows_per_second:.0f} rows/s)'
+            )
+
+        with open(path, newline='', encoding='utf-8') as fileobj:
+            result = bulk.import_rows(
+                options['dataset'],
+                bulk.read_rows(fileobj, fmt),
+                batch_size=options['batch_size'],
+                keep_ids=options['keep_ids'],
+                progress=progress,
+            )
+
+        for line, errors in result.errors[:options['max_errors']]:
+            self.stdout.write(self.style.ERROR(f'Row {line}: {errors}'))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {result.created} {options['dataset']} in {result.elapsed:.2f}s "
+                f'({result.rows_per_second:.0f} rows/s), {len(result.errors)} rows rejected'
+            )
+        )
@@ -0,0 +1,149 @@
+import asyncio
+import statistics
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Hold many keep-alive connections open against running servers and report '
+        'requests per second and latency percentiles for each URL. Typical runs:\n'
+        '  WSGI:            gunicorn -c gunicorn.conf.py alx_travel_app.wsgi  -> /api/listings/\n'
+        '  sync under ASGI: uvicorn alx_travel_app.asgi:application           -> /api/listings/\n'
+        '  native async:    uvicorn alx_travel_app.asgi:application           -> /api/async/listings/'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'urls',
+            nargs='+',
+            help='URLs to load, one after the other; prefix with "label=" to name them'
+        )
+        parser.add_argument(
+            '--connections',
+            type=int,
+            default=1000,
+            help='Concurrent connections per URL (default: 1000)'
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=10.0,
+            help='Seconds to measure each URL (default: 10)'
+        )
+        parser.add_argument(
+            '--warmup',
+            type=float,
+            default=2.0,
+            help='Seconds of load before measuring starts (default: 2)'
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=30.0,
+            help='Seconds before a request counts as failed (default: 30)'
+        )
+
+    def handle(self, *args, **options):
+        for target in options['urls']:
+            label, _, url = target.partition('=') if '=' in target.split('?')[0] else ('', '', target)
+            parts = urlsplit(url)
+            if parts.scheme != 'http' or not parts.hostname:
+                raise CommandError(f'Only plain http:// URLs are supported, got {url!r}.')
+            result = asyncio.run(self.load(parts, options))
+
+            latencies = sorted(result['latencies'])
+            if not latencies:
+                raise CommandError(f'No request to {url} succeeded ({result["errors"]} errors).')
+            self.stdout.write(self.style.SUCCESS(
+                f'{label or url}: {len(latencies) / options["duration"]:.0f} req/s, '
+                f'p50 {self.percentile(latencies, 50):.1f}ms, p99 {self.percentile(latencies, 99):.1f}ms, '
+                f'max {latencies[-1]:.1f}ms, {result["errors"]} errors, '
+                f'{options["connections"]} connections'
+            ))
+            if result['statuses']:
+                self.stdout.write('    statuses: ' + ', '.join(
+                    f'{status}x{count}' for status, count in sorted(result['statuses'].items())
+                ))
+
+    def percentile(self, latencies, percent):
+        if len(latencies) == 1:
+            return latencies[0]
+        return statistics.quantiles(latencies, n=100, method='inclusive')[percent - 1]
+
+    async def load(self, parts, options):
+        """Run every connection until the measuring window closes"""
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        request = (
+            f'GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n'
+            'Accept: application/json\r\nConnection: keep-alive\r\n\r\n'
+        ).encode()
+        result = {'latencies': [], 'errors': 0, 'statuses': {}}
+
+        loop = asyncio.get_running_loop()
+        measure_from = loop.time() + options['warmup']
+        stop_at = measure_from + options['duration']
+        await asyncio.gather(*(
+            self.connection(parts, request, result, measure_from, stop_at, options['timeout'])
+            for _ in range(options['connections'])
+        ))
+        return result
+
+    async def connection(self, parts, request, result, measure_from, stop_at, timeout):
+        """One client sending requests back to back over a kept-alive socket"""
+        loop = asyncio.get_running_loop()
+        reader = writer = None
+        while loop.time() < stop_at:
+            began = loop.time()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.wait_for(
+                        asyncio.open_connection(parts.hostname, parts.port or 80), timeout
+                    )
+                writer.write(request)
+                status, keep_alive = await asyncio.wait_for(self.read_response(reader), timeout)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                status, keep_alive = None, False
+            finished = loop.time()
+
+            if measure_from <= finished <= stop_at:
+                if status is not None and status < 500:
+                    result['latencies'].append((finished - began) * 1000)
+                else:
+                    result['errors'] += 1
+                if status is not None and status != 200:
+                    result['statuses'][status] = result['statuses'].get(status, 0) + 1
+            if not keep_alive and writer is not None:
+                writer.close()
+                reader = writer = None
+            if status is None:
+                # Back off briefly so a refusing server is not spun against.
+                await asyncio.sleep(0.05)
+        if writer is not None:
+            writer.close()
+
+    async def read_response(self, reader):
+        """Read one response; returns its status and whether the socket stays open"""
+        head = await reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        status = int(lines[0].split()[1])
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip().lower()
+
+        if 'content-length' in headers:
+            await reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            await reader.read()
+            return status, False
+        return status, headers.get('connection') != 'close'
@@ -0,0 +1,186 @@
+import glob
+import gzip
+import json
+import os
+import statistics
+import sys
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from listings import profiling
+
+
+class Command(BaseCommand):
+    help = 'Aggregate sampling profiler captures into the hottest frames, slowest routes and heaviest SQL'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dir',
+            default=None,
+            help='Directory of captures (default: PROFILING_DIR)'
+        )
+        parser.add_argument(
+            '--kind',
+            choices=['request', 'task'],
+            help='Only requests or only tasks'
+        )
+        parser.add_argument(
+            '--name',
+            help='Only captures whose route or task name contains this text'
+        )
+        parser.add_argument(
+            '--hours',
+            type=float,
+            help='Only captures from the last N hours'
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=20,
+            help='Rows per table (default: 20)'
+        )
+        parser.add_argument(
+            '--lines',
+            action='store_true',
+            help='Rank individual lines instead of whole functions'
+        )
+        parser.add_argument(
+            '--folded',
+            help='Also write the merged stacks to this file in the folded format flame graph tools read'
+        )
+
+    def handle(self, *args, **options):
+        captures = self.load(options)
+        if not captures:
+            raise CommandError('No matching captures.')
+
+        self.project = os.path.join(str(settings.BASE_DIR), '')
+        self.profiler = profiling.__file__
+        self.prefixes = sorted(
+            {os.path.join(path, '') for path in sys.path + [str(settings.BASE_DIR)] if path},
+            key=len, reverse=True,
+        )
+        self.names = {}
+        self.by_line = options['lines']
+        top = options['top']
+
+        self.report_names(captures, top)
+        self.report_frames(captures, top)
+        self.report_sql(captures, top)
+        if options['folded']:
+            self.write_folded(captures, options['folded'])
+
+    def load(self, options):
+        directory = options['dir'] or settings.PROFILING_DIR
+        since = timezone.now() - timedelta(hours=options['hours']) if options['hours'] else None
+        captures = []
+        for path in sorted(glob.glob(os.path.join(directory, '*.json.gz'))):
+            try:
+                with gzip.open(path, 'rt', encoding='utf-8') as source:
+                    capture = json.load(source)
+            except (OSError, ValueError):
+                self.stderr.write(self.style.WARNING(f'Skipping unreadable {path}'))
+                continue
+            if options['kind'] and capture['kind'] != options['kind']:
+                continue
+            if options['name'] and options['name'] not in capture['name']:
+                continue
+            if since and datetime.fromisoformat(capture['started_at']) < since:
+                continue
+            captures.append(capture)
+        return captures
+
+    def frame(self, raw):
+        """``file:line:function`` shortened to a module path, with or without the line"""
+        name = self.names.get(raw)
+        if name is None:
+            filename, line, function = raw.rsplit(':', 2)
+            for prefix in self.prefixes:
+                if filename.startswith(prefix):
+                    filename = filename[len(prefix):]
+                    break
+            name = f'{filename}:{line} {function}' if self.by_line else f'{filename} {function}'
+            self.names[raw] = name
+        return name
+
+    def report_names(self, captures, top):
+        groups = defaultdict(list)
+        for capture in captures:
+            groups[(capture['kind'], capture['name'])].append(capture)
+
+        self.stdout.write(self.style.SUCCESS(f'{len(captures)} captures'))
+        self.stdout.write(f'  {"name":<48} {"runs":>5} {"mean ms":>9} {"max ms":>9} {"queries":>8} {"sql ms":>8}')
+        rows = sorted(groups.items(), key=lambda item: sum(c['duration'] for c in item[1]), reverse=True)
+        for (kind, name), group in rows[:top]:
+            with_sql = [c['sql'] for c in group if c.get('sql')]
+            self.stdout.write(
+                f'  {name[:48]:<48} {len(group):>5} '
+                f'{statistics.mean(c["duration"] for c in group) * 1000:>9.1f} '
+                f'{max(c["duration"] for c in group) * 1000:>9.1f} '
+                + (
+                    f'{statistics.mean(s["queries"] for s in with_sql):>8.1f} '
+                    f'{statistics.mean(s["time"] for s in with_sql) * 1000:>8.1f}'
+                    if with_sql else f'{"-":>8} {"-":>8}'
+                )
+            )
+
+    def report_frames(self, captures, top):
+        """
+        Frames by estimated seconds spent in them, and the project's code
+        by time spent in it or in the libraries it called: each sample is
+        charged to the innermost project frame on its stack.
+        """
+        own = Counter()
+        project = Counter()
+        seconds = 0.0
+        for capture in captures:
+            interval = capture['interval']
+            for frames, count in capture['stacks']:
+                # Samples taken while the capture was being finished are the profiler's own.
+                if any(raw.startswith(self.profiler) and raw.endswith(':finish') for raw in frames):
+                    continue
+                weight = count * interval
+                seconds += weight
+                own[self.frame(frames[-1])] += weight
+                caller = next(
+                    (raw for raw in reversed(frames) if raw.startswith(self.project) and not raw.startswith(self.profiler)),
+                    None,
+                )
+                if caller:
+                    project[self.frame(caller)] += weight
+        if not seconds:
+            self.stdout.write('\nNo samples; captures were shorter than the sampling interval.')
+            return
+
+        for title, counter in (('frames', own), ('project frames, including the calls they make', project)):
+            self.stdout.write(self.style.SUCCESS(f'\nHottest {title} ({seconds:.2f}s sampled)'))
+            for name, spent in counter.most_common(top):
+                self.stdout.write(f'  {spent / seconds:>6.1%} {spent:>8.3f}s  {name}')
+
+    def report_sql(self, captures, top):
+        statements = defaultdict(lambda: [0, 0.0])
+        for capture in captures:
+            for statement in (capture.get('sql') or {}).get('top', []):
+                entry = statements[statement['sql']]
+                entry[0] += statement['count']
+                entry[1] += statement['time']
+        if not statements:
+            return
+
+        self.stdout.write(self.style.SUCCESS('\nHeaviest SQL (from each capture\'s top statements)'))
+        rows = sorted(statements.items(), key=lambda item: item[1][1], reverse=True)
+        for sql, (count, spent) in rows[:top]:
+            self.stdout.write(f'  {spent * 1000:>9.1f}ms {count:>6}x  {sql[:150]}')
+
+    def write_folded(self, captures, path):
+        merged = Counter()
+        for capture in captures:
+            for frames, count in capture['stacks']:
+                merged[';'.join(self.frame(raw).replace(';', ':') for raw in frames)] += count
+        with open(path, 'w') as output:
+            for stack, count in merged.most_common():
+                output.write(f'{stack} {count}\n')
+        self.stdout.write(f'\nWrote {len(merged)} stacks to {path}')
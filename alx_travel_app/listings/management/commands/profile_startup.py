@@ -0,0 +1,145 @@
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+# What each kind of process imports before it can serve its first unit of work.
+TARGETS = {
+    'django': 'import django; django.setup()',
+    'web': (
+        'import alx_travel_app.wsgi; '
+        'from django.urls import get_resolver; get_resolver().url_patterns'
+    ),
+    'worker': (
+        'from alx_travel_app.celery import app; '
+        'app.loader.import_default_modules()'
+    ),
+}
+
+# Modules a target must not import: workers and management commands never
+# serve a request, so DRF's serializers and responses (and the requests
+# library they pull in) are only imported inside the code that serves one.
+NOT_IMPORTED = {
+    'django': ('rest_framework.serializers', 'rest_framework.response', 'requests', 'drf_yasg'),
+    'worker': ('rest_framework.serializers', 'rest_framework.response', 'requests', 'drf_yasg'),
+}
+
+# Appended to each target: the child prints its own peak RSS in kB. The
+# parent cannot use ru_maxrss for this, because on Linux a child's peak
+# includes the memory it shared with the parent before exec.
+REPORT_PEAK_RSS = """
+import resource, sys
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // (1024 if sys.platform == 'darwin' else 1)
+if sys.platform == 'linux':
+    with open('/proc/self/status') as status:
+        peak = next((line.split()[1] for line in status if line.startswith('VmHWM:')), peak)
+print(peak)
+"""
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def import_chain(imports, index):
+    """The module at ``index`` and the modules that imported it, up to the first-level import"""
+    # -X importtime reports a module after everything it imported.
+    module, _, _, depth = imports[index]
+    chain = [module]
+    for parent, _, _, parent_depth in imports[index + 1:]:
+        if depth == 0:
+            break
+        if parent_depth < depth:
+            chain.append(parent)
+            depth = parent_depth
+    return chain
+
+
+class Command(BaseCommand):
+    help = (
+        'Start a fresh interpreter with -X importtime and report where boot time and memory go; '
+        'fails if the process imports modules it should only import on use'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target',
+            choices=sorted(TARGETS),
+            default='web',
+            help='Process to profile (default: web)'
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=20,
+            help='Number of modules to list (default: 20)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Fresh interpreters to start; wall time is the median (default: 5)'
+        )
+        parser.add_argument(
+            '--budget',
+            type=float,
+            help='Fail if startup takes longer than this many milliseconds'
+        )
+
+    def handle(self, *args, **options):
+        timings = []
+        peaks = []
+        for _ in range(max(options['repeat'], 1)):
+            began = time.perf_counter()
+            result = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', TARGETS[options['target']] + '\n' + REPORT_PEAK_RSS],
+                env=os.environ.copy(),
+                capture_output=True,
+                text=True,
+            )
+            timings.append((time.perf_counter() - began) * 1000)
+            if result.returncode:
+                raise CommandError(f'Startup failed:\n{result.stderr[-2000:]}')
+            peaks.append(int(result.stdout.split()[-1]) / 1024)
+        elapsed_ms = statistics.median(timings)
+        rss_mb = statistics.median(peaks)
+
+        imports = []
+        for line in result.stderr.splitlines():
+            match = IMPORT_LINE.match(line)
+            if match:
+                own, cumulative, indent, module = match.groups()
+                imports.append((module, int(own), int(cumulative), len(indent) // 2))
+
+        top_level = {}
+        for module, own, cumulative, depth in imports:
+            package = module.split('.')[0]
+            top_level[package] = top_level.get(package, 0) + own
+
+        self.stdout.write(
+            f"{options['target']}: {elapsed_ms:.0f}ms wall (median of {len(timings)}), {rss_mb:.1f}MB peak RSS, "
+            f'{len(imports)} modules imported'
+        )
+        self.stdout.write('\nSlowest packages (own import time of all their modules):')
+        for package, own in sorted(top_level.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f'{own / 1000:>10.1f}ms  {package}')
+        self.stdout.write('\nSlowest first-level imports (including what they import):')
+        roots = [entry for entry in imports if entry[3] == 0]
+        for module, own, cumulative, depth in sorted(roots, key=lambda entry: -entry[2])[:options['top']]:
+            self.stdout.write(f'{cumulative / 1000:>10.1f}ms  {module}')
+
+        unwanted = [
+            ' <- '.join(import_chain(imports, index))
+            for index, (module, _, _, _) in enumerate(imports)
+            if module in NOT_IMPORTED.get(options['target'], ())
+        ]
+        if unwanted:
+            raise CommandError('Imported at startup, but should only be imported on use:\n' + '\n'.join(unwanted))
+
+        if options['budget'] is not None:
+            if elapsed_ms > options['budget']:
+                raise CommandError(f"Startup took {elapsed_ms:.0f}ms, over the {options['budget']:.0f}ms budget.")
+            self.stdout.write(self.style.SUCCESS(f"Within the {options['budget']:.0f}ms budget."))
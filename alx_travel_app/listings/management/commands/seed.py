@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
 from listings.models import Listing, Review, Booking
+from listings.pricing import quote_listing
 from decimal import Decimal
 from datetime import date, timedelta
 import random
@@ -249,12 +250,12 @@ class Command(BaseCommand):
                 duration = random.randint(1, 14)  # 1-14 days
                 end_date = start_date + timedelta(days=duration)
                 
-                # Calculate total price (listing price * duration)
-                total_price = listing.price * duration
-                
                 # Random number of guests (1-6)
                 guests = random.randint(1, 6)
                 
+                # Price the stay with the same engine the API uses
+                total_price = quote_listing(listing, start_date, end_date, guests).total
+                
                 # Random status
                 status = random.choice(['pending', 'confirmed', 'cancelled', 'completed'])
                 
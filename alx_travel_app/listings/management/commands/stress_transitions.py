@@ -0,0 +1,144 @@
+import statistics
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+from listings import transitions
+from listings.models import Booking, Listing
+
+# Half the threads of each round try one, half the other.
+TARGETS = ('confirmed', 'cancelled')
+
+
+class Command(BaseCommand):
+    help = (
+        'Race many threads to change the status of one booking, round after round, and fail '
+        'unless each round has exactly one winner'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=16,
+            help='Threads racing in each round (default: 16)'
+        )
+        parser.add_argument(
+            '--rounds',
+            type=int,
+            default=50,
+            help='Rounds, each starting from a pending booking (default: 50)'
+        )
+        parser.add_argument(
+            '--naive',
+            action='store_true',
+            help='Use a plain read-modify-save() instead, to show the updates it loses'
+        )
+
+    def handle(self, *args, **options):
+        if options['threads'] < 2:
+            raise CommandError('It takes at least two threads to race.')
+        booking = self.create_booking()
+        try:
+            self.race(booking.pk, options['threads'], options['rounds'], options['naive'])
+        finally:
+            Booking.objects.filter(pk=booking.pk).delete()
+            self.stdout.write('Stress booking deleted.')
+
+    def create_booking(self):
+        listing = Listing.objects.filter(is_active=True).first()
+        user = User.objects.filter(is_active=True).first()
+        if listing is None or user is None:
+            raise CommandError('No active listing or user; run the seed command first.')
+        marker = f'stress_transitions {uuid.uuid4().hex}'
+        check_in = timezone.now().date() + timedelta(days=3650)
+        # bulk_create sends no signals, so the booking never counts towards trending.
+        Booking.objects.bulk_create([Booking(
+            listing=listing,
+            user=user,
+            check_in_date=check_in,
+            check_out_date=check_in + timedelta(days=1),
+            total_price=listing.price,
+            special_requests=marker,
+        )])
+        return Booking.objects.get(special_requests=marker)
+
+    def race(self, pk, threads, rounds, naive):
+        outcomes = Counter()
+        timings = []
+        bad_rounds = []
+        targets = [TARGETS[index % 2] for index in range(threads)]
+        attempt = self.save_naively if naive else self.move
+        began = time.perf_counter()
+        for number in range(1, rounds + 1):
+            # Start each round from pending; this reset is not a transition.
+            Booking.objects.filter(pk=pk).update(status='pending', version=F('version') + 1)
+            before = Booking.objects.values_list('version', flat=True).get(pk=pk)
+
+            barrier = threading.Barrier(threads)
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                results = list(pool.map(lambda target: self.contend(pk, target, barrier, attempt), targets))
+            outcomes.update(outcome for outcome, _ in results)
+            timings.extend(elapsed for _, elapsed in results)
+
+            status, version = Booking.objects.values_list('status', 'version').get(pk=pk)
+            winners = [target for (outcome, _), target in zip(results, targets) if outcome == 'moved']
+            consistent = (
+                len(winners) == 1 and status == winners[0] and (naive or version == before + 1)
+            )
+            if not consistent:
+                bad_rounds.append(number)
+        elapsed = time.perf_counter() - began
+
+        attempts = threads * rounds
+        self.stdout.write(
+            f'{threads} threads x {rounds} rounds ({"plain save()" if naive else "conditional UPDATE"}): '
+            + ', '.join(f'{count} {outcome}' for outcome, count in sorted(outcomes.items()))
+        )
+        self.stdout.write(
+            f'  {attempts / elapsed:.0f} attempts/s, p50 {statistics.median(timings):.2f}ms, '
+            f'p99 {sorted(timings)[int(len(timings) * 0.99) - 1]:.2f}ms per attempt'
+        )
+        if naive:
+            lost = outcomes['moved'] - rounds
+            self.stdout.write(self.style.WARNING(
+                f'  {lost} writes believed they won but were overwritten; '
+                f'{len(bad_rounds)} of {rounds} rounds had more than one winner.'
+            ))
+        elif bad_rounds:
+            raise CommandError(f'Rounds without exactly one winner: {", ".join(map(str, bad_rounds))}')
+        else:
+            self.stdout.write(self.style.SUCCESS('  Every round had exactly one winner; no update was lost.'))
+
+    def contend(self, pk, target, barrier, attempt):
+        """Read the booking, wait until every thread has, then try to move it; returns (outcome, ms)"""
+        try:
+            booking = Booking.objects.get(pk=pk)
+            barrier.wait()
+            began = time.perf_counter()
+            outcome = attempt(booking, target)
+            return outcome, (time.perf_counter() - began) * 1000
+        finally:
+            connection.close()
+
+    def move(self, booking, target):
+        try:
+            transitions.move(booking, target)
+        except transitions.StatusConflict:
+            return 'conflict'
+        except transitions.InvalidTransition:
+            return 'invalid'
+        return 'moved'
+
+    def save_naively(self, booking, target):
+        booking.status = target
+        booking.save()
+        return 'moved'
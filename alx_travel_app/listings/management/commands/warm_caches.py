@@ -0,0 +1,85 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from listings import warming
+from listings.models import JobCheckpoint
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay the most read anonymous listing queries into the response cache, '
+        'or report the cache hit rate over time'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top',
+            type=int,
+            help='Queries to warm (default: WARMING_TOP_QUERIES)'
+        )
+        parser.add_argument(
+            '--hours',
+            type=int,
+            help='Rank queries by reads over the last N hours (default: WARMING_LOOKBACK_HOURS); '
+                 'with --report, the hours to report'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            help='Requests in flight at once (default: WARMING_CONCURRENCY)'
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            help='Requests started per second at most (default: WARMING_RATE)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='List the queries that would be warmed without requesting them'
+        )
+        parser.add_argument(
+            '--report',
+            action='store_true',
+            help='Show the hit rate per stats bucket instead of warming'
+        )
+
+    def handle(self, *args, **options):
+        if options['report']:
+            return self.report(options['hours'] or 6)
+        if options['dry_run']:
+            for query in warming.popular_queries(options['top'], options['hours']):
+                self.stdout.write(query)
+            return
+
+        result = warming.run(options['top'], options['hours'], options['concurrency'], options['rate'])
+        if result.schema_built:
+            self.stdout.write('Built the schema artifacts for this version')
+        outcomes = result.outcomes
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed {outcomes['warmed']} of {len(result.queries)} queries in {result.seconds:.1f}s "
+            f"({outcomes['already cached']} already cached, {outcomes['failed']} failed)"
+        ))
+        self.stdout.write(f'{result.cached} of them are in the cache now')
+        if outcomes['failed']:
+            raise CommandError(f"{outcomes['failed']} queries could not be warmed; see the log.")
+
+    def report(self, hours):
+        rows = warming.hit_rates(hours)
+        if not rows:
+            raise CommandError(f'No cached reads recorded in the last {hours} hours.')
+        warmed_at = (
+            JobCheckpoint.objects.filter(name=warming.CHECKPOINT_NAME)
+            .values_list('last_run_at', flat=True).first()
+        )
+        self.stdout.write(f'  {"bucket":<17} {"reads":>8} {"hits":>8} {"hit rate":>9}')
+        for bucket, hits, misses in rows:
+            reads = hits + misses
+            end = bucket + timedelta(seconds=settings.CACHE_STATS_BUCKET_SECONDS)
+            marker = '  <- last warm-up' if warmed_at and bucket <= warmed_at < end else ''
+            self.stdout.write(
+                f'  {timezone.localtime(bucket):%Y-%m-%d %H:%M} {reads:>8} {hits:>8} '
+                f'{hits / reads if reads else 0:>9.1%}{marker}'
+            )
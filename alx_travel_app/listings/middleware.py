@@ -0,0 +1,127 @@
+import gzip
+import math
+import re
+
+import brotli
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+COMPRESSIBLE_TYPES = re.compile(r'^(text/|application/(json|javascript|xml|yaml)|[^;]*\+json)')
+# Event streams must reach the client as soon as each event is written.
+UNCOMPRESSED_TYPES = ('text/event-stream',)
+
+
+def accepted_encodings(header):
+    """Encodings from an Accept-Encoding header with a non-zero quality"""
+    encodings = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        match = re.search(r'q=([0-9.]+)', params)
+        if match:
+            try:
+                quality = float(match.group(1))
+            except ValueError:
+                quality = 0.0
+        if name:
+            encodings[name.strip().lower()] = quality
+    return {name for name, quality in encodings.items() if quality > 0}
+
+
+def compress_response(request, response):
+    """Compress ``response`` with brotli or gzip if the client accepts it"""
+    content_type = response.get('Content-Type', '')
+    if (
+        response.streaming
+        or response.has_header('Content-Encoding')
+        or not COMPRESSIBLE_TYPES.match(content_type)
+        or content_type.startswith(UNCOMPRESSED_TYPES)
+    ):
+        return response
+    # The body depends on Accept-Encoding even when this one is not compressed.
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+        return response
+
+    accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+    if 'br' in accepted:
+        encoding = 'br'
+        content = brotli.compress(response.content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    elif 'gzip' in accepted:
+        encoding = 'gzip'
+        content = gzip.compress(response.content, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+    else:
+        return response
+    if len(content) >= len(response.content):
+        return response
+
+    response.content = content
+    response['Content-Length'] = str(len(content))
+    response['Content-Encoding'] = encoding
+    # The compressed bytes differ from the ones a strong ETag promised.
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response['ETag'] = 'W/' + etag
+    return response
+
+
+class CompressionMiddleware:
+    """
+    Negotiated brotli or gzip compression for responses over
+    ``COMPRESSION_MIN_SIZE`` bytes.
+
+    Works in both sync and async stacks, so native async views do not pay
+    for a thread hop here.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return compress_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return compress_response(request, await self.get_response(request))
+
+
+def add_rate_limit_headers(request, response):
+    """Describe the most restrictive bucket the request drew from"""
+    states = getattr(request, 'rate_limits', None)
+    if not states:
+        return response
+    state = min(states, key=lambda state: (state.remaining, -state.reset))
+    response['RateLimit-Limit'] = str(state.limit)
+    response['RateLimit-Remaining'] = str(state.remaining)
+    response['RateLimit-Reset'] = str(math.ceil(state.reset))
+    if not state.allowed and not response.has_header('Retry-After'):
+        response['Retry-After'] = str(math.ceil(state.wait))
+    return response
+
+
+class RateLimitHeadersMiddleware:
+    """
+    ``RateLimit-Limit``, ``-Remaining`` and ``-Reset`` headers for requests
+    checked by the token-bucket throttles in ``listings.throttling``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return add_rate_limit_headers(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return add_rate_limit_headers(request, await self.get_response(request))
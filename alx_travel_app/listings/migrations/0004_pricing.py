@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0003_payment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='extra_guest_fee',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Surcharge per night for each guest above included_guests', max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='included_guests',
+            field=models.PositiveIntegerField(default=1, help_text='Guests covered by the nightly price'),
+        ),
+        migrations.CreateModel(
+            name='RateRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('start_date', models.DateField(blank=True, help_text='First night the rule applies to; blank for no lower bound', null=True)),
+                ('end_date', models.DateField(blank=True, help_text='Last night the rule applies to; blank for no upper bound', null=True)),
+                ('weekdays', models.CharField(blank=True, help_text='Comma-separated ISO weekdays (1=Monday ... 7=Sunday); blank for every day', max_length=13)),
+                ('multiplier', models.DecimalField(decimal_places=3, max_digits=5)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rate_rules', to='listings.listing')),
+            ],
+            options={
+                'ordering': ['listing', 'start_date'],
+                'constraints': [models.CheckConstraint(condition=models.Q(('multiplier__gt', 0)), name='positive_rate_multiplier')],
+            },
+        ),
+    ]
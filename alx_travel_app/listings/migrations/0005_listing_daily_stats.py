@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0004_pricing'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ListingDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('nights_booked', models.PositiveIntegerField(default=0)),
+                ('revenue_pending', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('revenue_confirmed', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('revenue_completed', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('revenue_cancelled', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('new_reviews', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('host', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='listing_daily_stats', to=settings.AUTH_USER_MODEL)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='listings.listing')),
+            ],
+            options={
+                'ordering': ['listing', 'date'],
+                'indexes': [models.Index(fields=['host', 'date'], name='listing_stats_host_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('listing', 'date'), name='unique_listing_daily_stats')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0005_listing_daily_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingPopularity',
+            fields=[
+                ('listing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='listings.listing')),
+                ('listing_type', models.CharField(choices=[('hotel', 'Hotel'), ('apartment', 'Apartment'), ('activity', 'Activity'), ('restaurant', 'Restaurant')], max_length=20)),
+                ('location', models.CharField(max_length=100)),
+                ('is_active', models.BooleanField(default=True)),
+                ('score', models.FloatField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'listing popularity',
+                'ordering': ['-score'],
+                'indexes': [models.Index(fields=['is_active', '-score'], name='popularity_score_idx'), models.Index(fields=['is_active', 'listing_type', '-score'], name='popularity_type_score_idx'), models.Index(fields=['is_active', 'location', '-score'], name='popularity_location_score_idx'), models.Index(fields=['is_active', 'listing_type', 'location', '-score'], name='popularity_type_loc_score_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:27
+
+from django.db import migrations, models
+from django.db.models import Avg, Count
+
+
+def summarise_existing_reviews(apps, schema_editor):
+    """Fill in the rating columns"""
+    Listing = apps.get_model('listings', 'Listing')
+    Review = apps.get_model('listings', 'Review')
+
+    summaries = Review.objects.values('listing_id').annotate(count=Count('id'), average=Avg('rating'))
+    batch = []
+    for summary in summaries.order_by('listing_id').iterator(chunk_size=2000):
+        batch.append(Listing(pk=summary['listing_id'], review_count=summary['count'], average_rating=summary['average']))
+        if len(batch) == 2000:
+            Listing.objects.bulk_update(batch, ['review_count', 'average_rating'])
+            batch = []
+    Listing.objects.bulk_update(batch, ['review_count', 'average_rating'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0008_archived_booking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='average_rating',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(summarise_existing_reviews, migrations.RunPython.noop),
+        # Reviews written before this migration were already notified (or
+        # never will be), so they start out processed; new ones default to not.
+        migrations.AddField(
+            model_name='review',
+            name='processed',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='processed',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['processed', 'id'], name='review_processed_idx'),
+        ),
+    ]
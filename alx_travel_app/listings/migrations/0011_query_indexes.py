@@ -0,0 +1,79 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0010_exchange_rates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='listingpopularity',
+            name='popularity_score_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='listingpopularity',
+            name='popularity_type_score_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='listingpopularity',
+            name='popularity_location_score_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='listingpopularity',
+            name='popularity_type_loc_score_idx',
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['listing', 'status', 'check_in_date'], name='booking_listing_status_in_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', '-created_at'], name='booking_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['-created_at', 'is_active'], name='listing_created_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['listing_type', '-created_at', 'is_active'], name='listing_type_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['location', '-created_at', 'is_active'], name='listing_location_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['price', 'is_active'], name='listing_price_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listingpopularity',
+            index=models.Index(fields=['-score', 'is_active'], name='popularity_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listingpopularity',
+            index=models.Index(fields=['listing_type', '-score', 'is_active'], name='popularity_type_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listingpopularity',
+            index=models.Index(fields=['location', '-score', 'is_active'], name='popularity_location_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listingpopularity',
+            index=models.Index(fields=['listing_type', 'location', '-score', 'is_active'], name='popularity_type_loc_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['listing', '-created_at'], name='review_listing_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['-created_at'], name='review_created_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0011_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheAccessStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('query', models.CharField(max_length=500)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('misses', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'cache access stats',
+                'constraints': [models.UniqueConstraint(fields=('bucket', 'query'), name='unique_cache_stats_bucket_query')],
+            },
+        ),
+    ]
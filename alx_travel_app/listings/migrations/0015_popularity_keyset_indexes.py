@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0014_stale_stats_range'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='listingpopularity',
+            name='popularity_score_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='listingpopularity',
+            name='popularity_type_score_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='listingpopularity',
+            name='popularity_location_score_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='listingpopularity',
+            name='popularity_type_loc_score_idx',
+        ),
+        migrations.AddIndex(
+            model_name='listingpopularity',
+            index=models.Index(fields=['-score', '-listing', 'is_active'], name='popularity_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listingpopularity',
+            index=models.Index(fields=['listing_type', '-score', '-listing', 'is_active'], name='popularity_type_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listingpopularity',
+            index=models.Index(fields=['location', '-score', '-listing', 'is_active'], name='popularity_location_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listingpopularity',
+            index=models.Index(fields=['listing_type', 'location', '-score', '-listing', 'is_active'], name='popularity_type_loc_score_idx'),
+        ),
+    ]
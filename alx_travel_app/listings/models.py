@@ -1,3 +1,4 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.contrib.auth.models import User
 
@@ -12,23 +13,105 @@ class Listing(models.Model):
         ('restaurant', 'Restaurant'),
     ]
     
+    # The currencies Chapa takes payments in.
+    CURRENCIES = [
+        ('ETB', 'Ethiopian Birr'),
+        ('USD', 'US Dollar'),
+    ]
+    
     title = models.CharField(max_length=200)
     description = models.TextField()
     listing_type = models.CharField(max_length=20, choices=LISTING_TYPES)
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.CharField(
+        max_length=3, choices=CURRENCIES, default='ETB',
+        help_text='ISO 4217 code of price, extra_guest_fee and the booking totals'
+    )
     location = models.CharField(max_length=100)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='listings')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    included_guests = models.PositiveIntegerField(
+        default=1,
+        help_text='Guests covered by the nightly price'
+    )
+    extra_guest_fee = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0,
+        help_text='Surcharge per night for each guest above included_guests'
+    )
+    # Kept up to date from the reviews by listings.reviews, a few seconds behind
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    average_rating = models.FloatField(default=0, editable=False)
     
     class Meta:
         ordering = ['-created_at']
+        # The public listing pages: active listings newest first, optionally
+        # narrowed to one type or location, or by price. is_active goes last:
+        # nearly every listing is active, so it narrows nothing up front, and
+        # SQLite compiles is_active=True to a bare column test it cannot seek
+        # on, which would cost the index its order. At the end it still lets
+        # the filter and page counts be answered from the index.
+        # check_query_plans keeps these honest.
+        indexes = [
+            models.Index(fields=['-created_at', 'is_active'], name='listing_created_active_idx'),
+            models.Index(fields=['listing_type', '-created_at', 'is_active'], name='listing_type_created_idx'),
+            models.Index(fields=['location', '-created_at', 'is_active'], name='listing_location_created_idx'),
+            models.Index(fields=['price', 'is_active'], name='listing_price_active_idx'),
+        ]
         
     def __str__(self):
         return self.title
 
 
+class RateRule(models.Model):
+    """
+    Seasonal or weekday adjustment to a listing's nightly price.
+    
+    Every rule whose date range and weekdays match a night multiplies that
+    night's price, so a 1.2 high-season rule and a 1.1 weekend rule give
+    1.32 on weekend nights in high season.
+    """
+    
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='rate_rules')
+    name = models.CharField(max_length=100)
+    start_date = models.DateField(null=True, blank=True, help_text='First night the rule applies to; blank for no lower bound')
+    end_date = models.DateField(null=True, blank=True, help_text='Last night the rule applies to; blank for no upper bound')
+    weekdays = models.CharField(
+        max_length=13, blank=True,
+        help_text='Comma-separated ISO weekdays (1=Monday ... 7=Sunday); blank for every day'
+    )
+    multiplier = models.DecimalField(max_digits=5, decimal_places=3)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['listing', 'start_date']
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(multiplier__gt=0),
+                name='positive_rate_multiplier'
+            ),
+        ]
+    
+    def __str__(self):
+        return f'{self.listing.title} - {self.name} (x{self.multiplier})'
+    
+    def clean(self):
+        try:
+            days = self.weekday_set()
+        except ValueError:
+            days = None
+        if days is None or not days <= set(range(1, 8)):
+            raise ValidationError({'weekdays': 'Use comma-separated numbers from 1 (Monday) to 7 (Sunday).'})
+        if self.start_date and self.end_date and self.end_date < self.start_date:
+            raise ValidationError({'end_date': 'End date cannot be before start date.'})
+    
+    def weekday_set(self):
+        """Return the ISO weekdays this rule applies to, empty for all days"""
+        return {int(day) for day in self.weekdays.split(',') if day.strip()}
+
+
 class Review(models.Model):
     """Review model for listings"""
     
@@ -45,10 +128,19 @@ class Review(models.Model):
     rating = models.IntegerField(choices=RATING_CHOICES)
     comment = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Set by listings.reviews once the rating and the owner's email took the review in
+    processed = models.BooleanField(default=False, editable=False)
     
     class Meta:
         unique_together = ('listing', 'reviewer')
         ordering = ['-created_at']
+        indexes = [
+            # A listing's reviews newest first, and the latest reviews overall.
+            models.Index(fields=['listing', '-created_at'], name='review_listing_created_idx'),
+            models.Index(fields=['-created_at'], name='review_created_idx'),
+            # The review job's queue, oldest first.
+            models.Index(fields=['processed', 'id'], name='review_processed_idx'),
+        ]
         
     def __str__(self):
         return f'{self.reviewer.username} - {self.listing.title} ({self.rating} stars)'
@@ -71,6 +163,8 @@ class Booking(models.Model):
     number_of_guests = models.PositiveIntegerField(default=1)
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    # Bumped by every write through listings.transitions; guards against lost updates.
+    version = models.PositiveIntegerField(default=0, editable=False)
     special_requests = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -91,6 +185,14 @@ class Booking(models.Model):
                 name='non_negative_price'
             ),
         ]
+        indexes = [
+            # Lets the archive job find old finished stays without a scan.
+            models.Index(fields=['status', 'check_out_date'], name='booking_status_check_out_idx'),
+            # Overlap checks: a listing's blocking bookings around some dates.
+            models.Index(fields=['listing', 'status', 'check_in_date'], name='booking_listing_status_in_idx'),
+            # A user's bookings newest first.
+            models.Index(fields=['user', '-created_at'], name='booking_user_created_idx'),
+        ]
         
     def __str__(self):
         return f'{self.user.username} - {self.listing.title} ({self.check_in_date} to {self.check_out_date})'
@@ -111,8 +213,208 @@ class Payment(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     transaction_id = models.CharField(max_length=100, unique=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    version = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Payment for {self.booking} - {self.status}"
+
+
+class ArchivedBooking(models.Model):
+    """
+    A finished booking moved out of ``Booking`` by the archive job.
+    
+    Keeps the booking's id and columns, plus its payment flattened into
+    ``payment_*`` columns, so ``Booking`` only holds the hot set that live
+    queries scan. A user's full history reads both tables.
+    """
+    
+    id = models.BigIntegerField(primary_key=True)
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='archived_bookings')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_bookings')
+    check_in_date = models.DateField()
+    check_out_date = models.DateField()
+    number_of_guests = models.PositiveIntegerField()
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20, choices=Booking.STATUS_CHOICES)
+    special_requests = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    payment_id = models.BigIntegerField(null=True, blank=True)
+    payment_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    payment_transaction_id = models.CharField(max_length=100, blank=True, db_index=True)
+    payment_status = models.CharField(max_length=20, choices=Payment.STATUS_CHOICES, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='archived_booking_user_idx'),
+        ]
+    
+    def __str__(self):
+        return f'{self.user_id} - {self.listing_id} ({self.check_in_date} to {self.check_out_date}, archived)'
+    
+    def duration_days(self):
+        """Calculate the duration of the booking in days"""
+        return (self.check_out_date - self.check_in_date).days
+
+
+class ListingPopularity(models.Model):
+    """
+    Time-decayed popularity of a listing, kept sorted for the trending endpoint.
+    
+    ``score`` is the natural log of the sum of event weights, each scaled up
+    by 2 ** (age since a fixed epoch / half-life). Newer events therefore
+    count more, and ordering by ``score`` equals ordering by the decayed
+    popularity at any moment, without rewriting old rows as time passes.
+    ``listing_type``, ``location`` and ``is_active`` are copied from the
+    listing so every trending query is a single index range scan.
+    """
+    
+    listing = models.OneToOneField(
+        Listing, on_delete=models.CASCADE, primary_key=True, related_name='popularity'
+    )
+    listing_type = models.CharField(max_length=20, choices=Listing.LISTING_TYPES)
+    location = models.CharField(max_length=100)
+    is_active = models.BooleanField(default=True)
+    score = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-score']
+        verbose_name_plural = 'listing popularity'
+        indexes = [
+            # The listing breaks ties between equal scores, for keyset pages.
+            models.Index(fields=['-score', '-listing', 'is_active'], name='popularity_score_idx'),
+            models.Index(fields=['listing_type', '-score', '-listing', 'is_active'], name='popularity_type_score_idx'),
+            models.Index(fields=['location', '-score', '-listing', 'is_active'], name='popularity_location_score_idx'),
+            models.Index(
+                fields=['listing_type', 'location', '-score', '-listing', 'is_active'],
+                name='popularity_type_loc_score_idx'
+            ),
+        ]
+    
+    def __str__(self):
+        return f'{self.listing_id}: {self.score:.3f}'
+
+
+class SimilarListing(models.Model):
+    """
+    Precomputed nearest neighbour of a listing.
+    
+    Written in bulk by the ``compute_similar_listings`` task; ``rank`` 0 is
+    the closest match. The (listing, rank) constraint doubles as the index
+    the similar-listings endpoint reads from.
+    """
+    
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='similar_entries')
+    similar = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    
+    class Meta:
+        ordering = ['listing', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['listing', 'rank'], name='unique_similar_listing_rank'),
+        ]
+    
+    def __str__(self):
+        return f'{self.listing_id} ~ {self.similar_id} ({self.score:.3f})'
+
+
+class ListingDailyStats(models.Model):
+    """
+    Per-listing, per-day rollup of bookings and reviews for host analytics.
+    
+    Rows are rebuilt from ``Booking`` and ``Review`` by the
+    ``rollup_listing_stats`` task. Days without any activity have no row.
+    ``host`` duplicates ``listing.created_by`` so a host's dashboard is a
+    single range scan on the (host, date) index.
+    """
+    
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='daily_stats')
+    host = models.ForeignKey(User, on_delete=models.CASCADE, related_name='listing_daily_stats')
+    date = models.DateField()
+    nights_booked = models.PositiveIntegerField(default=0)
+    revenue_pending = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    revenue_confirmed = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    revenue_completed = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    revenue_cancelled = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    new_reviews = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['listing', 'date']
+        constraints = [
+            models.UniqueConstraint(fields=['listing', 'date'], name='unique_listing_daily_stats'),
+        ]
+        indexes = [
+            models.Index(fields=['host', 'date'], name='listing_stats_host_date_idx'),
+        ]
+    
+    def __str__(self):
+        return f'{self.listing_id} on {self.date}'
+
+
+class StaleStatsRange(models.Model):
+    """
+    Days of a listing whose ``ListingDailyStats`` rows lost activity.
+    
+    Moved, deleted and edited bookings and reviews leave no trace in the
+    rows the incremental rollup reads, so the days they used to count on
+    are recorded here in the same transaction and the next run rebuilds
+    and removes them. ``listing_id`` is not a foreign key, so a listing
+    deleted along with its bookings takes nothing else with it.
+    """
+    
+    listing_id = models.BigIntegerField()
+    first_day = models.DateField()
+    last_day = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f'{self.listing_id} from {self.first_day} to {self.last_day}'
+
+
+class JobCheckpoint(models.Model):
+    """Remembers when an incremental background job last completed"""
+    
+    name = models.CharField(max_length=100, unique=True)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f'{self.name} ({self.last_run_at})'
+
+
+class ExchangeRate(models.Model):
+    """Units of a currency per one FX_BASE_CURRENCY, kept by refresh_exchange_rates"""
+    
+    currency = models.CharField(max_length=3, unique=True)
+    rate = models.DecimalField(max_digits=20, decimal_places=10)
+    updated_at = models.DateTimeField()
+    
+    class Meta:
+        ordering = ['currency']
+    
+    def __str__(self):
+        return f'{self.currency} {self.rate}'
+
+
+class CacheAccessStats(models.Model):
+    """Anonymous reads of one normalized query in one time bucket, and how many the response cache served"""
+    
+    bucket = models.DateTimeField()
+    query = models.CharField(max_length=500)
+    hits = models.PositiveIntegerField(default=0)
+    misses = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        verbose_name_plural = 'cache access stats'
+        constraints = [
+            models.UniqueConstraint(fields=['bucket', 'query'], name='unique_cache_stats_bucket_query'),
+        ]
+    
+    def __str__(self):
+        return f'{self.query} at {self.bucket} ({self.hits} hits, {self.misses} misses)'
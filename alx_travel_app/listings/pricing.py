@@ -0,0 +1,196 @@
+"""
+Server-side price quotes for listings.
+
+A night costs ``Listing.price`` multiplied by every matching ``RateRule``,
+rounded to the cent. Guests above ``Listing.included_guests`` add
+``Listing.extra_guest_fee`` per guest per night.
+
+``RateCalendar`` precomputes the next ``CALENDAR_DAYS`` nights of a listing
+as prefix sums in integer cents, so pricing any stay inside that horizon is
+two list lookups. Calendars are cached in process (bounded LRU) and in the
+shared Django cache. The cache key contains the listing's ``updated_at``;
+saving a listing or one of its rate rules bumps it, so stale calendars are
+never read again.
+"""
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import RateRule
+
+
+CALENDAR_DAYS = 730
+
+# Listing columns a calendar depends on, for use with QuerySet.only().
+LISTING_FIELDS = ('id', 'price', 'included_guests', 'extra_guest_fee', 'updated_at')
+
+LOCAL_CACHE_SIZE = 1024
+SHARED_CACHE_TIMEOUT = 60 * 60 * 24
+
+_local_calendars = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def _to_cents(amount):
+    return int((Decimal(amount) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def _from_cents(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+class Quote:
+    """Price of one stay, broken down into nightly rates and guest surcharge"""
+
+    def __init__(self, listing_id, check_in, check_out, guests, nightly_cents, surcharge_cents):
+        self.listing_id = listing_id
+        self.check_in = check_in
+        self.check_out = check_out
+        self.guests = guests
+        self.nights = (check_out - check_in).days
+        self.nightly_subtotal = _from_cents(nightly_cents)
+        self.guest_surcharge = _from_cents(surcharge_cents)
+        self.total = _from_cents(nightly_cents + surcharge_cents)
+
+    def as_dict(self):
+        return {
+            'listing': self.listing_id,
+            'check_in_date': self.check_in,
+            'check_out_date': self.check_out,
+            'number_of_guests': self.guests,
+            'nights': self.nights,
+            'nightly_subtotal': str(self.nightly_subtotal),
+            'guest_surcharge': str(self.guest_surcharge),
+            'total_price': str(self.total),
+        }
+
+
+class RateCalendar:
+    """Precomputed nightly prices for one listing starting at ``start``"""
+
+    def __init__(self, listing, rules, start):
+        self.listing_id = listing.pk
+        self.start = start
+        self.base_cents = _to_cents(listing.price)
+        self.extra_guest_cents = _to_cents(listing.extra_guest_fee)
+        self.included_guests = listing.included_guests
+        self.rules = [
+            (rule.start_date, rule.end_date, frozenset(rule.weekday_set()), rule.multiplier)
+            for rule in rules
+        ]
+
+        running = 0
+        prefix = [0]
+        for offset in range(CALENDAR_DAYS):
+            running += self.night_cents(start + timedelta(days=offset))
+            prefix.append(running)
+        self.prefix = prefix
+
+    def night_cents(self, night):
+        """Price of a single night in cents"""
+        multiplier = Decimal(1)
+        weekday = night.isoweekday()
+        for start, end, weekdays, rule_multiplier in self.rules:
+            if start is not None and night < start:
+                continue
+            if end is not None and night > end:
+                continue
+            if weekdays and weekday not in weekdays:
+                continue
+            multiplier *= rule_multiplier
+        if multiplier == 1:
+            return self.base_cents
+        return int((self.base_cents * multiplier).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+    def nightly_cents(self, check_in, check_out):
+        """Sum of nightly prices for the nights from check-in up to check-out"""
+        first = (check_in - self.start).days
+        last = (check_out - self.start).days
+        if first >= 0 and last <= CALENDAR_DAYS:
+            return self.prefix[last] - self.prefix[first]
+        return sum(
+            self.night_cents(check_in + timedelta(days=offset))
+            for offset in range((check_out - check_in).days)
+        )
+
+    def quote(self, check_in, check_out, guests=1):
+        if check_out <= check_in:
+            raise ValueError('Check-out date must be after check-in date.')
+        nights = (check_out - check_in).days
+        extra_guests = max(guests - self.included_guests, 0)
+        return Quote(
+            self.listing_id, check_in, check_out, guests,
+            self.nightly_cents(check_in, check_out),
+            extra_guests * self.extra_guest_cents * nights,
+        )
+
+
+def _calendar_key(listing, today):
+    return f'pricing:calendar:{listing.pk}:{listing.updated_at.timestamp()}:{today.isoformat()}'
+
+
+def _remember(key, calendar):
+    with _local_lock:
+        _local_calendars[key] = calendar
+        _local_calendars.move_to_end(key)
+        while len(_local_calendars) > LOCAL_CACHE_SIZE:
+            _local_calendars.popitem(last=False)
+
+
+def _recall(key):
+    with _local_lock:
+        calendar = _local_calendars.get(key)
+        if calendar is not None:
+            _local_calendars.move_to_end(key)
+        return calendar
+
+
+def get_calendars(listings):
+    """
+    Return ``{listing_id: RateCalendar}`` for the given listings.
+
+    Calendars missing from both caches are built together with a single
+    ``RateRule`` query.
+    """
+    today = timezone.localdate()
+    keys = {_calendar_key(listing, today): listing for listing in listings}
+    calendars = {}
+    missing = {}
+    for key, listing in keys.items():
+        calendar = _recall(key)
+        if calendar is None:
+            missing[key] = listing
+        else:
+            calendars[listing.pk] = calendar
+
+    if missing:
+        for key, calendar in cache.get_many(list(missing)).items():
+            _remember(key, calendar)
+            calendars[missing.pop(key).pk] = calendar
+
+    if missing:
+        rules = {}
+        for rule in RateRule.objects.filter(listing_id__in=[listing.pk for listing in missing.values()]):
+            rules.setdefault(rule.listing_id, []).append(rule)
+        built = {}
+        for key, listing in missing.items():
+            calendar = RateCalendar(listing, rules.get(listing.pk, []), today)
+            _remember(key, calendar)
+            built[key] = calendar
+            calendars[listing.pk] = calendar
+        cache.set_many(built, SHARED_CACHE_TIMEOUT)
+
+    return calendars
+
+
+def get_calendar(listing):
+    return get_calendars([listing])[listing.pk]
+
+
+def quote_listing(listing, check_in, check_out, guests=1):
+    """Price a stay at ``listing``; raises ValueError for an empty stay"""
+    return get_calendar(listing).quote(check_in, check_out, guests)
@@ -0,0 +1,312 @@
+"""
+Opt-in sampling profiler for production requests and Celery tasks.
+
+While a request or task is profiled, a background thread reads the
+thread's stack from ``sys._current_frames()`` every ``PROFILING_INTERVAL``
+seconds and counts identical stacks. The profiled code itself is not
+instrumented, so it runs at close to full speed, and requests that are
+not profiled only pay for one random draw.
+
+What is profiled:
+
+* a ``PROFILING_SAMPLE_RATE`` fraction of requests under ``PROFILING_PATHS``;
+* any request whose ``X-Profile`` header matches ``PROFILING_TOKEN``; its
+  response names the capture in ``X-Profile-Id``;
+* the Celery tasks named in ``PROFILING_TASKS``, a
+  ``PROFILING_TASK_SAMPLE_RATE`` fraction of their runs.
+
+At most ``PROFILING_MAX_CONCURRENT`` captures run at once per process.
+Each one is written to ``PROFILING_DIR`` as gzipped JSON with the route or
+task name, timings and a summary of the SQL it ran; ``profile_report``
+aggregates them.
+
+Under ASGI the middleware samples every thread of the process, since the
+request's work is spread over the event loop and worker threads, and the
+capture has no SQL summary.
+"""
+import gzip
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from celery import signals as celery_signals
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+TOP_STATEMENTS = 10
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+# Some backends inline LIMIT and OFFSET; statements differing only there are one.
+NUMBER = re.compile(r'\b\d+\b')
+
+_slots = None
+_slots_lock = threading.Lock()
+_running_tasks = {}
+
+
+def _acquire_slot():
+    global _slots
+    if _slots is None:
+        with _slots_lock:
+            if _slots is None:
+                _slots = threading.BoundedSemaphore(settings.PROFILING_MAX_CONCURRENT)
+    return _slots.acquire(blocking=False)
+
+
+class Sampler(threading.Thread):
+    """Counts the stacks of ``thread_ids`` (or every other thread) until stopped"""
+
+    def __init__(self, thread_ids=None, interval=None):
+        super().__init__(name='profiling-sampler', daemon=True)
+        self.thread_ids = thread_ids
+        self.interval = interval or settings.PROFILING_INTERVAL
+        self.stacks = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in self.thread_ids or frames:
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append((frame.f_code, frame.f_lineno))
+                    frame = frame.f_back
+                self.stacks[tuple(stack)] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def folded(self):
+        """``[[frames, count], ...]`` with frames outermost first as ``file:line:function``"""
+        names = {}
+        result = []
+        for stack, count in self.stacks.most_common():
+            frames = []
+            for code, lineno in reversed(stack):
+                key = (code, lineno)
+                if key not in names:
+                    names[key] = f'{code.co_filename}:{lineno}:{code.co_name}'
+                frames.append(names[key])
+            result.append([frames, count])
+        return result
+
+
+class QueryLog:
+    """``execute_wrapper`` that totals the SQL run on this thread's connections"""
+
+    def __init__(self):
+        self.statements = {}
+        self.count = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        began = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - began
+            self.count += 1
+            self.time += elapsed
+            entry = self.statements.setdefault(NUMBER.sub('N', IN_LIST.sub('IN (...)', sql)), [0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+
+    def summary(self):
+        top = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)[:TOP_STATEMENTS]
+        return {
+            'queries': self.count,
+            'time': round(self.time, 6),
+            'top': [{'sql': sql, 'count': count, 'time': round(spent, 6)} for sql, (count, spent) in top],
+        }
+
+
+class Capture:
+    """
+    One profile of a request or task.
+
+    ``start`` begins sampling ``thread_ids`` (None for the whole process)
+    and, with ``log_sql``, logging this thread's queries; ``finish``
+    stops both and writes the file. Both must run on the same thread.
+    """
+
+    def __init__(self, kind, name, thread_ids=None, log_sql=True):
+        self.kind = kind
+        self.name = name
+        self.id = f'{timezone.now():%Y%m%dT%H%M%S}-{kind}-{uuid.uuid4().hex[:12]}'
+        self.meta = {}
+        self.sampler = Sampler(thread_ids)
+        self.queries = QueryLog() if log_sql else None
+        self._wrappers = ExitStack()
+
+    def start(self):
+        self.started_at = timezone.now()
+        self.began = time.perf_counter()
+        if self.queries is not None:
+            for connection in connections.all():
+                self._wrappers.enter_context(connection.execute_wrapper(self.queries))
+        self.sampler.start()
+        return self
+
+    def finish(self):
+        """Stop sampling and write the capture; returns its path, or None"""
+        duration = time.perf_counter() - self.began
+        self.sampler.stop()
+        self._wrappers.close()
+        record = {
+            'id': self.id,
+            'kind': self.kind,
+            'name': self.name,
+            'started_at': self.started_at.isoformat(),
+            'duration': round(duration, 6),
+            'interval': self.sampler.interval,
+            'samples': self.sampler.samples,
+            'pid': os.getpid(),
+            'sql': self.queries.summary() if self.queries is not None else None,
+            **self.meta,
+            'stacks': self.sampler.folded(),
+        }
+        path = os.path.join(settings.PROFILING_DIR, f'{self.id}.json.gz')
+        try:
+            os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+            # Write under a temporary name so readers never see half a file.
+            with gzip.open(path + '.tmp', 'wt', encoding='utf-8', compresslevel=6) as output:
+                json.dump(record, output, separators=(',', ':'))
+            os.replace(path + '.tmp', path)
+        except OSError:
+            logger.exception('Could not write profile %s', path)
+            return None
+        return path
+
+
+def begin(kind, name, thread_ids=None, log_sql=True):
+    """Start a capture if a slot is free; returns it, or None"""
+    if not _acquire_slot():
+        return None
+    try:
+        return Capture(kind, name, thread_ids, log_sql).start()
+    except Exception:
+        _slots.release()
+        raise
+
+
+def end(capture):
+    """Finish ``capture`` and free its slot; profiling errors are logged, never raised"""
+    try:
+        return capture.finish()
+    except Exception:
+        logger.exception('Profiling %s %s failed', capture.kind, capture.name)
+        return None
+    finally:
+        _slots.release()
+
+
+def _requested(request):
+    """'header' when the request carries the profiling token, 'sampled' when drawn, else None"""
+    token = settings.PROFILING_TOKEN
+    sent = request.META.get(PROFILE_HEADER)
+    if token and sent and hmac.compare_digest(sent.encode(), token.encode()):
+        return 'header'
+    rate = settings.PROFILING_SAMPLE_RATE
+    if rate and random.random() < rate and request.path.startswith(tuple(settings.PROFILING_PATHS)):
+        return 'sampled'
+    return None
+
+
+def _request_name(request):
+    match = request.resolver_match
+    return f'{request.method} {match.view_name if match and match.view_name else request.path}'
+
+
+def _finish_request(capture, trigger, request, response):
+    match = request.resolver_match
+    capture.name = _request_name(request)
+    capture.meta = {
+        'trigger': trigger,
+        'method': request.method,
+        'path': request.path,
+        'route': match.route if match else None,
+        'status': response.status_code,
+    }
+    path = end(capture)
+    if path and trigger == 'header':
+        response[PROFILE_ID_HEADER] = capture.id
+    return response
+
+
+class ProfilingMiddleware:
+    """Profile sampled requests and those carrying the ``X-Profile`` token"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        trigger = _requested(request)
+        capture = trigger and begin('request', request.path, [threading.get_ident()])
+        if not capture:
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            end(capture)
+            raise
+        return _finish_request(capture, trigger, request, response)
+
+    async def __acall__(self, request):
+        trigger = _requested(request)
+        capture = trigger and begin('request', request.path, log_sql=False)
+        if not capture:
+            return await self.get_response(request)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            end(capture)
+            raise
+        return _finish_request(capture, trigger, request, response)
+
+
+@celery_signals.task_prerun.connect
+def start_task_profile(sender=None, task_id=None, task=None, **kwargs):
+    if task.name not in settings.PROFILING_TASKS:
+        return
+    if random.random() >= settings.PROFILING_TASK_SAMPLE_RATE:
+        return
+    capture = begin('task', task.name, [threading.get_ident()])
+    if capture:
+        capture.meta = {'task_id': task_id}
+        _running_tasks[task_id] = capture
+
+
+@celery_signals.task_postrun.connect
+def stop_task_profile(sender=None, task_id=None, state=None, **kwargs):
+    capture = _running_tasks.pop(task_id, None)
+    if capture:
+        capture.meta['state'] = state
+        end(capture)
@@ -0,0 +1,153 @@
+"""
+Coalesced side effects of new reviews.
+
+Writing a review only schedules work: the first review in a
+``REVIEW_ACTIVITY_DELAY`` second window enqueues ``process_review_activity``
+(``cache.add`` keeps the rest of the window from enqueuing again). The job
+then takes every review not yet marked ``processed`` and, per affected
+listing:
+
+* recomputes ``review_count`` and ``average_rating``;
+* sends the owner one email covering all of the listing's new reviews;
+* sends ``reviews_processed`` so cached listing data can be dropped.
+
+Each batch of ``REVIEW_ACTIVITY_BATCH_SIZE`` reviews takes the same handful
+of queries and one SMTP connection however the reviews are spread over
+listings, so a burst of reviews on one listing becomes one rating update
+and one email. Reviews are found by their flag rather than by the signal
+that scheduled the job, so bulk inserts are covered and a lost run is
+caught up by the next one. Unlike an id watermark, the flag also catches
+reviews whose transaction commits after a higher id was processed. Edits
+and deletions of single reviews refresh the listing's rating straight
+away.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import send_mass_mail
+from django.db import transaction
+from django.db.models import Avg, Count
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import Listing, Review, JobCheckpoint
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_NAME = 'review_activity'
+SCHEDULED_KEY = 'reviews:activity-scheduled'
+
+# Sent with listing_ids once their new reviews have been processed.
+reviews_processed = Signal()
+
+
+def schedule():
+    """Make sure a run is due within ``REVIEW_ACTIVITY_DELAY`` seconds; never fails the caller"""
+    from .tasks import process_review_activity
+
+    delay = settings.REVIEW_ACTIVITY_DELAY
+    try:
+        if cache.add(SCHEDULED_KEY, True, delay):
+            try:
+                process_review_activity.apply_async(countdown=delay)
+            except Exception:
+                # Let the next review try again.
+                cache.delete(SCHEDULED_KEY)
+                raise
+    except Exception:
+        # The review stays unprocessed, so a later run still picks it up.
+        logger.warning('Could not schedule review processing', exc_info=True)
+
+
+def refresh_ratings(listing_ids):
+    """Recompute the review count and average rating of the given listings"""
+    listing_ids = set(listing_ids)
+    if not listing_ids:
+        return
+    summaries = {
+        row['listing_id']: row for row in
+        Review.objects.filter(listing_id__in=listing_ids)
+        .values('listing_id').annotate(count=Count('id'), average=Avg('rating')).order_by()
+    }
+    listings = []
+    for listing_id in listing_ids:
+        summary = summaries.get(listing_id)
+        listings.append(Listing(
+            pk=listing_id,
+            review_count=summary['count'] if summary else 0,
+            average_rating=summary['average'] if summary else 0,
+        ))
+    Listing.objects.bulk_update(listings, ['review_count', 'average_rating'])
+
+
+def review_digest(listing, reviews):
+    """Subject and body of the owner's email about ``reviews`` of ``listing``"""
+    shown = reviews[:settings.REVIEW_DIGEST_MAX_REVIEWS]
+    if len(reviews) == 1:
+        subject = f"New Review for {listing['title']}"
+        intro = 'A new review has been added to your listing:'
+    else:
+        subject = f"{len(reviews)} New Reviews for {listing['title']}"
+        intro = f'{len(reviews)} new reviews have been added to your listing:'
+    parts = [f"{intro}\n\nListing: {listing['title']}"]
+    for review in shown:
+        parts.append(
+            f"Reviewer: {review['reviewer__username']}\n"
+            f"Rating: {review['rating']}/5 stars\n"
+            f"Comment: {review['comment']}"
+        )
+    if len(reviews) > len(shown):
+        parts.append(f'...and {len(reviews) - len(shown)} more.')
+    return subject, '\n\n'.join(parts)
+
+
+def process_batch(batch_size):
+    """
+    Handle up to ``batch_size`` unprocessed reviews, oldest first.
+
+    The checkpoint row is locked for the whole batch, so overlapping runs
+    wait for each other instead of mailing twice, and reviews are only
+    marked once the emails went out: a failed send is retried by the next
+    run. Returns ``(reviews, listings)`` handled.
+    """
+    JobCheckpoint.objects.get_or_create(name=CHECKPOINT_NAME)
+    with transaction.atomic():
+        checkpoint = JobCheckpoint.objects.select_for_update().get(name=CHECKPOINT_NAME)
+        reviews = list(
+            Review.objects.filter(processed=False).order_by('pk')
+            .values('pk', 'listing_id', 'reviewer__username', 'rating', 'comment')[:batch_size]
+        )
+        if not reviews:
+            return 0, 0
+
+        by_listing = {}
+        for review in reviews:
+            by_listing.setdefault(review['listing_id'], []).append(review)
+        refresh_ratings(by_listing)
+
+        listings = Listing.objects.filter(pk__in=by_listing).values('pk', 'title', 'created_by__email')
+        messages = [
+            (*review_digest(listing, by_listing[listing['pk']]), settings.DEFAULT_FROM_EMAIL, [listing['created_by__email']])
+            for listing in listings if listing['created_by__email']
+        ]
+        if messages:
+            send_mass_mail(messages, fail_silently=False)
+
+        Review.objects.filter(pk__in=[review['pk'] for review in reviews]).update(processed=True)
+        checkpoint.last_run_at = timezone.now()
+        checkpoint.save(update_fields=['last_run_at'])
+    reviews_processed.send(sender=Review, listing_ids=list(by_listing))
+    return len(reviews), len(by_listing)
+
+
+def process_new_reviews(batch_size=None):
+    """Process every review written since the last run; returns ``(reviews, listings)``"""
+    batch_size = batch_size or settings.REVIEW_ACTIVITY_BATCH_SIZE
+    reviews = listings = 0
+    while True:
+        handled, touched = process_batch(batch_size)
+        reviews += handled
+        listings += touched
+        if handled < batch_size:
+            return reviews, listings
@@ -1,6 +1,12 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.utils import timezone
+from . import transitions
+from .currency import DisplayCurrencyMixin
+from .fieldsets import SparseFieldsMixin
 from .models import Listing, Review, Booking, Payment
+from .pricing import quote_listing
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -12,7 +18,7 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Review serializer"""
     reviewer = UserSerializer(read_only=True)
     
@@ -22,32 +28,22 @@ class ReviewSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'reviewer', 'created_at']
 
 
-class ListingSerializer(serializers.ModelSerializer):
+class ListingSerializer(DisplayCurrencyMixin, SparseFieldsMixin, serializers.ModelSerializer):
     """Listing serializer with nested reviews"""
     created_by = UserSerializer(read_only=True)
     reviews = ReviewSerializer(many=True, read_only=True)
-    average_rating = serializers.SerializerMethodField()
-    review_count = serializers.SerializerMethodField()
+    display_amounts = ('price',)
     
     class Meta:
         model = Listing
         fields = [
-            'id', 'title', 'description', 'listing_type', 'price', 
+            'id', 'title', 'description', 'listing_type', 'price', 'currency',
             'location', 'created_by', 'created_at', 'updated_at', 
             'is_active', 'reviews', 'average_rating', 'review_count'
         ]
-        read_only_fields = ['id', 'created_by', 'created_at', 'updated_at']
-    
-    def get_average_rating(self, obj):
-        """Calculate average rating from reviews"""
-        reviews = obj.reviews.all()
-        if reviews:
-            return sum(review.rating for review in reviews) / len(reviews)
-        return 0
-    
-    def get_review_count(self, obj):
-        """Get total number of reviews"""
-        return obj.reviews.count()
+        read_only_fields = [
+            'id', 'created_by', 'created_at', 'updated_at', 'average_rating', 'review_count'
+        ]
 
 
 class ListingCreateSerializer(serializers.ModelSerializer):
@@ -55,44 +51,148 @@ class ListingCreateSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Listing
-        fields = ['title', 'description', 'listing_type', 'price', 'location']
+        fields = ['title', 'description', 'listing_type', 'price', 'currency', 'location']
+
+
+def validate_booking_dates(data):
+    """Check that a stay ends after it starts and does not start in the past"""
+    check_in = data.get('check_in_date')
+    check_out = data.get('check_out_date')
+    
+    if check_in and check_out:
+        if check_out <= check_in:
+            raise serializers.ValidationError(
+                "Check-out date must be after check-in date."
+            )
+        
+        # Check if check-in is not in the past
+        if check_in < timezone.now().date():
+            raise serializers.ValidationError(
+                "Check-in date cannot be in the past."
+            )
+    
+    return data
+
+
+def validate_booking_total(data, instance=None):
+    """
+    Check ``total_price`` against the pricing engine, filling it in when omitted.
+    
+    On updates, fields missing from ``data`` fall back to ``instance``.
+    """
+    pricing_fields = ('listing', 'check_in_date', 'check_out_date', 'number_of_guests', 'total_price')
+    if instance is not None and not any(field in data for field in pricing_fields):
+        return data
+    
+    listing = data.get('listing', getattr(instance, 'listing', None))
+    check_in = data.get('check_in_date', getattr(instance, 'check_in_date', None))
+    check_out = data.get('check_out_date', getattr(instance, 'check_out_date', None))
+    guests = data.get('number_of_guests', getattr(instance, 'number_of_guests', 1))
+    if listing is None or check_in is None or check_out is None or check_out <= check_in:
+        return data
+    
+    expected = quote_listing(listing, check_in, check_out, guests).total
+    if 'total_price' in data and data['total_price'] != expected:
+        raise serializers.ValidationError(
+            {'total_price': f'Total price for this stay is {expected}.'}
+        )
+    data['total_price'] = expected
+    return data
 
 
-class BookingSerializer(serializers.ModelSerializer):
-    """Booking serializer"""
+class BookingSerializer(DisplayCurrencyMixin, SparseFieldsMixin, serializers.ModelSerializer):
+    """Booking serializer; totals are checked against the pricing engine"""
     user = UserSerializer(read_only=True)
     listing = serializers.PrimaryKeyRelatedField(queryset=Listing.objects.all())
     listing_details = ListingSerializer(source='listing', read_only=True)
     duration_days = serializers.ReadOnlyField()
+    total_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    currency = serializers.SerializerMethodField()
+    version = serializers.IntegerField(
+        min_value=0,
+        required=False,
+        help_text='Send back the version that was read to refuse the update if the booking changed since'
+    )
+    display_amounts = ('total_price',)
     
     class Meta:
         model = Booking
         fields = [
             'id', 'listing', 'listing_details', 'user', 'check_in_date', 
-            'check_out_date', 'number_of_guests', 'total_price', 'status',
+            'check_out_date', 'number_of_guests', 'total_price', 'currency', 'status', 'version',
             'special_requests', 'created_at', 'updated_at', 'duration_days'
         ]
         read_only_fields = ['id', 'user', 'created_at', 'updated_at', 'duration_days']
     
+    def get_currency(self, obj):
+        """The listing's currency, which the booking's total is in"""
+        return self.source_currency(obj)
+    
+    def source_currency(self, instance):
+        # BookingViewSet annotates it so reads need not load the listing.
+        return getattr(instance, 'listing_currency', None) or instance.listing.currency
+    
     def validate(self, data):
         """Validate booking data"""
-        check_in = data.get('check_in_date')
-        check_out = data.get('check_out_date')
-        
-        if check_in and check_out:
-            if check_out <= check_in:
-                raise serializers.ValidationError(
-                    "Check-out date must be after check-in date."
-                )
-            
-            # Check if check-in is not in the past
-            from django.utils import timezone
-            if check_in < timezone.now().date():
-                raise serializers.ValidationError(
-                    "Check-in date cannot be in the past."
-                )
-        
-        return data
+        data = validate_booking_dates(data)
+        return validate_booking_total(data, self.instance)
+    
+    def create(self, validated_data):
+        validated_data.pop('version', None)
+        return super().create(validated_data)
+    
+    def update(self, instance, validated_data):
+        """Write only the changed fields, and only over the status and version that were read"""
+        expected_version = validated_data.pop('version', None)
+        transitions.save(instance, transitions.assign(instance, validated_data), expected_version=expected_version)
+        return instance
+
+
+class BookingHistorySerializer(serializers.Serializer):
+    """A live or archived booking in a user's history (read-only)"""
+    id = serializers.IntegerField()
+    listing = serializers.IntegerField()
+    check_in_date = serializers.DateField()
+    check_out_date = serializers.DateField()
+    number_of_guests = serializers.IntegerField()
+    total_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    status = serializers.CharField()
+    special_requests = serializers.CharField()
+    created_at = serializers.DateTimeField()
+    updated_at = serializers.DateTimeField()
+    payment_status = serializers.CharField(source='payment_state', allow_null=True)
+    archived = serializers.BooleanField()
+
+
+class BookingBulkItemSerializer(serializers.ModelSerializer):
+    """
+    Validates a single item of a bulk booking request.
+    
+    The listing is a plain integer here; existence, availability and the
+    quoted total are checked for the whole batch at once by ``listings.bulk``.
+    """
+    listing = serializers.IntegerField(min_value=1)
+    total_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    
+    class Meta:
+        model = Booking
+        fields = [
+            'listing', 'check_in_date', 'check_out_date', 'number_of_guests',
+            'total_price', 'special_requests'
+        ]
+    
+    def validate(self, data):
+        """Validate booking data"""
+        return validate_booking_dates(data)
+
+
+class ReviewBulkItemSerializer(serializers.ModelSerializer):
+    """Validates a single item of a bulk review request"""
+    listing = serializers.IntegerField(min_value=1)
+    
+    class Meta:
+        model = Review
+        fields = ['listing', 'rating', 'comment']
 
 
 class PaymentSerializer(serializers.ModelSerializer):
@@ -102,3 +202,36 @@ class PaymentSerializer(serializers.ModelSerializer):
         model = Payment
         fields = ['id', 'booking', 'amount', 'transaction_id', 'status', 'created_at', 'updated_at']
         read_only_fields = ['id', 'transaction_id', 'status', 'created_at', 'updated_at']
+
+
+class QuoteRequestSerializer(serializers.Serializer):
+    """Query parameters for a price quote"""
+    check_in_date = serializers.DateField()
+    check_out_date = serializers.DateField()
+    number_of_guests = serializers.IntegerField(min_value=1, default=1)
+    
+    def validate(self, data):
+        """Validate stay dates"""
+        return validate_booking_dates(data)
+
+
+class StatsRangeSerializer(serializers.Serializer):
+    """``from`` and ``to`` query parameters of the host stats endpoint"""
+    
+    def get_fields(self):
+        # ``from`` is a Python keyword, so the fields cannot be class attributes.
+        return {
+            'from': serializers.DateField(),
+            'to': serializers.DateField(),
+        }
+    
+    def validate(self, data):
+        """Validate the date range"""
+        if data['to'] < data['from']:
+            raise serializers.ValidationError("'to' cannot be before 'from'.")
+        if (data['to'] - data['from']).days >= settings.HOST_STATS_MAX_DAYS:
+            raise serializers.ValidationError(
+                f'The range can cover at most {settings.HOST_STATS_MAX_DAYS} days.'
+            )
+        return data
+
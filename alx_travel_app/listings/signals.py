@@ -0,0 +1,151 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import analytics, reviews, transitions, trending, warming
+from .models import Listing, Review, Booking, Payment, RateRule
+
+
+@receiver(post_save, sender=RateRule)
+@receiver(post_delete, sender=RateRule)
+def touch_listing_on_rate_change(sender, instance, **kwargs):
+    """Bump the listing's updated_at so cached rate calendars are rebuilt"""
+    Listing.objects.filter(pk=instance.listing_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Booking)
+def count_booking_popularity(sender, instance, created, **kwargs):
+    """Add a new booking to its listing's trending score once it commits"""
+    if created:
+        events = trending.booking_events([instance])
+        if events:
+            transaction.on_commit(lambda: trending.record_events(events))
+
+
+@receiver(post_save, sender=Review)
+def count_review_popularity(sender, instance, created, **kwargs):
+    """Add a new review to its listing's trending score once it commits"""
+    if created:
+        events = trending.review_events([instance])
+        transaction.on_commit(lambda: trending.record_events(events))
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def schedule_review_activity(sender, instance, created=False, origin=None, **kwargs):
+    """Coalesce new reviews into the next run; refresh the rating after an edit or removal"""
+    if created:
+        transaction.on_commit(reviews.schedule)
+    elif not isinstance(origin, Listing):
+        # Reviews deleted along with their listing leave nothing to update.
+        listing_id = instance.listing_id
+        transaction.on_commit(lambda: reviews.refresh_ratings([listing_id]))
+
+
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+def invalidate_listing_responses(sender, instance, **kwargs):
+    """Drop the list pages and the listing's cached details once the change commits"""
+    # Deleting clears the pk before on_commit callbacks run.
+    listing_id = instance.pk
+    transaction.on_commit(lambda: warming.invalidate([listing_id]))
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_review_responses(sender, instance, created=False, origin=None, **kwargs):
+    """Edited and removed reviews show at once; new ones once they are processed"""
+    if not created and not isinstance(origin, Listing):
+        listing_id = instance.listing_id
+        transaction.on_commit(lambda: warming.invalidate([listing_id]))
+
+
+@receiver(reviews.reviews_processed)
+def invalidate_reviewed_listings(sender, listing_ids, **kwargs):
+    """New reviews and ratings change the listings' responses"""
+    warming.invalidate(listing_ids)
+
+
+@receiver(post_save, sender=Listing)
+def sync_listing_popularity(sender, instance, created, **kwargs):
+    """Keep the trending filters in step with the listing"""
+    if not created:
+        trending.sync_listing(instance)
+
+
+# A lazy sender, so workers that never authenticate skip importing DRF for it.
+@receiver(post_delete, sender='authtoken.Token')
+def forget_revoked_token(sender, instance, **kwargs):
+    """Stop accepting a revoked token from the authentication cache"""
+    from . import authentication
+    
+    transaction.on_commit(lambda: authentication.invalidate_tokens([instance.key]))
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(sender, instance, created, update_fields=None, **kwargs):
+    """Drop cached lookups so deactivation and other user changes apply at once"""
+    if created or update_fields == frozenset(['last_login']):
+        return
+    from rest_framework.authtoken.models import Token
+    
+    keys = list(Token.objects.filter(user=instance).values_list('key', flat=True))
+    if keys:
+        from . import authentication
+        
+        transaction.on_commit(lambda: authentication.invalidate_tokens(keys))
+
+
+@receiver(post_init, sender=Booking)
+@receiver(post_init, sender=Payment)
+def remember_loaded_status(sender, instance, **kwargs):
+    """Note the status as loaded so saves can tell whether it changed"""
+    # Read __dict__ so a deferred status is not fetched just for this.
+    instance._loaded_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_save, sender=Payment)
+def publish_status(sender, instance, created, **kwargs):
+    """Push a status changed by a plain save() to the owner once it commits"""
+    if not created and instance.status != instance._loaded_status:
+        transitions.publish_status(instance)
+    instance._loaded_status = instance.status
+
+
+@receiver(post_init, sender=Booking)
+def remember_loaded_days(sender, instance, **kwargs):
+    """Note the listing and dates as loaded so saves can tell which days they left"""
+    values = instance.__dict__
+    instance._loaded_days = (values.get('listing_id'), values.get('check_in_date'), values.get('check_out_date'))
+
+
+@receiver(post_save, sender=Booking)
+def mark_left_booking_days(sender, instance, created, **kwargs):
+    """Have the rollup rebuild the days a booking moved away from"""
+    loaded = instance._loaded_days
+    current = (instance.listing_id, instance.check_in_date, instance.check_out_date)
+    if not created and None not in loaded and loaded != current:
+        analytics.mark_stale(loaded[0], *analytics.booking_days(loaded[1], loaded[2]))
+    instance._loaded_days = current
+
+
+@receiver(post_delete, sender=Booking)
+def mark_deleted_booking_days(sender, instance, origin=None, **kwargs):
+    """Have the rollup rebuild the days a deleted booking counted on"""
+    # The rollup rows of a deleted listing go with it.
+    if not isinstance(origin, Listing):
+        analytics.mark_stale(
+            instance.listing_id, *analytics.booking_days(instance.check_in_date, instance.check_out_date)
+        )
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def mark_changed_review_day(sender, instance, created=False, origin=None, **kwargs):
+    """Have the rollup rebuild the day of an edited or deleted review"""
+    if not created and not isinstance(origin, Listing):
+        day = timezone.localdate(instance.created_at)
+        analytics.mark_stale(instance.listing_id, day, day)
@@ -0,0 +1,292 @@
+"""
+Batch computation of "similar listings".
+
+Every active listing becomes a sparse vector with two blocks, each
+L2-normalised and weighted so that a dot product is a weighted cosine
+similarity:
+
+* text: hashed words of the title (counted twice) and the start of the
+  description, TF-IDF weighted;
+* audience: the users who booked or reviewed the listing, IDF weighted.
+
+Candidates come from multiplying one chunk of rows by the whole matrix
+transposed, which only pairs listings that share a word or a user. Features
+shared by more than ``MAX_DOCUMENT_FREQUENCY`` listings are dropped, which
+caps how many candidates a single row can produce. Matching type, location
+and price band then add a bonus to each candidate pair, and the best ``k``
+per listing are stored in ``SimilarListing``. Listings with fewer than
+``k`` candidates are topped up with listings of the same type and location
+in the nearest price bands.
+
+Peak memory is the feature matrix and its transpose (at most
+``MAX_TOKENS`` text entries plus the audience entries per listing, as
+float32) plus one chunk product. Lower ``chunk_size`` to trade speed for
+a smaller product.
+"""
+import math
+import re
+import zlib
+from array import array
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+from django.db import transaction
+
+from .models import Listing, Review, Booking, SimilarListing
+
+
+TEXT_FEATURES = 2 ** 20
+MAX_TOKENS = 32
+DESCRIPTION_CHARS = 500
+MAX_DOCUMENT_FREQUENCY = 2000
+LOAD_CHUNK_SIZE = 5000
+DEFAULT_CHUNK_SIZE = 256
+DEFAULT_NEIGHBOURS = 10
+
+# Share of the final score from each signal.
+WEIGHTS = {
+    'text': 0.45,
+    'audience': 0.35,
+    'type': 0.1,
+    'location': 0.15,
+    'price': 0.1,
+}
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]{3,}')
+
+
+def _keyset_chunks(queryset, chunk_size=LOAD_CHUNK_SIZE):
+    """Yield chunks of a values_list queryset whose first column is the pk"""
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1][0]
+
+
+def _text_features(title, description):
+    words = TOKEN_PATTERN.findall(title.lower()) * 2
+    words += TOKEN_PATTERN.findall(description[:DESCRIPTION_CHARS].lower())
+    counts = Counter(zlib.crc32(word.encode()) % TEXT_FEATURES for word in words)
+    return counts.most_common(MAX_TOKENS)
+
+
+def _price_band(price):
+    """Half-octave price bucket, so bands 1 apart differ by about 40%"""
+    return int(math.floor(math.log2(max(float(price), 1.0)) * 2))
+
+
+def _idf_normalize(matrix):
+    """Apply IDF weights, drop useless features and L2-normalise rows"""
+    rows = matrix.shape[0]
+    document_frequency = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    idf = np.log((1 + rows) / (1 + document_frequency)) + 1
+    # Features on a single listing cannot pair it with anything, and very
+    # common ones pair it with everything.
+    idf[(document_frequency < 2) | (document_frequency > MAX_DOCUMENT_FREQUENCY)] = 0
+    matrix = sparse.csr_matrix(matrix.multiply(idf.astype(np.float32)), dtype=np.float32)
+    matrix.eliminate_zeros()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    scale = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return sparse.diags(scale.astype(np.float32)) @ matrix
+
+
+class ListingFeatures:
+    """Feature matrix and categorical codes for all active listings"""
+
+    def __init__(self):
+        type_codes = {listing_type: code for code, (listing_type, _) in enumerate(Listing.LISTING_TYPES)}
+        location_codes = {}
+        ids = array('q')
+        types = array('h')
+        locations = array('i')
+        bands = array('h')
+        indptr = array('q', [0])
+        indices = array('i')
+        data = array('f')
+
+        listings = Listing.objects.filter(is_active=True).values_list(
+            'id', 'title', 'description', 'listing_type', 'location', 'price'
+        )
+        for chunk in _keyset_chunks(listings):
+            for pk, title, description, listing_type, location, price in chunk:
+                ids.append(pk)
+                types.append(type_codes.get(listing_type, -1))
+                locations.append(location_codes.setdefault(location.strip().lower(), len(location_codes)))
+                bands.append(_price_band(price))
+                for feature, count in _text_features(title, description):
+                    indices.append(feature)
+                    data.append(1.0 + math.log(count))
+                indptr.append(len(indices))
+
+        self.ids = np.frombuffer(ids, dtype=np.int64)
+        self.types = np.frombuffer(types, dtype=np.int16)
+        self.locations = np.frombuffer(locations, dtype=np.int32)
+        self.bands = np.frombuffer(bands, dtype=np.int16)
+        count = len(self.ids)
+
+        text = sparse.csr_matrix(
+            (
+                np.frombuffer(data, dtype=np.float32),
+                np.frombuffer(indices, dtype=np.int32),
+                np.frombuffer(indptr, dtype=np.int64),
+            ),
+            shape=(count, TEXT_FEATURES),
+        )
+        # Rows ordered by (type, location, price band) for the fallback, with
+        # each row's position in that order and the bounds of its group.
+        groups = self.types.astype(np.int64) * (1 << 32) + self.locations
+        self.group_order = np.lexsort((self.bands, groups))
+        self.order_position = np.empty(count, dtype=np.int64)
+        self.order_position[self.group_order] = np.arange(count)
+        sorted_groups = groups[self.group_order]
+        self.group_low = np.searchsorted(sorted_groups, groups, side='left')
+        self.group_high = np.searchsorted(sorted_groups, groups, side='right')
+
+        audience = self._audience_matrix()
+        self.matrix = sparse.hstack([
+            _idf_normalize(text) * np.float32(math.sqrt(WEIGHTS['text'])),
+            _idf_normalize(audience) * np.float32(math.sqrt(WEIGHTS['audience'])),
+        ], format='csr', dtype=np.float32)
+
+    def _audience_matrix(self):
+        """Binary listing x user matrix of bookings and reviews"""
+        rows = array('q')
+        users = array('q')
+        if not len(self.ids):
+            return sparse.csr_matrix((0, 1), dtype=np.float32)
+        interactions = [
+            Booking.objects.values_list('id', 'listing_id', 'user_id'),
+            Review.objects.values_list('id', 'listing_id', 'reviewer_id'),
+        ]
+        for queryset in interactions:
+            for chunk in _keyset_chunks(queryset):
+                listing_ids = np.fromiter((row[1] for row in chunk), dtype=np.int64, count=len(chunk))
+                user_ids = np.fromiter((row[2] for row in chunk), dtype=np.int64, count=len(chunk))
+                # Map listing ids to matrix rows; interactions with inactive
+                # listings have no row and are skipped.
+                positions = np.minimum(np.searchsorted(self.ids, listing_ids), len(self.ids) - 1)
+                known = self.ids[positions] == listing_ids
+                rows.extend(positions[known].tolist())
+                users.extend(user_ids[known].tolist())
+
+        row_array = np.frombuffer(rows, dtype=np.int64)
+        user_array = np.frombuffer(users, dtype=np.int64)
+        width = int(user_array.max()) + 1 if len(user_array) else 1
+        matrix = sparse.csr_matrix(
+            (np.ones(len(row_array), dtype=np.float32), (row_array, user_array)),
+            shape=(len(self.ids), width),
+        )
+        matrix.data[:] = 1.0
+        return matrix
+
+
+def _category_scores(features, rows, cols):
+    """Bonus for matching type, location and price band"""
+    band_gap = np.abs(features.bands[rows].astype(np.int32) - features.bands[cols])
+    return (
+        WEIGHTS['type'] * (features.types[rows] == features.types[cols])
+        + WEIGHTS['location'] * (features.locations[rows] == features.locations[cols])
+        + WEIGHTS['price'] * np.maximum(0.0, 1.0 - band_gap / 2.0)
+    ).astype(np.float32)
+
+
+def _top_up(features, start, stop, rows, cols, ranks, scores, k):
+    """
+    Add fallbacks for rows with fewer than ``k`` neighbours: listings of the
+    same type and location, taken from the nearest price bands.
+    """
+    counts = np.bincount(rows - start, minlength=stop - start)
+    needy = np.flatnonzero(counts < k) + start
+    if not len(needy):
+        return rows, cols, ranks, scores
+
+    # Look up to 2k places either side of each row in the grouped order,
+    # nearest first; this always leaves enough candidates after exclusions.
+    steps = np.arange(1, 2 * k + 1)
+    offsets = np.column_stack([steps, -steps]).ravel()
+    positions = features.order_position[needy][:, None] + offsets
+    valid = (positions >= features.group_low[needy][:, None]) & (positions < features.group_high[needy][:, None])
+    candidates = features.group_order[np.clip(positions, 0, len(features.group_order) - 1)]
+    width = len(features.ids)
+    valid &= ~np.isin(needy[:, None] * width + candidates, rows * width + cols)
+
+    gaps = np.abs(features.bands[candidates].astype(np.int32) - features.bands[needy][:, None])
+    gaps[~valid] = np.iinfo(np.int32).max
+    order = np.argsort(gaps, axis=1, kind='stable')
+    candidates = np.take_along_axis(candidates, order, axis=1)
+    valid = np.take_along_axis(valid, order, axis=1)
+    have = counts[needy - start][:, None]
+    slots = np.arange(len(offsets))[None, :]
+    take = valid & (slots < k - have)
+
+    extra_rows = np.broadcast_to(needy[:, None], take.shape)[take]
+    extra_cols = candidates[take]
+    return (
+        np.concatenate([rows, extra_rows]),
+        np.concatenate([cols, extra_cols]),
+        np.concatenate([ranks, (have + slots)[take]]),
+        np.concatenate([scores, _category_scores(features, extra_rows, extra_cols)]),
+    )
+
+
+def iter_neighbours(features, k=DEFAULT_NEIGHBOURS, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield ``(covered_ids, listing_ids, neighbour_ids, ranks, scores)``
+    arrays for each chunk of rows; ``covered_ids`` are all listings in the
+    chunk, including those that found no neighbours.
+    """
+    matrix = features.matrix
+    transposed = matrix.T.tocsr()
+    for start in range(0, matrix.shape[0], chunk_size):
+        stop = min(start + chunk_size, matrix.shape[0])
+        product = (matrix[start:stop] @ transposed).tocoo()
+        rows = product.row.astype(np.int64) + start
+        cols = product.col.astype(np.int64)
+        keep = rows != cols
+        rows, cols = rows[keep], cols[keep]
+        scores = product.data[keep].astype(np.float32) + _category_scores(features, rows, cols)
+
+        # Sort by row, best score first, then keep the first k of each row.
+        order = np.lexsort((-scores, rows))
+        rows, cols, scores = rows[order], cols[order], scores[order]
+        row_starts = np.searchsorted(rows, rows, side='left')
+        ranks = np.arange(len(rows)) - row_starts
+        top = ranks < k
+        rows, cols, ranks, scores = _top_up(
+            features, start, stop, rows[top], cols[top], ranks[top], scores[top], k
+        )
+        yield (
+            features.ids[start:stop],
+            features.ids[rows],
+            features.ids[cols],
+            ranks,
+            scores,
+        )
+
+
+def compute_similar_listings(k=DEFAULT_NEIGHBOURS, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Rebuild ``SimilarListing`` for every active listing.
+
+    Returns ``(listings, neighbours)`` counts.
+    """
+    features = ListingFeatures()
+    SimilarListing.objects.filter(listing__is_active=False).delete()
+
+    stored = 0
+    for covered, listing_ids, neighbour_ids, ranks, scores in iter_neighbours(features, k, chunk_size):
+        rows = [
+            SimilarListing(listing_id=listing_id, similar_id=neighbour_id, rank=rank, score=score)
+            for listing_id, neighbour_id, rank, score in zip(
+                listing_ids.tolist(), neighbour_ids.tolist(), ranks.tolist(), scores.tolist()
+            )
+        ]
+        with transaction.atomic():
+            SimilarListing.objects.filter(listing_id__in=covered.tolist()).delete()
+            SimilarListing.objects.bulk_create(rows, batch_size=1000)
+        stored += len(rows)
+    return len(features.ids), stored
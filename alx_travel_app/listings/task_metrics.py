@@ -0,0 +1,114 @@
+"""
+Latency, queue-wait and failure metrics for Celery tasks.
+
+``before_task_publish`` stamps every message with the time it was sent, so
+the worker can tell how long it sat in the queue. When a task finishes,
+``task_timed`` is sent with its queue wait, run time and final state, and
+the numbers are added to an in-process summary returned by ``snapshot()``.
+Connect a receiver to ``task_timed`` to forward them to a metrics system.
+"""
+import logging
+import threading
+import time
+
+from celery import signals as celery_signals
+from django.dispatch import Signal
+
+
+logger = logging.getLogger(__name__)
+
+PUBLISHED_AT_HEADER = 'published_at'
+
+# Sent with task_name, queue, queue_wait (seconds, None when unknown),
+# runtime (seconds) and state ('SUCCESS', 'FAILURE', 'RETRY', ...).
+task_timed = Signal()
+
+_running = {}
+_summary = {}
+_lock = threading.Lock()
+
+
+class TaskStats:
+    """Running totals for one task name"""
+
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.runtime_total = 0.0
+        self.runtime_max = 0.0
+        self.waited = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def add(self, runtime, queue_wait, failed):
+        self.count += 1
+        self.failures += failed
+        self.runtime_total += runtime
+        self.runtime_max = max(self.runtime_max, runtime)
+        if queue_wait is not None:
+            self.waited += 1
+            self.wait_total += queue_wait
+            self.wait_max = max(self.wait_max, queue_wait)
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'failures': self.failures,
+            'runtime_avg': self.runtime_total / self.count if self.count else 0.0,
+            'runtime_max': self.runtime_max,
+            'queue_wait_avg': self.wait_total / self.waited if self.waited else None,
+            'queue_wait_max': self.wait_max if self.waited else None,
+        }
+
+
+def snapshot():
+    """Return ``{task_name: stats}`` for tasks finished in this process"""
+    with _lock:
+        return {name: stats.as_dict() for name, stats in _summary.items()}
+
+
+def reset():
+    with _lock:
+        _summary.clear()
+
+
+@celery_signals.before_task_publish.connect
+def stamp_published_at(sender=None, headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault(PUBLISHED_AT_HEADER, time.time())
+
+
+@celery_signals.task_prerun.connect
+def start_timer(sender=None, task_id=None, task=None, **kwargs):
+    published_at = getattr(task.request, PUBLISHED_AT_HEADER, None)
+    queue_wait = max(time.time() - published_at, 0.0) if published_at else None
+    with _lock:
+        _running[task_id] = (time.monotonic(), queue_wait)
+
+
+@celery_signals.task_postrun.connect
+def stop_timer(sender=None, task_id=None, task=None, state=None, **kwargs):
+    with _lock:
+        started = _running.pop(task_id, None)
+    if started is None:
+        return
+    began, queue_wait = started
+    runtime = time.monotonic() - began
+    delivery_info = task.request.delivery_info or {}
+    queue = delivery_info.get('routing_key')
+    with _lock:
+        _summary.setdefault(task.name, TaskStats()).add(runtime, queue_wait, state == 'FAILURE')
+
+    logger.debug(
+        'task=%s queue=%s state=%s runtime=%.4fs queue_wait=%s',
+        task.name, queue, state, runtime,
+        f'{queue_wait:.4f}s' if queue_wait is not None else '-'
+    )
+    task_timed.send(
+        sender=task.__class__,
+        task_name=task.name,
+        queue=queue,
+        queue_wait=queue_wait,
+        runtime=runtime,
+        state=state,
+    )
@@ -1,10 +1,10 @@
 from celery import shared_task
 from django.core.mail import send_mail
 from django.conf import settings
-from .models import Listing, Review
+from .models import Listing, Payment
 
 
-@shared_task
+@shared_task(ignore_result=True)
 def send_listing_notification(listing_id):
     """Send notification when a new listing is created"""
     try:
@@ -37,41 +37,63 @@ def send_listing_notification(listing_id):
         return f"Listing with id {listing_id} does not exist"
 
 
-@shared_task
-def send_review_notification(review_id):
-    """Send notification when a new review is added"""
+@shared_task(
+    ignore_result=True,
+    acks_late=True,
+    autoretry_for=(OSError,),
+    retry_backoff=True,
+    max_retries=5,
+)
+def process_review_activity():
+    """Update ratings and email owners for every review written since the last run"""
+    from .reviews import process_new_reviews
+    
+    reviews, listings = process_new_reviews()
+    return f"Processed {reviews} reviews on {listings} listings"
+
+
+@shared_task(
+    acks_late=True,
+    autoretry_for=(OSError,),
+    retry_backoff=True,
+    max_retries=5,
+)
+def send_payment_confirmation(payment_id):
+    """Email the guest once their payment has been verified"""
     try:
-        review = Review.objects.get(id=review_id)
-        listing = review.listing
-        
-        subject = f"New Review for {listing.title}"
-        message = f"""
-        A new review has been added to your listing:
-        
-        Listing: {listing.title}
-        Reviewer: {review.reviewer.username}
-        Rating: {review.rating}/5 stars
-        Comment: {review.comment}
-        """
-        
-        # Send notification to listing owner
-        recipient_list = [listing.created_by.email]
-        
-        if listing.created_by.email:
-            send_mail(
-                subject,
-                message,
-                settings.DEFAULT_FROM_EMAIL,
-                recipient_list,
-                fail_silently=False,
-            )
-        
-        return f"Review notification sent for listing: {listing.title}"
-    except Review.DoesNotExist:
-        return f"Review with id {review_id} does not exist"
+        payment = Payment.objects.select_related('booking__listing', 'booking__user').get(id=payment_id)
+    except Payment.DoesNotExist:
+        return f"Payment with id {payment_id} does not exist"
+    
+    booking = payment.booking
+    # The email tells the guest the booking is confirmed, so it must be.
+    if payment.status != 'completed' or booking.status != 'confirmed' or not booking.user.email:
+        return f"No confirmation needed for payment {payment.transaction_id}"
+    
+    subject = f"Payment Confirmed: {booking.listing.title}"
+    message = f"""
+    Your payment has been received and your booking is confirmed:
+    
+    Listing: {booking.listing.title}
+    Check-in: {booking.check_in_date}
+    Check-out: {booking.check_out_date}
+    Guests: {booking.number_of_guests}
+    Amount paid: {payment.amount}
+    Transaction: {payment.transaction_id}
+    """
+    
+    send_mail(
+        subject,
+        message,
+        settings.DEFAULT_FROM_EMAIL,
+        [booking.user.email],
+        fail_silently=False,
+    )
+    
+    return f"Payment confirmation sent for transaction: {payment.transaction_id}"
 
 
-@shared_task
+@shared_task(ignore_result=True)
 def cleanup_inactive_listings():
     """Clean up listings that have been inactive for a long time"""
     from datetime import datetime, timedelta
@@ -88,3 +110,69 @@ def cleanup_inactive_listings():
     # inactive_listings.delete()
     
     return f"Found {count} inactive listings for cleanup"
+
+
+@shared_task(ignore_result=True)
+def rollup_listing_stats(full=False):
+    """Refresh the per-listing daily stats used by the host dashboard"""
+    from .analytics import run_rollup
+    
+    listings, rows = run_rollup(full=full)
+    return f"Rollup recomputed {listings} listings ({rows} daily rows)"
+
+
+@shared_task(ignore_result=True)
+def rebuild_trending_scores():
+    """Recompute trending scores from the events inside the trending window"""
+    from .trending import rebuild_scores
+    
+    count = rebuild_scores()
+    return f"Rebuilt trending scores for {count} listings"
+
+
+@shared_task(ignore_result=True)
+def compute_similar_listings(k=None, chunk_size=None):
+    """Rebuild the precomputed similar-listings table"""
+    from . import similarity
+    
+    listings, neighbours = similarity.compute_similar_listings(
+        k or settings.SIMILAR_LISTINGS_K,
+        chunk_size or settings.SIMILAR_LISTINGS_CHUNK_SIZE,
+    )
+    return f"Stored {neighbours} similar listings for {listings} listings"
+
+
+@shared_task(ignore_result=True)
+def archive_bookings():
+    """Move old finished bookings out of the live bookings table"""
+    from .archive import archive_old_bookings
+    
+    count = archive_old_bookings()
+    return f"Archived {count} bookings"
+
+
+@shared_task(
+    ignore_result=True,
+    autoretry_for=(OSError,),
+    retry_backoff=True,
+    max_retries=3,
+)
+def refresh_exchange_rates():
+    """Fetch the latest exchange rates; every process picks them up on its next check"""
+    from .currency import refresh_rates
+    
+    count = refresh_rates()
+    return f"Stored {count} exchange rates"
+
+
+@shared_task(ignore_result=True)
+def warm_caches():
+    """Replay the most read anonymous listing queries into the response cache"""
+    from .warming import run
+    
+    result = run()
+    return (
+        f"Warmed {result.outcomes['warmed']} of {len(result.queries)} queries "
+        f"({result.outcomes['already cached']} already cached, {result.outcomes['failed']} failed) "
+        f"in {result.seconds:.1f}s; {result.cached} are cached now"
+    )
@@ -1,3 +1,1042 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import brotli
+from django.conf import settings
+from django.contrib.admin.models import LogEntry
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core import mail
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import F
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+
+from alx_travel_app import schema
+
+from . import (
+    analytics, archive, authentication, bulk, currency, events, pricing, profiling, reviews, similarity, throttling,
+    transitions, trending, warming,
+)
+from .authentication import CachedTokenAuthentication
+from .admin import BookingAdminForm
+from .idempotency import _cache_key, idempotent
+from .tasks import send_payment_confirmation
+from .management.commands import profile_startup
+from .management.commands.check_query_plans import MIN_ROWS
+from .renderers import ORJSONRenderer
+from .models import (
+    Listing, Review, Booking, ArchivedBooking, ExchangeRate, ListingDailyStats, ListingPopularity, Payment, RateRule,
+)
+
+
+class QueryPlanTests(TestCase):
+    """The endpoints' queries use indexes once the tables are production sized."""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create([User(username=f'guest{index}') for index in range(50)])
+        listing_types = [value for value, _ in Listing.LISTING_TYPES]
+        Listing.objects.bulk_create([
+            Listing(
+                title=f'Listing {index}',
+                description='Seeded for query plans',
+                listing_type=listing_types[index % len(listing_types)],
+                price=Decimal(50 + index % 200),
+                location=f'City {index % 40}',
+                created_by=users[index % len(users)],
+            )
+            for index in range(MIN_ROWS)
+        ])
+        listings = list(Listing.objects.order_by('pk'))
+        Review.objects.bulk_create([
+            Review(listing=listings[index], reviewer=users[index % len(users)], rating=1 + index % 5)
+            for index in range(MIN_ROWS)
+        ])
+        start = date(2030, 1, 1)
+        Booking.objects.bulk_create([
+            Booking(
+                listing=listings[index],
+                user=users[index % len(users)],
+                check_in_date=start + timedelta(days=index % 300),
+                check_out_date=start + timedelta(days=index % 300 + 2),
+                total_price=Decimal('100.00'),
+                status=('pending', 'confirmed')[index % 2],
+            )
+            for index in range(MIN_ROWS)
+        ])
+        # bulk_create skips the signals that keep the trending scores.
+        trending.rebuild_scores()
+
+    def test_no_full_scans_or_sorts(self):
+        # Raises CommandError naming the endpoints whose plans scan or sort.
+        call_command('check_query_plans', '--analyze', stdout=StringIO(), stderr=StringIO())
+
+    def test_missing_index_is_reported(self):
+        index = next(index for index in Listing._meta.indexes if index.name == 'listing_price_active_idx')
+        editor = connection.schema_editor()
+        with connection.cursor() as cursor:
+            cursor.execute(editor.sql_delete_index % {
+                'name': editor.quote_name(index.name), 'table': editor.quote_name(Listing._meta.db_table),
+            })
+        # MySQL commits DDL at once, so put the index back rather than trust the rollback.
+        self.addCleanup(lambda: connection.cursor().execute(str(index.create_sql(Listing, editor))))
+
+        with self.assertRaisesMessage(CommandError, 'listings by price') as failure:
+            call_command('check_query_plans', '--analyze', stdout=StringIO(), stderr=StringIO())
+        self.assertNotIn('listings by type', str(failure.exception))
+
+
+def create_booking(check_in=date(2030, 1, 1)):
+    user = User.objects.create_user('guest', password='guest')
+    listing = Listing.objects.create(
+        title='Lakeside cabin', description='Quiet', listing_type='hotel',
+        price=Decimal('80.00'), location='Bahir Dar', created_by=user,
+    )
+    return Booking.objects.create(
+        listing=listing, user=user, check_in_date=check_in,
+        check_out_date=check_in + timedelta(days=2), total_price=Decimal('160.00'),
+    )
+
+
+class TransitionTests(TestCase):
+    """Each status change applies only over the status and version it read."""
+
+    def test_one_of_many_stale_copies_wins(self):
+        booking = create_booking()
+        copies = [Booking.objects.get(pk=booking.pk) for _ in range(8)]
+        outcomes = []
+        for index, copy in enumerate(copies):
+            try:
+                transitions.move(copy, ('confirmed', 'cancelled')[index % 2])
+            except transitions.StatusConflict as exc:
+                outcomes.append(exc.current)
+            else:
+                outcomes.append('moved')
+
+        self.assertEqual(outcomes.count('moved'), 1)
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'confirmed')
+        self.assertEqual(booking.version, 1)
+        self.assertEqual(outcomes[1:], [{'status': 'confirmed', 'version': 1}] * 7)
+
+    def test_invalid_transition_writes_nothing(self):
+        booking = create_booking()
+        transitions.move(booking, 'cancelled')
+        with self.assertRaises(transitions.InvalidTransition):
+            transitions.move(booking, 'confirmed')
+        booking.refresh_from_db()
+        self.assertEqual((booking.status, booking.version), ('cancelled', 1))
+
+    def test_move_all_is_one_update(self):
+        booking = create_booking()
+        for offset, status in enumerate(['confirmed', 'completed', 'cancelled'], start=1):
+            Booking.objects.create(
+                listing=booking.listing, user=booking.user, status=status, total_price=Decimal('80.00'),
+                check_in_date=booking.check_in_date + timedelta(days=10 * offset),
+                check_out_date=booking.check_in_date + timedelta(days=10 * offset + 1),
+            )
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks() as published:
+            moved, not_allowed = transitions.move_all(Booking.objects.all(), 'cancelled')
+
+        self.assertEqual((moved, not_allowed), (2, 1))
+        statements = [query['sql'].split()[0] for query in queries]
+        self.assertEqual([verb for verb in statements if verb in ('SELECT', 'UPDATE')], ['SELECT', 'SELECT', 'UPDATE'])
+        self.assertEqual(len(published), 2)
+        self.assertEqual(
+            sorted(Booking.objects.values_list('status', 'version')),
+            [('cancelled', 0), ('cancelled', 1), ('cancelled', 1), ('completed', 0)],
+        )
+
+
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class TransitionRaceTests(TransactionTestCase):
+    """Threads on their own connections race to move one booking."""
+
+    THREADS = 8
+
+    def test_exactly_one_winner(self):
+        booking = create_booking()
+        barrier = threading.Barrier(self.THREADS)
+        outcomes = []
+
+        def contend(target):
+            try:
+                copy = Booking.objects.get(pk=booking.pk)
+                barrier.wait()
+                try:
+                    transitions.move(copy, target)
+                except transitions.StatusConflict:
+                    outcomes.append('conflict')
+                else:
+                    outcomes.append(target)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=contend, args=(('confirmed', 'cancelled')[index % 2],))
+            for index in range(self.THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        winners = [outcome for outcome in outcomes if outcome != 'conflict']
+        self.assertEqual(len(outcomes), self.THREADS)
+        self.assertEqual(len(winners), 1)
+        booking.refresh_from_db()
+        self.assertEqual((booking.status, booking.version), (winners[0], 1))
+
+
+class BookingAdminConflictTests(TestCase):
+    """A save that loses a race is rolled back, not reported as a success."""
+
+    def setUp(self):
+        self.booking = create_booking()
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_login(admin_user)
+
+    def changed_after_clean(self):
+        """Patch the form so another writer confirms the booking right after validation"""
+        clean = BookingAdminForm.clean
+        pk = self.booking.pk
+
+        def clean_then_change(form):
+            cleaned_data = clean(form)
+            Booking.objects.filter(pk=pk).update(status='confirmed', version=F('version') + 1)
+            return cleaned_data
+
+        return mock.patch.object(BookingAdminForm, 'clean', clean_then_change)
+
+    def assert_refused(self, response):
+        self.assertEqual(response.status_code, 302)
+        messages = [str(message) for message in response.wsgi_request._messages]
+        self.assertEqual(len(messages), 1)
+        self.assertIn('changed by someone else', messages[0])
+        self.assertFalse(LogEntry.objects.exists())
+        # The change form validates inside its transaction, so the other write is undone with it.
+        self.assertNotEqual(Booking.objects.get(pk=self.booking.pk).status, 'cancelled')
+
+    def test_change_form(self):
+        url = reverse('admin:listings_booking_change', args=[self.booking.pk])
+        data = {
+            'listing': self.booking.listing_id,
+            'user': self.booking.user_id,
+            'check_in_date': '2030-01-01',
+            'check_out_date': '2030-01-03',
+            'number_of_guests': 1,
+            'total_price': '160.00',
+            'status': 'cancelled',
+            'initial-status': 'pending',
+            'expected_version': 0,
+            'special_requests': '',
+        }
+        with self.changed_after_clean():
+            response = self.client.post(url, data)
+        self.assert_refused(response)
+        self.assertEqual(response['Location'], url)
+
+    def test_changelist(self):
+        url = reverse('admin:listings_booking_changelist')
+        data = {
+            'form-TOTAL_FORMS': 1,
+            'form-INITIAL_FORMS': 1,
+            'form-0-id': self.booking.pk,
+            'form-0-status': 'cancelled',
+            'initial-form-0-status': 'pending',
+            'form-0-expected_version': 0,
+            '_save': 'Save',
+        }
+        with self.changed_after_clean():
+            response = self.client.post(url, data)
+        self.assert_refused(response)
+
+
+class RollupTests(TestCase):
+    """Incremental rollups also rebuild the days bookings and reviews stop counting on."""
+
+    def nights(self):
+        return list(ListingDailyStats.objects.filter(nights_booked__gt=0).values_list('date', flat=True))
+
+    def test_moved_and_deleted_bookings(self):
+        # Inside the window full runs rebuild.
+        check_in = timezone.localdate() + timedelta(days=7)
+        booking = create_booking(check_in)
+        analytics.run_rollup(full=True)
+        self.assertEqual(self.nights(), [check_in, check_in + timedelta(days=1)])
+
+        booking.check_in_date, booking.check_out_date = check_in + timedelta(days=10), check_in + timedelta(days=11)
+        booking.save()
+        analytics.run_rollup()
+        self.assertEqual(self.nights(), [check_in + timedelta(days=10)])
+
+        booking.delete()
+        analytics.run_rollup()
+        self.assertEqual(self.nights(), [])
+
+    def test_edited_and_deleted_reviews(self):
+        booking = create_booking(timezone.localdate() + timedelta(days=7))
+        review = Review.objects.create(listing=booking.listing, reviewer=booking.user, rating=2)
+        analytics.run_rollup(full=True)
+
+        review.rating = 5
+        review.save()
+        analytics.run_rollup()
+        self.assertEqual(ListingDailyStats.objects.get(new_reviews=1).rating_sum, 5)
+
+        review.delete()
+        analytics.run_rollup()
+        self.assertFalse(ListingDailyStats.objects.filter(new_reviews__gt=0).exists())
+
+    def test_stale_ranges_stay_apart(self):
+        booking = create_booking(timezone.localdate() + timedelta(days=7))
+        analytics.run_rollup(full=True)
+        day = booking.check_in_date + timedelta(days=20)
+        # Left alone by a rebuild that only covers the stale days on either side.
+        ListingDailyStats.objects.create(listing=booking.listing, host=booking.user, date=day, new_reviews=1)
+        analytics.mark_stale(booking.listing_id, day - timedelta(days=10), day - timedelta(days=5))
+        analytics.mark_stale(booking.listing_id, day + timedelta(days=5), day + timedelta(days=10))
+        analytics.mark_stale(booking.listing_id, day + timedelta(days=11), day + timedelta(days=12))
+
+        ranges, _ = analytics.stale_ranges()
+        self.assertEqual(ranges, {booking.listing_id: [
+            (day - timedelta(days=10), day - timedelta(days=5)),
+            (day + timedelta(days=5), day + timedelta(days=12)),
+        ]})
+        analytics.run_rollup()
+        self.assertTrue(ListingDailyStats.objects.filter(date=day, new_reviews=1).exists())
+
+    def test_stale_days_before_archive_cutoff_keep_archived_bookings(self):
+        check_in = archive.archive_cutoff() - timedelta(days=30)
+        booking = create_booking(check_in)
+        Booking.objects.filter(pk=booking.pk).update(
+            status='completed', updated_at=timezone.now() - timedelta(days=400),
+        )
+        self.assertEqual(archive.archive_old_bookings(), 1)
+        self.assertTrue(ArchivedBooking.objects.filter(pk=booking.pk).exists())
+
+        analytics.mark_stale(booking.listing_id, check_in, check_in + timedelta(days=1))
+        analytics.run_rollup()
+        self.assertEqual(self.nights(), [check_in, check_in + timedelta(days=1)])
+        self.assertEqual(
+            sum(ListingDailyStats.objects.values_list('revenue_completed', flat=True)), Decimal('160.00'),
+        )
+
+
+@mock.patch.dict('os.environ', {'CHAPA_SECRET_KEY': 'test-key'})
+class PaymentVerifyTests(TestCase):
+    """A verified payment confirms its booking before the guest is told it is confirmed."""
+
+    def setUp(self):
+        self.booking = create_booking()
+        self.booking.user.email = 'guest@example.com'
+        self.booking.user.save()
+        self.payment = Payment.objects.create(booking=self.booking, amount=Decimal('160.00'), transaction_id='tx-1')
+        self.client.force_login(self.booking.user)
+
+    def verify(self, chapa_status='success'):
+        chapa = mock.Mock(status_code=200)
+        chapa.json.return_value = {'data': {'status': chapa_status}}
+        with mock.patch('requests.get', return_value=chapa), \
+                mock.patch('listings.views.send_payment_confirmation') as task, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(reverse('payment-verify', args=[self.booking.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.booking.refresh_from_db()
+        return task.delay
+
+    def test_confirms_booking_then_emails(self):
+        delay = self.verify()
+        self.assertEqual(self.booking.status, 'confirmed')
+        delay.assert_called_once_with(self.payment.pk)
+
+        send_payment_confirmation(self.payment.pk)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_cancelled_booking_is_not_confirmed(self):
+        transitions.move(self.booking, 'cancelled')
+        delay = self.verify()
+        self.assertEqual(self.booking.status, 'cancelled')
+        delay.assert_not_called()
+
+        # A payment completed some other way still gets no email claiming otherwise.
+        send_payment_confirmation(self.payment.pk)
+        self.assertEqual(mail.outbox, [])
+
+
+class TrendingPageTests(TestCase):
+    """Keyset pages of the trending listings cover every row once, ties included."""
+
+    @classmethod
+    def setUpTestData(cls):
+        host = User.objects.create_user('host')
+        listings = Listing.objects.bulk_create([
+            Listing(
+                title=f'Listing {index}', description='Trending', listing_type='hotel',
+                price=Decimal('50.00'), location='Gondar', created_by=host,
+            )
+            for index in range(7)
+        ])
+        # Pairs of equal scores straddle the page boundaries.
+        ListingPopularity.objects.bulk_create([
+            ListingPopularity(
+                listing=listing, listing_type=listing.listing_type, location=listing.location,
+                score=float(index // 2),
+            )
+            for index, listing in enumerate(listings)
+        ])
+
+    def test_pages_follow_next(self):
+        expected = list(
+            ListingPopularity.objects.order_by('-score', '-listing_id').values_list('listing_id', flat=True)
+        )
+        seen = []
+        url = reverse('listing-trending')
+        while url:
+            with mock.patch.object(PageNumberPagination, 'page_size', 2):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(result['id'] for result in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('listing-trending'), {'cursor': 'not a cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class TrendingScoreTests(TestCase):
+    """Scores kept up by the signals agree with a rebuild, and older activity counts less."""
+
+    def test_incremental_scores_match_rebuild(self):
+        host = User.objects.create_user('host')
+        guest = User.objects.create_user('guest')
+        lodge, cabin, villa = Listing.objects.bulk_create([
+            Listing(
+                title=title, description='Trending', listing_type='hotel',
+                price=Decimal('50.00'), location='Gondar', created_by=host,
+            )
+            for title in ('Lodge', 'Cabin', 'Villa')
+        ])
+        check_in = date(2030, 1, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(
+                listing=lodge, user=guest, check_in_date=check_in,
+                check_out_date=check_in + timedelta(days=1), total_price=Decimal('50.00'),
+            )
+            # Cancelled stays do not count.
+            Booking.objects.create(
+                listing=villa, user=guest, status='cancelled', check_in_date=check_in,
+                check_out_date=check_in + timedelta(days=1), total_price=Decimal('50.00'),
+            )
+            Review.objects.create(listing=cabin, reviewer=guest, rating=5)
+            Review.objects.create(listing=cabin, reviewer=host, rating=1)
+
+        incremental = dict(ListingPopularity.objects.values_list('listing_id', 'score'))
+        trending.rebuild_scores()
+        rebuilt = dict(ListingPopularity.objects.values_list('listing_id', 'score'))
+        self.assertEqual(set(incremental), {lodge.pk, cabin.pk})
+        self.assertEqual(set(rebuilt), set(incremental))
+        for listing_id, score in rebuilt.items():
+            self.assertAlmostEqual(incremental[listing_id], score, places=3)
+
+        # A booking weighs 3, the two reviews 1.75 + 0.75.
+        response = self.client.get(reverse('listing-trending'))
+        self.assertEqual([result['id'] for result in response.data['results']], [lodge.pk, cabin.pk])
+
+    def test_half_life_decay(self):
+        now = timezone.now()
+        half_life_ago = now - timedelta(days=settings.TRENDING_HALF_LIFE_DAYS)
+        self.assertAlmostEqual(trending.decayed_popularity(trending.log_weight(2.0, half_life_ago), now), 1.0)
+        self.assertAlmostEqual(trending.decayed_popularity(trending.log_weight(2.0, now), now), 2.0)
+
+
+class SimilarListingTests(TestCase):
+    """Listings short of text or audience matches are topped up from their type, location and price band."""
+
+    def test_top_up_fallback(self):
+        host = User.objects.create_user('host')
+        specs = [
+            ('Alpha', 'Riverside terrace', 'Gondar', '100.00'),
+            ('Bravo', 'Quiet', 'Gondar', '110.00'),
+            ('Charlie', 'Riverside garden', 'Gondar', '400.00'),
+            ('Delta', 'Central', 'Gondar', '1000.00'),
+            ('Echo', 'Lakeside', 'Bahir Dar', '100.00'),
+        ]
+        listings = {
+            title: Listing.objects.create(
+                title=title, description=description, listing_type='hotel',
+                price=Decimal(price), location=location, created_by=host,
+            )
+            for title, description, location, price in specs
+        }
+        self.assertEqual(similarity.compute_similar_listings(k=2), (5, 8))
+
+        def neighbours(title):
+            response = self.client.get(reverse('listing-similar', args=[listings[title].pk]))
+            self.assertEqual(response.status_code, 200)
+            return [result['title'] for result in response.data], [result['similarity'] for result in response.data]
+
+        # Charlie shares a word; Bravo fills the free slot from the nearest price band.
+        titles, scores = neighbours('Alpha')
+        self.assertEqual(titles, ['Charlie', 'Bravo'])
+        self.assertGreater(scores[0], scores[1])
+        self.assertEqual(neighbours('Bravo')[0], ['Alpha', 'Charlie'])
+        self.assertEqual(neighbours('Delta')[0][0], 'Charlie')
+        # Nothing else is a hotel in Bahir Dar.
+        self.assertEqual(neighbours('Echo')[0], [])
+
+
+class SparseFieldsTests(TestCase):
+    """``?fields=`` and ``?omit=`` trim the response and the columns and joins behind it."""
+
+    def setUp(self):
+        cache.clear()
+        host = User.objects.create_user('host')
+        self.listing = Listing.objects.create(
+            title='Hill lodge', description='A long description nobody asked for', listing_type='hotel',
+            price=Decimal('99.99'), location='Gondar', created_by=host,
+        )
+        Review.objects.create(listing=self.listing, reviewer=User.objects.create_user('guest'), rating=5, comment='Lovely')
+
+    def get_list(self, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('listing-list'), params)
+        self.assertEqual(response.status_code, 200)
+        listing_queries = [query['sql'] for query in queries if 'FROM "listings_listing"' in query['sql']]
+        return response.data['results'], listing_queries, ' '.join(query['sql'] for query in queries)
+
+    def test_fields_prune_the_query(self):
+        results, listing_queries, sql = self.get_list({'fields': 'id,title'})
+        self.assertEqual(results, [{'id': self.listing.pk, 'title': 'Hill lodge'}])
+        self.assertNotIn('"description"', listing_queries[-1])
+        self.assertNotIn('auth_user', sql)
+        self.assertNotIn('listings_review', sql)
+
+    def test_omit_keeps_the_rest(self):
+        results, listing_queries, sql = self.get_list({'omit': 'reviews,description'})
+        self.assertNotIn('reviews', results[0])
+        self.assertNotIn('description', results[0])
+        self.assertEqual(results[0]['created_by']['username'], 'host')
+        self.assertIn('auth_user', listing_queries[-1])
+        self.assertNotIn('listings_review', sql)
+
+        full, _, sql = self.get_list({'page': 1})
+        self.assertEqual(full[0]['reviews'][0]['comment'], 'Lovely')
+        self.assertIn('listings_review', sql)
+
+    def test_unknown_field(self):
+        response = self.client.get(reverse('listing-list'), {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', str(response.data))
+
+
+class ThrottleTests(TestCase):
+    """Buckets let a client burst to the rate's limit, then refill at the steady rate."""
+
+    def setUp(self):
+        cache.clear()
+        self.store = throttling.LocalBucketStore()
+        patcher = mock.patch.object(throttling, '_store', self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_bucket_refills(self):
+        with mock.patch('listings.throttling.time.monotonic', return_value=1000.0) as clock:
+            states = [self.store.take('bucket', capacity=3, rate=0.5) for _ in range(4)]
+            self.assertEqual([state.allowed for state in states], [True, True, True, False])
+            self.assertEqual([state.remaining for state in states], [2, 1, 0, 0])
+            self.assertEqual(states[-1].wait, 2.0)
+            self.assertEqual(states[-1].reset, 6.0)
+
+            clock.return_value = 1001.0
+            self.assertFalse(self.store.take('bucket', capacity=3, rate=0.5).allowed)
+            clock.return_value = 1002.0
+            self.assertTrue(self.store.take('bucket', capacity=3, rate=0.5).allowed)
+            # Other keys have buckets of their own.
+            self.assertEqual(self.store.take('other', capacity=3, rate=0.5).remaining, 2)
+
+    def test_search_bucket_and_headers(self):
+        url = reverse('listing-list')
+        with mock.patch.dict(throttling.TokenBucketThrottle.THROTTLE_RATES, {'search': '2/min'}):
+            first = self.client.get(url, {'search': 'lodge'})
+            second = self.client.get(url, {'search': 'cabin'})
+            third = self.client.get(url, {'search': 'villa'})
+            browse = self.client.get(url)
+
+        self.assertEqual([first.status_code, second.status_code, third.status_code], [200, 200, 429])
+        self.assertEqual([first['RateLimit-Limit'], first['RateLimit-Remaining']], ['2', '1'])
+        self.assertEqual(second['RateLimit-Remaining'], '0')
+        self.assertEqual(second['RateLimit-Reset'], '60')
+        self.assertEqual(third['Retry-After'], '30')
+        # Browsing without a search term only draws from the anon bucket.
+        self.assertEqual(browse.status_code, 200)
+        self.assertEqual(browse['RateLimit-Limit'], '120')
+        self.assertEqual(browse['RateLimit-Remaining'], '116')
+
+
+class ResponseCacheTests(TestCase):
+    """A changed listing drops the list pages and its own details; other listings stay cached."""
+
+    def setUp(self):
+        cache.clear()
+        host = User.objects.create_user('host')
+        self.lodge, self.cabin = [
+            Listing.objects.create(
+                title=title, description='Views', listing_type='hotel', price=Decimal('80.00'),
+                location='Gondar', created_by=host,
+            )
+            for title in ('Hill lodge', 'Lake cabin')
+        ]
+        patcher = mock.patch('listings.tasks.warm_caches.apply_async')
+        self.warm = patcher.start()
+        self.addCleanup(patcher.stop)
+        # Fresh counts, so no flush of the access stats lands among the hits.
+        patcher = mock.patch.object(warming, 'stats', warming.AccessStats())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response[warming.CACHE_HEADER], response.data
+
+    def test_scoped_invalidation(self):
+        urls = {
+            'list': reverse('listing-list'),
+            'lodge': reverse('listing-detail', args=[self.lodge.pk]),
+            'cabin': reverse('listing-detail', args=[self.cabin.pk]),
+        }
+        self.assertEqual({name: self.read(url)[0] for name, url in urls.items()}, dict.fromkeys(urls, 'MISS'))
+        with self.assertNumQueries(0):
+            self.assertEqual({name: self.read(url)[0] for name, url in urls.items()}, dict.fromkeys(urls, 'HIT'))
+
+        self.lodge.title = 'Hill lodge with pool'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lodge.save()
+
+        state, data = self.read(urls['list'])
+        self.assertEqual((state, sorted(result['title'] for result in data['results'])), (
+            'MISS', ['Hill lodge with pool', 'Lake cabin'],
+        ))
+        state, data = self.read(urls['lodge'])
+        self.assertEqual((state, data['title']), ('MISS', 'Hill lodge with pool'))
+        self.assertEqual(self.read(urls['cabin'])[0], 'HIT')
+        self.warm.assert_called_once()
+
+        # A new generation drops everything.
+        warming.invalidate()
+        self.assertEqual(self.read(urls['cabin'])[0], 'MISS')
+
+    def test_authenticated_reads_skip_the_cache(self):
+        self.client.force_login(self.lodge.created_by)
+        response = self.client.get(reverse('listing-list'))
+        self.assertNotIn(warming.CACHE_HEADER, response)
+
+
+class IdempotencyTests(TestCase):
+    """Retries with the same Idempotency-Key get the first response back, headers included."""
+
+    class CreateView(APIView):
+        permission_classes = []
+        calls = 0
+        # Set by a test to make the lock change hands while the view runs.
+        taken_over = False
+        lock_key = None
+
+        @idempotent
+        def post(self, request):
+            type(self).calls += 1
+            if self.taken_over:
+                type(self).lock_key = _cache_key(request, 'retry-me') + ':lock'
+                cache.set(self.lock_key, 'another request', 60)
+            return Response(
+                {'call': self.calls}, status=201, headers={'Location': f'/things/{self.calls}/'},
+                content_type='application/vnd.things+json',
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.CreateView.calls = 0
+        self.CreateView.taken_over = False
+        self.view = self.CreateView.as_view()
+
+    def post(self):
+        request = APIRequestFactory().post('/things/', {'name': 'x'}, format='json', HTTP_IDEMPOTENCY_KEY='retry-me')
+        response = self.view(request)
+        response.render()
+        return response
+
+    def test_replay_keeps_headers(self):
+        first = self.post()
+        again = self.post()
+        self.assertEqual(self.CreateView.calls, 1)
+        self.assertEqual(again.status_code, 201)
+        self.assertEqual(again.content, first.content)
+        self.assertEqual(again['Location'], '/things/1/')
+        self.assertEqual(again['Content-Type'], first['Content-Type'])
+        self.assertEqual(again['Idempotent-Replayed'], 'true')
+
+    def test_lock_taken_over_is_kept(self):
+        self.CreateView.taken_over = True
+        self.post()
+        self.assertEqual(cache.get(self.CreateView.lock_key), 'another request')
+
+
+class ImportTests(TestCase):
+    """Rows that would break the INSERT are reported without a query per row."""
+
+    def test_constraint_and_taken_id_rows_are_errors(self):
+        booking = create_booking()
+        row = {
+            'listing_id': booking.listing_id, 'user_id': booking.user_id, 'check_in_date': '2031-01-01',
+            'check_out_date': '2031-01-03', 'number_of_guests': '2', 'total_price': '100.00',
+        }
+        rows = [
+            dict(row, id=str(booking.pk)),
+            dict(row, id='9001', number_of_guests='0'),
+            dict(row, id='9002', total_price='-1.00'),
+            dict(row, id='9003'),
+            dict(row, id='9003'),
+        ]
+        # Two foreign key lookups, the taken ids and the INSERT, inside a savepoint.
+        with self.assertNumQueries(6):
+            result = bulk.import_rows('bookings', rows, keep_ids=True)
+
+        self.assertEqual(result.created, 1)
+        self.assertEqual(dict(result.errors), {
+            1: {'id': ['Already exists.']},
+            2: {'number_of_guests': ['Must be at least 1.']},
+            3: {'total_price': ['Cannot be negative.']},
+            5: {'id': ['Repeats the id of an earlier row.']},
+        })
+        self.assertEqual(Booking.objects.get(pk=9003).number_of_guests, 2)
+
+
+class ReviewScheduleTests(TestCase):
+    """A broker outage skips scheduling the review job instead of failing the write."""
+
+    def test_broker_down(self):
+        cache.clear()
+        booking = create_booking()
+        with mock.patch('listings.tasks.process_review_activity.apply_async', side_effect=OSError('broker down')), \
+                self.assertLogs('listings.reviews', 'WARNING'), \
+                self.captureOnCommitCallbacks(execute=True):
+            review = Review.objects.create(listing=booking.listing, reviewer=booking.user, rating=4)
+
+        self.assertFalse(Review.objects.get(pk=review.pk).processed)
+        # The next review tries to schedule the run again.
+        self.assertIsNone(cache.get(reviews.SCHEDULED_KEY))
+
+
+class TokenCacheTests(TestCase):
+    """A process that misses locally builds the token's user from the shared cache."""
+
+    def test_shared_hit_needs_no_query(self):
+        user = User.objects.create_user('guest', password='guest')
+        token = Token.objects.create(user=user)
+        auth = CachedTokenAuthentication()
+        cache.clear()
+        auth.authenticate_credentials(token.key)
+        authentication._local_tokens.clear()
+
+        with self.assertNumQueries(0):
+            cached_user, _ = auth.authenticate_credentials(token.key)
+        self.assertEqual((cached_user.pk, cached_user.username), (user.pk, 'guest'))
+        self.assertNotIn(user.password, str(cache.get(authentication._cache_key(token.key))))
+
+        # The hash was never cached, and saving the cached user keeps it.
+        cached_user.first_name = 'Guest'
+        cached_user.save()
+        self.assertTrue(User.objects.get(pk=user.pk).check_password('guest'))
+
+        user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        with self.assertRaises(AuthenticationFailed):
+            auth.authenticate_credentials(token.key)
+
+
+class SchemaEncodingTests(SimpleTestCase):
+    """The schema is sent gzipped only to clients whose Accept-Encoding allows it."""
+
+    def get(self, accept_encoding):
+        artifact = schema.SchemaArtifact(b'{"openapi": "stub"}', 'application/json')
+        with mock.patch.dict(schema._artifacts, {'.json': artifact}):
+            request = RequestFactory().get('/swagger.json', HTTP_ACCEPT_ENCODING=accept_encoding)
+            return schema.schema_file_view(request, format='.json')
+
+    def test_negotiation(self):
+        for accept_encoding, gzipped in [
+            ('gzip, deflate, br', True),
+            ('br;q=1.0, gzip;q=0.5', True),
+            ('*', True),
+            ('gzip;q=0, *', False),
+            ('gzip;q=0.000', False),
+            ('*;q=0', False),
+            ('identity', False),
+            ('', False),
+        ]:
+            with self.subTest(accept_encoding):
+                response = self.get(accept_encoding)
+                self.assertEqual(response.has_header('Content-Encoding'), gzipped)
+                body = gzip.decompress(response.content) if gzipped else response.content
+                self.assertEqual(body, b'{"openapi": "stub"}')
+                self.assertIn('Accept-Encoding', response['Vary'])
+
+
+class ResponseEncodingTests(TestCase):
+    """API bodies render as DRF would and go out compressed in the encoding the client prefers."""
+
+    def setUp(self):
+        cache.clear()
+        host = User.objects.create_user('host')
+        for number in range(8):
+            Listing.objects.create(
+                title=f'Hill lodge {number}', description='Views over the valley ' * 5, listing_type='hotel',
+                price=Decimal('99.99'), location='Gondar', created_by=host,
+            )
+
+    def test_orjson_matches_drf(self):
+        data = {
+            'price': Decimal('99.90'), 'when': timezone.now(), 'day': date(2030, 1, 2),
+            'text': 'line\u2028separator', 1: [None, True, 1.5],
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_negotiated_compression(self):
+        url = reverse('listing-list')
+        plain = self.client.get(url)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+        self.assertGreater(len(plain.content), settings.COMPRESSION_MIN_SIZE)
+
+        cases = [('gzip, br', 'br', brotli.decompress), ('br;q=0, gzip', 'gzip', gzip.decompress)]
+        for header, encoding, decompress in cases:
+            with self.subTest(header=header):
+                response = self.client.get(url, HTTP_ACCEPT_ENCODING=header)
+                self.assertEqual(response['Content-Encoding'], encoding)
+                self.assertLess(len(response.content), len(plain.content))
+                self.assertEqual(decompress(response.content), plain.content)
+
+        self.assertNotIn('Content-Encoding', self.client.get(url, HTTP_ACCEPT_ENCODING='identity'))
+
+
+class DisplayCurrencyTests(TestCase):
+    """``?currency=`` adds prices converted from each listing's own currency."""
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(currency, '_rates', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        now = timezone.now()
+        currency.store_rates([
+            ExchangeRate(currency='ETB', rate=Decimal('57.5'), updated_at=now),
+            ExchangeRate(currency='EUR', rate=Decimal('0.92'), updated_at=now),
+        ])
+        host = User.objects.create_user('host')
+        for title, price, code in [('Birr lodge', '5750.00', 'ETB'), ('Dollar lodge', '120.00', 'USD')]:
+            Listing.objects.create(
+                title=title, description='Views', listing_type='hotel', price=Decimal(price),
+                currency=code, location='Gondar', created_by=host,
+            )
+
+    def prices(self, code):
+        response = self.client.get(reverse('listing-list'), {'currency': code, 'ordering': 'title'})
+        self.assertEqual(response.status_code, 200)
+        return [
+            (result['price'], result['currency'], result['display_price'], result['display_currency'])
+            for result in response.data['results']
+        ]
+
+    def test_converted_prices(self):
+        self.assertEqual(self.prices('eur'), [
+            ('5750.00', 'ETB', '92.00', 'EUR'),
+            ('120.00', 'USD', '110.40', 'EUR'),
+        ])
+        self.assertEqual(self.prices('ETB')[1], ('120.00', 'USD', '6900.00', 'ETB'))
+        self.assertNotIn('display_price', self.client.get(reverse('listing-list')).data['results'][0])
+
+    def test_unknown_currency(self):
+        response = self.client.get(reverse('listing-list'), {'currency': 'XYZ'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('XYZ', str(response.data['currency']))
+
+    @override_settings(FX_VERSION_CHECK_SECONDS=0)
+    def test_new_rates_replace_the_process_copy(self):
+        self.assertEqual(currency.current_rates().rates['EUR'], Decimal('0.92'))
+        later = timezone.now() + timedelta(minutes=1)
+        currency.store_rates([ExchangeRate(currency='EUR', rate=Decimal('0.95'), updated_at=later)])
+        # Until the version stamp moves, this process keeps its copy.
+        self.assertEqual(currency.current_rates().rates['EUR'], Decimal('0.92'))
+        cache.set(currency.VERSION_KEY, later.isoformat(), None)
+        with self.assertNumQueries(1):
+            self.assertEqual(currency.current_rates().rates['EUR'], Decimal('0.95'))
+        with self.assertNumQueries(0):
+            currency.current_rates()
+
+
+class QuoteTests(TestCase):
+    """Quotes from the prefix-sum calendar match pricing every night one by one."""
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user('host')
+        self.listing = Listing.objects.create(
+            title='Hill lodge', description='Views', listing_type='hotel', price=Decimal('99.99'),
+            location='Gondar', created_by=user, included_guests=2, extra_guest_fee=Decimal('12.50'),
+        )
+        today = timezone.localdate()
+        self.rules = [
+            RateRule.objects.create(listing=self.listing, name='Weekend', weekdays='5,6', multiplier=Decimal('1.15')),
+            RateRule.objects.create(
+                listing=self.listing, name='Season', multiplier=Decimal('1.333'),
+                start_date=today + timedelta(days=20), end_date=today + timedelta(days=60),
+            ),
+        ]
+
+    def naive_total(self, check_in, check_out, guests):
+        total = Decimal(0)
+        night = check_in
+        while night < check_out:
+            price = self.listing.price
+            for rule in self.rules:
+                in_range = (rule.start_date or night) <= night <= (rule.end_date or night)
+                if in_range and (not rule.weekdays or str(night.isoweekday()) in rule.weekdays.split(',')):
+                    price *= rule.multiplier
+            total += price.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            total += max(guests - self.listing.included_guests, 0) * self.listing.extra_guest_fee
+            night += timedelta(days=1)
+        return total
+
+    def test_matches_naive_sum(self):
+        today = timezone.localdate()
+        stays = [(0, 1, 1), (3, 10, 2), (15, 70, 4), (55, 65, 3), (pricing.CALENDAR_DAYS - 3, pricing.CALENDAR_DAYS + 4, 5)]
+        for start, end, guests in stays:
+            check_in, check_out = today + timedelta(days=start), today + timedelta(days=end)
+            with self.subTest(start=start, end=end):
+                response = self.client.get(reverse('listing-quote', args=[self.listing.pk]), {
+                    'check_in_date': check_in, 'check_out_date': check_out, 'number_of_guests': guests,
+                })
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['nights'], end - start)
+                self.assertEqual(Decimal(response.json()['total_price']), self.naive_total(check_in, check_out, guests))
+
+
+class ProfilingTests(TestCase):
+    """Requests carrying the profiling token are captured with their SQL; others are left alone."""
+
+    def setUp(self):
+        cache.clear()
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def test_token_request_is_captured(self):
+        create_booking()
+        url = reverse('listing-list')
+        with self.settings(PROFILING_TOKEN='secret', PROFILING_DIR=self.dir, PROFILING_INTERVAL=0.001):
+            response = self.client.get(url, HTTP_X_PROFILE='secret')
+            self.assertNotIn('X-Profile-Id', self.client.get(url, HTTP_X_PROFILE='guess'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(os.listdir(self.dir), [response['X-Profile-Id'] + '.json.gz'])
+        with gzip.open(os.path.join(self.dir, response['X-Profile-Id'] + '.json.gz'), 'rt') as capture:
+            record = json.load(capture)
+        self.assertEqual(record['name'], 'GET listing-list')
+        self.assertEqual((record['trigger'], record['status']), ('header', 200))
+        self.assertGreater(record['sql']['queries'], 0)
+        self.assertTrue(any('"listings_listing"' in statement['sql'] for statement in record['sql']['top']))
+
+    def test_sampler_counts_the_thread_stack(self):
+        def spin(stop):
+            while not stop.is_set():
+                pass
+
+        stop = threading.Event()
+        worker = threading.Thread(target=spin, args=[stop])
+        worker.start()
+        sampler = profiling.Sampler([worker.ident], interval=0.001)
+        sampler.start()
+        time.sleep(0.05)
+        sampler.stop()
+        stop.set()
+        worker.join()
+
+        self.assertGreater(sampler.samples, 0)
+        stacks = sampler.folded()
+        self.assertEqual(sum(count for _, count in stacks), sampler.samples)
+        self.assertTrue(all(any(frame.endswith(':spin') for frame in frames) for frames, _ in stacks))
+
+
+class StartupImportTests(SimpleTestCase):
+    """Workers start without DRF's serializers, responses or requests."""
+
+    def test_worker_skips_request_modules(self):
+        stdout = StringIO()
+        # Raises CommandError naming the import chain of any such module.
+        call_command('profile_startup', '--target', 'worker', '--repeat', '1', '--top', '1', stdout=stdout)
+        self.assertIn('modules imported', stdout.getvalue())
+
+    def test_import_chain(self):
+        # -X importtime order: children first, each followed by its parents.
+        imports = [
+            ('requests', 10, 10, 3),
+            ('rest_framework.serializers', 5, 20, 2),
+            ('listings.warming', 1, 30, 1),
+            ('listings.other', 1, 1, 1),
+            ('listings.signals', 1, 40, 0),
+        ]
+        self.assertEqual(
+            profile_startup.import_chain(imports, 0),
+            ['requests', 'rest_framework.serializers', 'listings.warming', 'listings.signals'],
+        )
+
+
+class EventBrokerTests(SimpleTestCase):
+    """Each published event reaches every open stream of its user and no one else's."""
+
+    async def test_fan_out(self):
+        broker = events.InMemoryBroker()
+        message = events.booking_status_event(7, 'confirmed')
+        async with broker.subscribe(events.channel_for(1)) as phone, \
+                broker.subscribe(events.channel_for(1)) as laptop, \
+                broker.subscribe(events.channel_for(2)) as stranger:
+            # Published from another thread, as a sync view or worker would.
+            await asyncio.to_thread(broker.publish, events.channel_for(1), message)
+            self.assertEqual(await asyncio.wait_for(phone.get(), 1), message)
+            self.assertEqual(await asyncio.wait_for(laptop.get(), 1), message)
+            self.assertTrue(stranger.queue.empty())
+        self.assertEqual(dict(broker._subscribers), {})
+
+    @override_settings(EVENTS_QUEUE_SIZE=2)
+    async def test_stream_that_falls_behind_is_ended(self):
+        broker = events.InMemoryBroker()
+        async with broker.subscribe(events.channel_for(1)) as stream:
+            for status in ('pending', 'confirmed', 'cancelled'):
+                broker.publish(events.channel_for(1), events.booking_status_event(7, status))
+            await asyncio.sleep(0)
+            self.assertIsNone(await asyncio.wait_for(stream.get(), 1))
@@ -0,0 +1,267 @@
+"""
+Token-bucket request throttling.
+
+Every client gets a bucket per scope holding up to ``N`` tokens for a
+rate of ``N/period``; each request takes one and tokens come back at
+``N / period`` per second. Clients can burst up to ``N`` requests and are
+then held to the steady rate, instead of being locked out until a fixed
+window ends.
+
+A bucket is checked and updated in one atomic operation on the store
+named by ``THROTTLE_STORE_URL``:
+
+* ``memory://`` keeps buckets in this process. It needs no server and is
+  what tests and single-process setups use; with several processes each
+  one enforces the rate on its own.
+* ``redis://...`` runs a Lua script in Redis, one round trip per bucket,
+  with Redis's clock so servers with skewed clocks share buckets fairly.
+
+The outcome of the most restrictive bucket is sent back to clients as
+``RateLimit-*`` headers by ``RateLimitHeadersMiddleware``.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+MAX_LOCAL_BUCKETS = 100000
+
+# remaining is the whole tokens left; reset the seconds until the bucket is
+# full again; wait the seconds until a denied request could be allowed.
+BucketState = namedtuple('BucketState', ['allowed', 'limit', 'remaining', 'reset', 'wait'])
+
+
+def _state(allowed, capacity, rate, tokens, cost):
+    return BucketState(
+        allowed=allowed,
+        limit=capacity,
+        remaining=int(tokens),
+        reset=(capacity - tokens) / rate,
+        wait=0.0 if allowed else (cost - tokens) / rate,
+    )
+
+
+class LocalBucketStore:
+    """Buckets in this process, least recently used dropped first"""
+    is_local = True
+
+    def __init__(self, max_buckets=MAX_LOCAL_BUCKETS):
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_buckets = max_buckets
+
+    def take(self, key, capacity, rate, cost=1):
+        """Take ``cost`` tokens from the bucket at ``key`` if it holds enough"""
+        with self._lock:
+            now = time.monotonic()
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            # A bucket that refilled completely is the same as no bucket.
+            if tokens < capacity:
+                self._buckets[key] = (tokens, now)
+                if len(self._buckets) > self.max_buckets:
+                    self._buckets.popitem(last=False)
+        return _state(allowed, capacity, rate, tokens, cost)
+
+
+# KEYS[1] bucket; ARGV capacity, tokens per second, cost. Returns
+# {allowed, tokens}, tokens as a string since Lua numbers come back as
+# integers. The bucket expires once it would have refilled completely.
+TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisBucketStore:
+    """Buckets in Redis, shared by every process"""
+    is_local = False
+
+    def __init__(self, url):
+        import redis
+
+        self.url = url
+        self._client = redis.Redis.from_url(url)
+        # Sends EVALSHA and loads the script again only if Redis lost it.
+        self._take = self._client.register_script(TAKE_SCRIPT)
+
+    def take(self, key, capacity, rate, cost=1):
+        """Take ``cost`` tokens from the bucket at ``key`` if it holds enough"""
+        allowed, tokens = self._take(keys=[key], args=[capacity, repr(rate), cost])
+        return _state(bool(allowed), capacity, rate, float(tokens), cost)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return this process's bucket store for ``THROTTLE_STORE_URL``"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                url = settings.THROTTLE_STORE_URL
+                _store = LocalBucketStore() if url.startswith('memory://') else RedisBucketStore(url)
+    return _store
+
+
+def record(request, state):
+    """Remember a bucket's outcome for the rate-limit response headers"""
+    # DRF wraps the request; the middleware only sees the HttpRequest.
+    request = getattr(request, '_request', request)
+    if not hasattr(request, 'rate_limits'):
+        request.rate_limits = []
+    request.rate_limits.append(state)
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    ``SimpleRateThrottle`` with a token bucket in place of the list of
+    request times, so a check is one store operation of constant size.
+
+    Rates are read from ``DEFAULT_THROTTLE_RATES`` by ``scope`` in DRF's
+    ``'N/period'`` form; a rate of None turns the throttle off.
+    """
+    cache_format = 'throttle:%(scope)s:%(ident)s'
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+        return self.take(request, key)
+
+    def take(self, request, key):
+        """Take a token from the bucket at ``key`` and record the outcome"""
+        self.state = get_store().take(key, self.num_requests, self.num_requests / self.duration)
+        record(request, self.state)
+        return self.state.allowed
+
+    def wait(self):
+        return self.state.wait
+
+    def get_ident(self, request):
+        """``BaseThrottle.get_ident`` reading META directly instead of the slower ``request.headers``"""
+        xff = request.META.get('HTTP_X_FORWARDED_FOR')
+        remote_addr = request.META.get('REMOTE_ADDR')
+        num_proxies = api_settings.NUM_PROXIES
+
+        if num_proxies is not None:
+            if num_proxies == 0 or xff is None:
+                return remote_addr
+            addrs = xff.split(',')
+            return addrs[-min(num_proxies, len(addrs))].strip()
+        return ''.join(xff.split()) if xff else remote_addr
+
+    def client_ident(self, request):
+        """The user's pk when authenticated, otherwise the client address"""
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+    def key_for(self, ident):
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class AnonTokenBucketThrottle(TokenBucketThrottle):
+    """Per client address for unauthenticated requests"""
+    scope = 'anon'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.key_for(self.client_ident(request))
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """Per user for authenticated requests"""
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        if not (request.user and request.user.is_authenticated):
+            return None
+        return self.key_for(self.client_ident(request))
+
+
+class ScopedTokenBucketThrottle(TokenBucketThrottle):
+    """
+    Per client for views that set a ``throttle_scope``, such as the
+    payment views that call Chapa.
+    """
+    scope_attr = 'throttle_scope'
+
+    def __init__(self, scope=None):
+        # The rate usually depends on the view, so it is set in allow_request.
+        if scope:
+            self.use_scope(scope)
+
+    def use_scope(self, scope):
+        self.scope = scope
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+
+    def allow_request(self, request, view):
+        scope = getattr(view, self.scope_attr, None)
+        if not scope:
+            return True
+        self.use_scope(scope)
+        return super().allow_request(request, view)
+
+    def get_cache_key(self, request, view):
+        return self.key_for(self.client_ident(request))
+
+
+class SearchTokenBucketThrottle(TokenBucketThrottle):
+    """Per client for requests to searchable views that carry a search term"""
+    scope = 'search'
+
+    def get_cache_key(self, request, view):
+        if not getattr(view, 'search_fields', None):
+            return None
+        if not request.query_params.get(api_settings.SEARCH_PARAM, '').strip():
+            return None
+        return self.key_for(self.client_ident(request))
+
+
+def anonymous_wait(request, scopes):
+    """
+    Take a token from each of ``scopes`` for an anonymous client and
+    return how many seconds it must wait, or None if it may go ahead.
+
+    For the plain Django views of the async API, which serve anonymous
+    clients only; they share buckets with the DRF throttles.
+    """
+    waits = []
+    for scope in scopes:
+        throttle = ScopedTokenBucketThrottle(scope)
+        if throttle.rate is None:
+            continue
+        if not throttle.take(request, throttle.key_for(f'ip:{throttle.get_ident(request)}')):
+            waits.append(throttle.wait())
+    return math.ceil(max(waits)) if waits else None
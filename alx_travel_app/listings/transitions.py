@@ -0,0 +1,172 @@
+"""
+Booking and payment status changes as conditional UPDATEs.
+
+Every write goes out as one ``UPDATE ... WHERE id = %s AND status = %s
+AND version = %s`` that sets only the fields that changed, adds one to
+``version`` and stamps ``updated_at``. A writer that read the row before
+someone else changed it matches nothing and gets ``StatusConflict``
+(409), carrying the status and version the row has now, instead of
+silently undoing the other change. A status the current one cannot move
+to raises ``InvalidTransition`` (400) before anything is written.
+
+``update()`` sends no signals, so status changes are published to the
+owner here once the transaction commits.
+"""
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import exceptions, status
+
+from . import events
+from .models import Booking, Payment
+
+# The statuses each status may move to.
+TRANSITIONS = {
+    Booking: {
+        'pending': {'confirmed', 'cancelled'},
+        'confirmed': {'cancelled', 'completed'},
+        'cancelled': set(),
+        'completed': set(),
+    },
+    Payment: {
+        'pending': {'completed', 'failed'},
+        # A failed payment can still be retried and go through.
+        'failed': {'completed'},
+        'completed': set(),
+    },
+}
+
+
+class InvalidTransition(exceptions.ValidationError):
+    """The new status cannot follow the current one"""
+
+    def __init__(self, model, current, new):
+        self.current = current
+        self.new = new
+        super().__init__({
+            'status': [f'A {model._meta.verbose_name} cannot go from {current} to {new}.'],
+        })
+
+
+class StatusConflict(exceptions.APIException):
+    """The row changed since it was read; ``current`` is what it holds now"""
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'It was changed by someone else; reload it and try again.'
+    default_code = 'conflict'
+
+    def __init__(self, current=None):
+        # None when the row is gone.
+        self.current = current
+        super().__init__()
+        # Kept as is, so the version stays a number in the response.
+        self.detail = {'detail': self.detail, 'current': current}
+
+
+def allowed(model, current, new):
+    return new == current or new in TRANSITIONS[model].get(current, ())
+
+
+def check(model, current, new):
+    if not allowed(model, current, new):
+        raise InvalidTransition(model, current, new)
+
+
+def assign(instance, values):
+    """Set ``values`` on ``instance``; returns the names of the fields that changed"""
+    changed = []
+    for name, value in values.items():
+        field = instance._meta.get_field(name)
+        # Compare keys so related rows are not loaded just for this.
+        current = getattr(instance, field.attname)
+        new = value.pk if field.is_relation and value is not None else value
+        if current != new:
+            setattr(instance, name, value)
+            changed.append(name)
+    return changed
+
+
+def current_state(model, pk):
+    return model.objects.filter(pk=pk).values('status', 'version').first()
+
+
+def save(instance, fields, expected_status=None, expected_version=None):
+    """
+    Write ``fields`` of ``instance`` in one UPDATE that only matches while
+    the row still has ``expected_status`` and ``expected_version``, by
+    default the status and version it was loaded with. Returns whether
+    anything was written.
+    """
+    model = type(instance)
+    fields = [name for name in dict.fromkeys(fields) if name not in ('version', 'updated_at')]
+    if expected_status is None:
+        expected_status = instance._loaded_status
+    if expected_status is None:
+        # The status was deferred; the version still guards the write.
+        expected_status = current_state(model, instance.pk)['status']
+    if expected_version is None:
+        expected_version = instance.version
+    if 'status' in fields:
+        check(model, expected_status, instance.status)
+        if instance.status == expected_status:
+            fields.remove('status')
+    if not fields:
+        return False
+
+    now = timezone.now()
+    values = {
+        field.attname: getattr(instance, field.attname)
+        for field in (model._meta.get_field(name) for name in fields)
+    }
+    updated = model.objects.filter(
+        pk=instance.pk, status=expected_status, version=expected_version
+    ).update(**values, version=F('version') + 1, updated_at=now)
+    if not updated:
+        raise StatusConflict(current_state(model, instance.pk))
+
+    instance.version = expected_version + 1
+    instance.updated_at = now
+    if 'status' in fields:
+        publish_status(instance)
+    instance._loaded_status = instance.status
+    return True
+
+
+def move(instance, new_status, **changes):
+    """Move ``instance`` to ``new_status``, writing ``changes`` in the same UPDATE"""
+    return save(instance, assign(instance, {'status': new_status, **changes}))
+
+
+def move_all(queryset, new_status):
+    """
+    Move every booking of ``queryset`` whose status may go to ``new_status``
+    in one UPDATE that re-checks the status, so a booking changed meanwhile
+    to a status that cannot move is left alone. Returns ``(moved,
+    not_allowed)`` counts.
+    """
+    sources = [current for current, targets in TRANSITIONS[Booking].items() if new_status in targets]
+    pending = queryset.exclude(status=new_status)
+    not_allowed = pending.exclude(status__in=sources).count()
+    with transaction.atomic():
+        # Locked, so the owners told below are those of the rows the UPDATE moves.
+        rows = list(
+            pending.filter(status__in=sources).order_by().select_for_update().values_list('pk', 'user_id')
+        )
+        if not rows:
+            return 0, not_allowed
+        moved = Booking.objects.filter(pk__in=[pk for pk, _ in rows], status__in=sources).update(
+            status=new_status, version=F('version') + 1, updated_at=timezone.now()
+        )
+        for pk, user_id in rows:
+            events.publish_on_commit(user_id, events.booking_status_event(pk, new_status))
+    return moved, not_allowed
+
+
+def publish_status(instance):
+    """Push the status of ``instance`` to its owner once the transaction commits"""
+    if isinstance(instance, Booking):
+        events.publish_on_commit(instance.user_id, events.booking_status_event(instance.pk, instance.status))
+    else:
+        user_id = Booking.objects.filter(pk=instance.booking_id).values_list('user_id', flat=True).first()
+        events.publish_on_commit(
+            user_id, events.payment_status_event(instance.pk, instance.booking_id, instance.status)
+        )
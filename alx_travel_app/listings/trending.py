@@ -0,0 +1,198 @@
+"""
+Trending listings ranked by a time-decayed popularity score.
+
+Every booking and review adds a weight to its listing's score. A weight
+recorded at time ``t`` is worth 2 ** ((t - SCORE_EPOCH) / half-life), so
+after one half-life an older event counts half as much as a fresh one.
+Scores are stored as natural logs, which keeps them small forever and lets
+an event be added with one atomic ``UPDATE ... SET score = ln(e^score + e^x)``.
+
+``rebuild_scores`` recomputes every score from the events inside the
+trending window. That drops contributions that have aged out, removes
+listings with no recent activity and repairs any drift from missed
+signals (for example bulk inserts made outside the API).
+
+The trending endpoint pages by keyset: each page ends with an opaque
+cursor holding the last row's ``(score, listing_id)``, and the next page
+continues below it along the same index, so deep pages cost as little as
+the first.
+"""
+import binascii
+import math
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Value, FloatField
+from django.db.models.functions import Exp, Greatest, Least, Ln
+from django.utils import timezone
+
+from .models import Listing, Review, Booking, ListingPopularity
+
+
+SCORE_EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+BOOKING_WEIGHT = 3.0
+COUNTED_BOOKING_STATUSES = ('pending', 'confirmed', 'completed')
+LISTING_FIELDS = ('id', 'listing_type', 'location', 'is_active')
+
+
+def review_weight(rating):
+    """A review counts between 0.75 (one star) and 1.75 (five stars)"""
+    return 0.5 + 0.25 * rating
+
+
+def log_weight(weight, at):
+    """Natural log of ``weight`` recorded at ``at``, scaled to the epoch"""
+    half_lives = (at - SCORE_EPOCH).total_seconds() / (settings.TRENDING_HALF_LIFE_DAYS * 86400)
+    return math.log(weight) + half_lives * math.log(2)
+
+
+def decayed_popularity(score, now=None):
+    """Convert a stored log score to the popularity it represents now"""
+    return math.exp(score - log_weight(1.0, now or timezone.now()))
+
+
+def _log_add(a, b):
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def _log_add_expression(value):
+    """SQL for ln(exp(score) + exp(value)) that cannot overflow"""
+    value = Value(value, output_field=FloatField())
+    high = Greatest(F('score'), value)
+    low = Least(F('score'), value)
+    return high + Ln(Value(1.0) + Exp(low - high))
+
+
+def _combine(events):
+    """Fold ``(listing_id, weight, at)`` events into ``{listing_id: log score}``"""
+    combined = {}
+    for listing_id, weight, at in events:
+        value = log_weight(weight, at)
+        if listing_id in combined:
+            combined[listing_id] = _log_add(combined[listing_id], value)
+        else:
+            combined[listing_id] = value
+    return combined
+
+
+def _popularity_row(listing, score):
+    return ListingPopularity(
+        listing=listing,
+        listing_type=listing.listing_type,
+        location=listing.location,
+        is_active=listing.is_active,
+        score=score,
+    )
+
+
+def record_events(events):
+    """
+    Add ``(listing_id, weight, at)`` events to the stored scores.
+
+    Each affected listing costs one atomic UPDATE; listings that have no
+    popularity row yet are created in one extra query.
+    """
+    combined = _combine(events)
+    missing = [
+        listing_id for listing_id, value in combined.items()
+        if not ListingPopularity.objects.filter(pk=listing_id).update(score=_log_add_expression(value))
+    ]
+    if not missing:
+        return
+    for listing in Listing.objects.filter(pk__in=missing).only(*LISTING_FIELDS):
+        try:
+            with transaction.atomic():
+                _popularity_row(listing, combined[listing.pk]).save(force_insert=True)
+        except IntegrityError:
+            # Another writer created the row first; add to it instead.
+            ListingPopularity.objects.filter(pk=listing.pk).update(
+                score=_log_add_expression(combined[listing.pk])
+            )
+
+
+def record_event(listing_id, weight, at=None):
+    record_events([(listing_id, weight, at or timezone.now())])
+
+
+def booking_events(bookings):
+    return [
+        (booking.listing_id, BOOKING_WEIGHT, booking.created_at or timezone.now())
+        for booking in bookings
+        if booking.status in COUNTED_BOOKING_STATUSES
+    ]
+
+
+def review_events(reviews):
+    return [
+        (review.listing_id, review_weight(review.rating), review.created_at or timezone.now())
+        for review in reviews
+    ]
+
+
+def sync_listing(listing):
+    """Copy a listing's filterable fields onto its popularity row"""
+    ListingPopularity.objects.filter(pk=listing.pk).update(
+        listing_type=listing.listing_type,
+        location=listing.location,
+        is_active=listing.is_active,
+    )
+
+
+def rebuild_scores(now=None):
+    """
+    Recompute all scores from the events inside the trending window.
+
+    Returns the number of listings that have a score afterwards.
+    """
+    now = now or timezone.now()
+    window_start = now - timedelta(days=settings.TRENDING_WINDOW_DAYS)
+    bookings = Booking.objects.filter(
+        created_at__gte=window_start, status__in=COUNTED_BOOKING_STATUSES
+    ).values_list('listing_id', 'created_at')
+    reviews = Review.objects.filter(created_at__gte=window_start).values_list(
+        'listing_id', 'rating', 'created_at'
+    )
+    events = [(listing_id, BOOKING_WEIGHT, at) for listing_id, at in bookings.iterator()]
+    events.extend(
+        (listing_id, review_weight(rating), at) for listing_id, rating, at in reviews.iterator()
+    )
+    combined = _combine(events)
+
+    listings = Listing.objects.filter(pk__in=list(combined)).only(*LISTING_FIELDS)
+    rows = [_popularity_row(listing, combined[listing.pk]) for listing in listings.iterator()]
+    # Readers keep seeing the old ranking until the swap commits.
+    with transaction.atomic():
+        ListingPopularity.objects.all().delete()
+        ListingPopularity.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def trending_queryset(listing_type=None, location=None, after=None):
+    """Active popularity rows, best first, optionally filtered and from below the ``after`` cursor"""
+    queryset = ListingPopularity.objects.filter(is_active=True)
+    if listing_type:
+        queryset = queryset.filter(listing_type=listing_type)
+    if location:
+        queryset = queryset.filter(location=location)
+    if after is not None:
+        score, listing_id = after
+        # The plain bound lets the index seek; the OR breaks ties between equal scores.
+        queryset = queryset.filter(score__lte=score).filter(Q(score__lt=score) | Q(listing_id__lt=listing_id))
+    return queryset.order_by('-score', '-listing_id')
+
+
+def encode_cursor(row):
+    """An opaque cursor for the rows after ``row``"""
+    return urlsafe_b64encode(f'{row.score!r} {row.listing_id}'.encode()).decode()
+
+
+def decode_cursor(value):
+    """``(score, listing_id)`` from a cursor, or None when it is malformed"""
+    try:
+        score, listing_id = urlsafe_b64decode(value.encode()).decode().split()
+        return float(score), int(listing_id)
+    except (ValueError, UnicodeError, binascii.Error):
+        return None
@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
-from .views import PaymentInitiateView, PaymentVerifyView
+from . import views, async_views
+from .views import PaymentInitiateView, PaymentVerifyView, ExportView, HostStatsView
 
 router = DefaultRouter()
 router.register(r'listings', views.ListingViewSet)
@@ -12,4 +12,10 @@ urlpatterns = [
     path('', include(router.urls)),
     path('payments/initiate/<int:booking_id>/', PaymentInitiateView.as_view(), name='payment-initiate'),
     path('payments/verify/<int:booking_id>/', PaymentVerifyView.as_view(), name='payment-verify'),
+    path('export/<str:dataset>/', ExportView.as_view(), name='export'),
+    path('hosts/me/stats/', HostStatsView.as_view(), name='host-stats'),
+    path('async/listings/', async_views.listing_list, name='async-listing-list'),
+    path('async/listings/<int:pk>/', async_views.listing_detail, name='async-listing-detail'),
+    path('async/listings/<int:pk>/reviews/', async_views.listing_reviews, name='async-listing-reviews'),
+    path('events/', async_views.event_stream, name='event-stream'),
 ]
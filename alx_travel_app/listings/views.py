@@ -1,29 +1,84 @@
 from rest_framework import viewsets, permissions, status
+from rest_framework.exceptions import NotFound
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from .models import Listing, Review, Booking, Payment
+from .models import Listing, Review, Booking, Payment, ListingDailyStats, SimilarListing
 from .serializers import (
     ListingSerializer, 
     ListingCreateSerializer, 
     ReviewSerializer,
     BookingSerializer,
-    PaymentSerializer
+    BookingHistorySerializer,
+    BookingBulkItemSerializer,
+    ReviewBulkItemSerializer,
+    PaymentSerializer,
+    QuoteRequestSerializer,
+    StatsRangeSerializer
 )
 import os
-import requests
 from rest_framework.views import APIView
+from django.db import transaction
+from django.db.models import F, Prefetch, prefetch_related_objects
+from django.http import StreamingHttpResponse, Http404
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from rest_framework.utils.urls import replace_query_param
+from . import bulk
+from .archive import booking_history
+from .currency import DisplayCurrencyViewMixin
+from .fieldsets import SparseQueryMixin
+from .idempotency import idempotent
+from .pricing import quote_listing
+from .tasks import send_payment_confirmation
+from . import transitions, trending
+from .warming import CachedReadMixin
 
 
-class ListingViewSet(viewsets.ModelViewSet):
+def bulk_response(request, create_items):
+    """
+    Run a bulk create function over the JSON list in ``request.data``.
+    
+    Responds 201 when every item was created, 400 when none were and 207
+    with per-item results otherwise.
+    """
+    items = request.data
+    if not isinstance(items, list) or not items:
+        return Response(
+            {'error': 'Expected a non-empty JSON list of items'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(items) > bulk.BULK_WRITE_MAX_ITEMS:
+        return Response(
+            {'error': f'At most {bulk.BULK_WRITE_MAX_ITEMS} items can be created at once'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    results = create_items(request.user, items)
+    created = sum(1 for result in results if result['status'] == 'created')
+    if created == len(results):
+        response_status = status.HTTP_201_CREATED
+    elif created == 0:
+        response_status = status.HTTP_400_BAD_REQUEST
+    else:
+        response_status = status.HTTP_207_MULTI_STATUS
+    return Response(
+        {'created': created, 'failed': len(results) - created, 'results': results},
+        status=response_status
+    )
+
+
+class ListingViewSet(CachedReadMixin, DisplayCurrencyViewMixin, SparseQueryMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing travel listings.
     
     Provides CRUD operations for listings with filtering, searching, and ordering.
+    Reads accept ``?fields=`` and ``?omit=`` to return and load fewer fields,
+    and ``?currency=`` to add prices converted to that currency. Anonymous
+    list and detail reads are served from the shared response cache.
     """
     queryset = Listing.objects.filter(is_active=True)
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
@@ -32,6 +87,12 @@ class ListingViewSet(viewsets.ModelViewSet):
     search_fields = ['title', 'description', 'location']
     ordering_fields = ['created_at', 'price', 'title']
     ordering = ['-created_at']
+    sparse_select_related = {'created_by': ['created_by']}
+    sparse_prefetch_related = {
+        'reviews': [Prefetch('reviews', queryset=Review.objects.select_related('reviewer'))],
+    }
+    sparse_columns = {'price': ['currency']}
+    batch_max_ids = 100
     
     def get_serializer_class(self):
         """Return appropriate serializer based on action"""
@@ -49,6 +110,7 @@ class ListingViewSet(viewsets.ModelViewSet):
         responses={201: ReviewSerializer, 400: 'Bad Request'}
     )
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    @idempotent
     def add_review(self, request, pk=None):
         """Add a review to a listing"""
         listing = self.get_object()
@@ -76,9 +138,144 @@ class ListingViewSet(viewsets.ModelViewSet):
         reviews = listing.reviews.all()
         serializer = ReviewSerializer(reviews, many=True)
         return Response(serializer.data)
+    
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('type', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=[t for t, _ in Listing.LISTING_TYPES]),
+            openapi.Parameter('location', openapi.IN_QUERY, type=openapi.TYPE_STRING),
+            openapi.Parameter('cursor', openapi.IN_QUERY, type=openapi.TYPE_STRING),
+        ],
+        responses={200: ListingSerializer(many=True)}
+    )
+    @action(detail=False, methods=['get'])
+    def trending(self, request):
+        """
+        Listings ordered by time-decayed popularity from bookings and reviews.
+        
+        Pages are keyset pages read straight off a pre-sorted index, so no
+        total count is returned; follow ``next`` until it is null.
+        """
+        page_size = self.paginator.get_page_size(request)
+        after = None
+        if 'cursor' in request.query_params:
+            after = trending.decode_cursor(request.query_params['cursor'])
+            if after is None:
+                raise NotFound('Invalid cursor.')
+        rows = list(
+            trending.trending_queryset(
+                request.query_params.get('type'), request.query_params.get('location'), after
+            ).select_related('listing__created_by')[:page_size + 1]
+        )
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        listings = [row.listing for row in rows]
+        prefetch_related_objects(listings, Prefetch('reviews', queryset=Review.objects.select_related('reviewer')))
+        
+        now = timezone.now()
+        results = self.get_serializer(listings, many=True).data
+        for result, row in zip(results, rows):
+            result['popularity'] = round(trending.decayed_popularity(row.score, now), 4)
+        
+        url = request.build_absolute_uri()
+        return Response({
+            'next': replace_query_param(url, 'cursor', trending.encode_cursor(rows[-1])) if has_next else None,
+            'results': results,
+        })
+    
+    @swagger_auto_schema(
+        responses={200: ListingSerializer(many=True)}
+    )
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """
+        Listings similar to this one by audience, text, type, location and price.
+        
+        Reads neighbours precomputed by the ``compute_similar_listings`` task.
+        """
+        listing = self.get_object()
+        neighbours = list(
+            SimilarListing.objects.filter(listing=listing, similar__is_active=True)
+            .select_related('similar__created_by')
+            .order_by('rank')
+        )
+        listings = [neighbour.similar for neighbour in neighbours]
+        prefetch_related_objects(listings, Prefetch('reviews', queryset=Review.objects.select_related('reviewer')))
+        
+        results = self.get_serializer(listings, many=True).data
+        for result, neighbour in zip(results, neighbours):
+            result['similarity'] = round(neighbour.score, 4)
+        return Response(results)
+    
+    @swagger_auto_schema(
+        query_serializer=QuoteRequestSerializer,
+        responses={200: 'Price breakdown for the stay', 400: 'Bad Request'}
+    )
+    @action(detail=True, methods=['get'])
+    def quote(self, request, pk=None):
+        """Quote the total price of a stay from nightly rates and guest surcharges"""
+        listing = self.get_object()
+        params = QuoteRequestSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        quote = quote_listing(
+            listing,
+            params.validated_data['check_in_date'],
+            params.validated_data['check_out_date'],
+            params.validated_data['number_of_guests'],
+        )
+        return Response(quote.as_dict())
+    
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                'ids', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True,
+                description='Comma-separated listing ids (at most 100)'
+            ),
+        ],
+        responses={200: 'Listings in request order plus missing and inactive ids', 400: 'Bad Request'}
+    )
+    @action(detail=False, methods=['get'])
+    def batch(self, request):
+        """
+        Fetch many listings by id in one round trip.
+        
+        Results keep the order of ``ids``. Ids that are not visible are
+        reported under ``inactive`` (deactivated) or ``missing`` (unknown).
+        The query count is fixed regardless of how many ids are requested.
+        """
+        try:
+            ids = [int(part) for part in request.query_params.get('ids', '').split(',') if part.strip()]
+        except ValueError:
+            return Response(
+                {'error': 'ids must be a comma-separated list of integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return Response({'error': 'ids is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > self.batch_max_ids:
+            return Response(
+                {'error': f'At most {self.batch_max_ids} ids can be requested at once'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        listings = self.prune_queryset(self.get_queryset()).filter(pk__in=ids)
+        by_id = {listing.pk: listing for listing in listings}
+        not_found = [pk for pk in ids if pk not in by_id]
+        inactive = set()
+        if not_found:
+            inactive = set(
+                Listing.objects.filter(pk__in=not_found, is_active=False).values_list('pk', flat=True)
+            )
+        
+        serializer = self.get_serializer([by_id[pk] for pk in ids if pk in by_id], many=True)
+        return Response({
+            'results': serializer.data,
+            'missing': [pk for pk in not_found if pk not in inactive],
+            'inactive': [pk for pk in not_found if pk in inactive],
+        })
 
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(SparseQueryMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing reviews.
     
@@ -90,9 +287,12 @@ class ReviewViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['listing', 'rating']
     ordering = ['-created_at']
+    sparse_select_related = {'reviewer': ['reviewer']}
     
     def get_queryset(self):
         """Filter reviews based on user permissions"""
+        if getattr(self, 'swagger_fake_view', False):
+            return Review.objects.none()
         if self.action in ['update', 'partial_update', 'destroy']:
             # Users can only modify their own reviews
             return Review.objects.filter(reviewer=self.request.user)
@@ -101,39 +301,103 @@ class ReviewViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         """Set the reviewer when creating a review"""
         serializer.save(reviewer=self.request.user)
+    
+    @swagger_auto_schema(
+        request_body=ReviewBulkItemSerializer(many=True),
+        responses={201: 'All reviews created', 207: 'Per-item results', 400: 'Bad Request'}
+    )
+    @action(detail=False, methods=['post'], url_path='bulk', permission_classes=[permissions.IsAuthenticated])
+    @idempotent
+    def bulk_create(self, request):
+        """Create up to 1000 reviews by the current user in one transaction"""
+        return bulk_response(request, bulk.bulk_create_reviews)
 
 
-class BookingViewSet(viewsets.ModelViewSet):
+class BookingViewSet(DisplayCurrencyViewMixin, SparseQueryMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing bookings.
     
-    Users can only view and modify their own bookings.
+    Users can only view and modify their own bookings. Reads accept
+    ``?currency=`` to add totals converted to that currency. Updates
+    write only the changed fields and answer 409 when the booking changed
+    since it was read; send back its ``version`` to cover the time since
+    your own read too. Statuses move pending → confirmed or cancelled,
+    and confirmed → cancelled or completed.
     """
     serializer_class = BookingSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['status', 'listing']
     ordering = ['-created_at']
+    sparse_select_related = {'user': ['user'], 'listing_details': ['listing__created_by']}
+    sparse_prefetch_related = {
+        'listing_details': [Prefetch('listing__reviews', queryset=Review.objects.select_related('reviewer'))],
+    }
+    sparse_columns = {'duration_days': ['check_in_date', 'check_out_date']}
     
     def get_queryset(self):
         """Filter bookings to show only user's own bookings"""
-        return Booking.objects.filter(user=self.request.user)
+        if getattr(self, 'swagger_fake_view', False):
+            return Booking.objects.none()
+        return Booking.objects.filter(user=self.request.user).annotate(listing_currency=F('listing__currency'))
+    
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        """Create a booking; retries carrying the same Idempotency-Key are replayed"""
+        return super().create(request, *args, **kwargs)
     
     def perform_create(self, serializer):
         """Set the user when creating a booking"""
         serializer.save(user=self.request.user)
+    
+    @swagger_auto_schema(
+        request_body=BookingBulkItemSerializer(many=True),
+        responses={201: 'All bookings created', 207: 'Per-item results', 400: 'Bad Request'}
+    )
+    @action(detail=False, methods=['post'], url_path='bulk')
+    @idempotent
+    def bulk_create(self, request):
+        """
+        Create up to 1000 bookings for the current user in one transaction.
+        
+        Items that reference a missing listing or overlap another booking
+        are rejected individually; the rest are inserted together.
+        """
+        return bulk_response(request, bulk.bulk_create_bookings)
+    
+    @swagger_auto_schema(
+        responses={200: BookingHistorySerializer(many=True)}
+    )
+    @action(detail=False, methods=['get'])
+    def history(self, request):
+        """
+        All of the user's bookings, newest first, including archived ones.
+        
+        Old finished stays are moved out of the live bookings table by the
+        archive job; this reads both tables in one query.
+        """
+        page = self.paginate_queryset(booking_history(request.user))
+        return self.get_paginated_response(BookingHistorySerializer(page, many=True).data)
 
 
 class PaymentInitiateView(APIView):
     """Initiate payment with Chapa API."""
+    throttle_scope = 'payments'
+
+    @idempotent
     def post(self, request, booking_id):
-        booking = get_object_or_404(Booking, id=booking_id, user=request.user)
+        import requests
+        
+        booking = get_object_or_404(Booking.objects.select_related('listing'), id=booking_id, user=request.user)
+        if booking.listing.currency not in dict(Listing.CURRENCIES):
+            # Only listings saved before currencies were limited can get here.
+            return Response({'error': f'Payments in {booking.listing.currency} are not supported.'}, status=400)
         chapa_key = os.environ.get('CHAPA_SECRET_KEY')
         if not chapa_key:
             return Response({'error': 'Chapa secret key not configured.'}, status=500)
         data = {
             "amount": str(booking.total_price),
-            "currency": "ETB",
+            "currency": booking.listing.currency,
             "email": request.user.email,
             "first_name": request.user.first_name,
             "last_name": request.user.last_name,
@@ -162,7 +426,11 @@ class PaymentInitiateView(APIView):
 
 class PaymentVerifyView(APIView):
     """Verify payment status with Chapa API."""
+    throttle_scope = 'payments'
+
     def get(self, request, booking_id):
+        import requests
+        
         payment = get_object_or_404(Payment, booking_id=booking_id)
         chapa_key = os.environ.get('CHAPA_SECRET_KEY')
         if not chapa_key:
@@ -172,13 +440,119 @@ class PaymentVerifyView(APIView):
         response = requests.get(url, headers=headers)
         if response.status_code == 200:
             resp_data = response.json()
-            status_val = resp_data['data']['status']
-            if status_val == 'success':
-                payment.status = 'completed'
-                payment.save()
-                # TODO: trigger Celery task to send confirmation email
-            elif status_val == 'failed':
-                payment.status = 'failed'
-                payment.save()
+            new_status = {'success': 'completed', 'failed': 'failed'}.get(resp_data['data']['status'])
+            if new_status is not None:
+                with transaction.atomic():
+                    try:
+                        moved = transitions.move(payment, new_status)
+                    except (transitions.InvalidTransition, transitions.StatusConflict):
+                        # Settled already, or a concurrent verification got there first.
+                        payment.refresh_from_db(fields=['status', 'version'])
+                        moved = False
+                    if moved and new_status == 'completed' and self.confirm_booking(payment.booking):
+                        transaction.on_commit(lambda: send_payment_confirmation.delay(payment.pk))
             return Response({'status': payment.status})
         return Response({'error': 'Failed to verify payment.'}, status=400)
+    
+    def confirm_booking(self, booking):
+        """Move a paid booking to confirmed; returns whether it is confirmed now"""
+        try:
+            transitions.move(booking, 'confirmed')
+        except transitions.InvalidTransition:
+            # Cancelled (or over) before the payment went through.
+            return False
+        except transitions.StatusConflict as exc:
+            return (exc.current or {}).get('status') == 'confirmed'
+        return True
+
+
+class ExportView(APIView):
+    """
+    Stream a full CSV or NDJSON dump of listings or bookings.
+
+    Use ``?fmt=csv`` (default) or ``?fmt=ndjson``. Rows are read in chunks,
+    so memory use stays flat regardless of table size.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, dataset):
+        if dataset not in bulk.DATASETS:
+            raise Http404
+        fmt = request.query_params.get('fmt', 'csv')
+        if fmt not in bulk.EXPORT_FORMATS:
+            return Response(
+                {'error': f"Unsupported format '{fmt}'. Use one of: {', '.join(bulk.EXPORT_FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        response = StreamingHttpResponse(
+            bulk.EXPORTERS[fmt](dataset),
+            content_type=bulk.EXPORT_FORMATS[fmt]
+        )
+        response['Content-Disposition'] = f'attachment; filename="{dataset}.{fmt}"'
+        return response
+
+
+class HostStatsView(APIView):
+    """
+    Revenue, occupancy and rating trends for the current user's listings.
+    
+    Answers from the ``ListingDailyStats`` rollups with one range query on
+    the (host, date) index, so the cost does not depend on how many bookings
+    or reviews the listings have.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    counter_fields = ['nights_booked', 'new_reviews', 'rating_sum']
+    revenue_fields = ['revenue_pending', 'revenue_confirmed', 'revenue_completed', 'revenue_cancelled']
+    
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('from', openapi.IN_QUERY, type=openapi.TYPE_STRING, format='date', required=True),
+            openapi.Parameter('to', openapi.IN_QUERY, type=openapi.TYPE_STRING, format='date', required=True),
+        ],
+        responses={200: 'Per-listing totals and daily series', 400: 'Bad Request'}
+    )
+    def get(self, request):
+        params = StatsRangeSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        date_from = params.validated_data['from']
+        date_to = params.validated_data['to']
+        days = (date_to - date_from).days + 1
+        
+        rows = ListingDailyStats.objects.filter(
+            host=request.user, date__range=(date_from, date_to)
+        ).order_by('date').values(
+            'listing_id', 'listing__title', 'date', *self.counter_fields, *self.revenue_fields
+        )
+        
+        listings = {}
+        for row in rows:
+            listing_id = row.pop('listing_id')
+            title = row.pop('listing__title')
+            entry = listings.get(listing_id)
+            if entry is None:
+                entry = listings[listing_id] = {
+                    'listing': listing_id,
+                    'title': title,
+                    'totals': dict.fromkeys(self.counter_fields + self.revenue_fields, 0),
+                    'daily': [],
+                }
+            for field in self.counter_fields + self.revenue_fields:
+                entry['totals'][field] += row[field]
+            for field in self.revenue_fields:
+                row[field] = str(row[field])
+            entry['daily'].append(row)
+        
+        for entry in listings.values():
+            totals = entry['totals']
+            totals['occupancy_rate'] = round(totals['nights_booked'] / days, 4)
+            totals['average_rating'] = (
+                round(totals['rating_sum'] / totals['new_reviews'], 2) if totals['new_reviews'] else None
+            )
+            for field in self.revenue_fields:
+                totals[field] = str(totals[field])
+        
+        return Response({
+            'from': date_from,
+            'to': date_to,
+            'listings': sorted(listings.values(), key=lambda entry: entry['listing']),
+        })
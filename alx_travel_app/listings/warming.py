@@ -0,0 +1,376 @@
+"""
+Shared response cache for anonymous listing reads, and warming it.
+
+Anonymous GETs of the listing list and detail endpoints are answered from
+the default cache when possible. Entries are keyed by ``APP_VERSION``, a
+generation token and the normalized query: scheme, host, path and the
+known parameters in sorted order, without empty ones or ``page=1``.
+Requests carrying any other parameter are not cached. List pages share
+one scope token and each listing's detail responses have their own, so
+a changed listing or a processed review drops the list pages and that
+listing's details only; migrations and admin bulk actions replace the
+global generation token, which drops every entry at once. Converted
+prices (``?currency=``) may lag an exchange-rate refresh by up to
+``RESPONSE_CACHE_TIMEOUT`` seconds.
+
+Every cacheable read is counted per normalized query in
+``CACHE_STATS_BUCKET_SECONDS`` buckets; each process adds its counts to
+``CacheAccessStats`` at most every ``CACHE_STATS_FLUSH_SECONDS`` seconds.
+
+``warm_caches`` replays the ``WARMING_TOP_QUERIES`` most read queries of
+the last ``WARMING_LOOKBACK_HOURS`` through their views,
+``WARMING_CONCURRENCY`` at a time and starting at most ``WARMING_RATE`` a
+second, and builds the schema artifact if this version has none. It runs
+``WARMING_DELAY`` seconds after the cache is dropped and, with
+``WARMING_ON_DEPLOY``, after migrations and on the first worker start of
+each ``APP_VERSION``. Scheduling is best-effort: with the broker down a
+write still goes through and the warm-up is skipped. ``manage.py
+warm_caches --report`` shows the hit rate per bucket, so the recovery
+after a warm-up can be followed.
+"""
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from urllib.parse import urlencode, urlsplit
+
+from celery import signals as celery_signals
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import F, Sum
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+from django.urls import resolve
+from django.utils import timezone
+
+from .models import CacheAccessStats, JobCheckpoint
+
+logger = logging.getLogger(__name__)
+
+CACHE_HEADER = 'X-Cache'
+GENERATION_KEY = 'warming:generation'
+SCOPE_KEY = 'warming:generation:%s'
+LIST_SCOPE = 'list'
+SCHEDULED_KEY = 'warming:scheduled'
+DEPLOYED_KEY = 'warming:deployed:%s'
+CHECKPOINT_NAME = 'cache_warming'
+MAX_QUERY_LENGTH = CacheAccessStats._meta.get_field('query').max_length
+
+WarmResult = namedtuple('WarmResult', 'queries outcomes cached seconds schema_built')
+
+
+def _new_token():
+    return uuid.uuid4().hex[:12]
+
+
+def listing_scope(pk):
+    return f'listing:{pk}'
+
+
+def tokens(scope):
+    """The global and ``scope`` generation tokens; missing ones start a new generation"""
+    keys = [GENERATION_KEY, SCOPE_KEY % scope]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # Scope tokens may expire with their entries; the global one stays.
+            cache.add(key, _new_token(), None if key == GENERATION_KEY else settings.RESPONSE_CACHE_TIMEOUT)
+            found[key] = cache.get(key)
+    return found[GENERATION_KEY], found[keys[1]]
+
+
+def invalidate(listing_ids=None):
+    """
+    Drop the cached list pages and the detail responses of ``listing_ids``,
+    or every cached response without them, and warm the popular ones again soon
+    """
+    if listing_ids is None:
+        cache.set(GENERATION_KEY, _new_token(), None)
+    else:
+        scopes = [LIST_SCOPE, *(listing_scope(pk) for pk in listing_ids)]
+        cache.set_many({SCOPE_KEY % scope: _new_token() for scope in scopes}, settings.RESPONSE_CACHE_TIMEOUT)
+    schedule()
+
+
+def schedule():
+    """Make sure a warm-up is due within ``WARMING_DELAY`` seconds; never fails the caller"""
+    from .tasks import warm_caches
+
+    delay = settings.WARMING_DELAY
+    try:
+        if cache.add(SCHEDULED_KEY, True, delay):
+            try:
+                warm_caches.apply_async(countdown=delay)
+            except Exception:
+                # Let the next change try again.
+                cache.delete(SCHEDULED_KEY)
+                raise
+    except Exception:
+        logger.warning('Could not schedule cache warming', exc_info=True)
+
+
+def normalized_query(request, params, defaults=()):
+    """
+    ``scheme://host/path?query`` with the parameters sorted, or None when
+    the request has a parameter outside ``params``. Parameters equal to
+    a ``(name, value)`` pair in ``defaults`` are left out.
+    """
+    items = []
+    for name in request.query_params:
+        if name not in params:
+            return None
+        items.extend(
+            (name, value) for value in request.query_params.getlist(name)
+            if value and (name, value) not in defaults
+        )
+    query = urlencode(sorted(items))
+    url = f'{request.scheme}://{request.get_host()}{request.path}' + (f'?{query}' if query else '')
+    return url if len(url) <= MAX_QUERY_LENGTH else None
+
+
+def response_scope(view_class, kwargs):
+    """Detail reads belong to their listing's scope, everything else to the list pages"""
+    pk = kwargs.get(getattr(view_class, 'lookup_url_kwarg', None) or getattr(view_class, 'lookup_field', 'pk'))
+    return LIST_SCOPE if pk is None else listing_scope(pk)
+
+
+def query_scope(query):
+    match = resolve(urlsplit(query).path)
+    return response_scope(match.func.cls, match.kwargs)
+
+
+def response_key(query, scope):
+    generation, scope_token = tokens(scope)
+    digest = hashlib.sha1(query.encode()).hexdigest()
+    return f'response:{settings.APP_VERSION}:{generation}:{scope_token}:{digest}'
+
+
+def bucket_start(moment):
+    size = settings.CACHE_STATS_BUCKET_SECONDS
+    return datetime.fromtimestamp(moment.timestamp() // size * size, tz=dt_timezone.utc)
+
+
+def _add_counts(bucket, query, hits, misses):
+    changes = {'hits': F('hits') + hits, 'misses': F('misses') + misses}
+    if CacheAccessStats.objects.filter(bucket=bucket, query=query).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            CacheAccessStats.objects.create(bucket=bucket, query=query, hits=hits, misses=misses)
+    except IntegrityError:
+        # Another process created the row in the meantime.
+        CacheAccessStats.objects.filter(bucket=bucket, query=query).update(**changes)
+
+
+class AccessStats:
+    """This process's read counts, added to ``CacheAccessStats`` now and then"""
+
+    def __init__(self):
+        self.counts = {}
+        self.flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, query, hit):
+        bucket = bucket_start(timezone.now())
+        with self._lock:
+            entry = self.counts.setdefault((bucket, query), [0, 0])
+            entry[0 if hit else 1] += 1
+            due = time.monotonic() - self.flushed_at >= settings.CACHE_STATS_FLUSH_SECONDS
+            if due:
+                counts, self.counts = self.counts, {}
+                self.flushed_at = time.monotonic()
+        if due:
+            self.flush(counts)
+
+    def flush(self, counts):
+        try:
+            for (bucket, query), (hits, misses) in counts.items():
+                _add_counts(bucket, query, hits, misses)
+        except DatabaseError:
+            logger.exception('Could not store cache access stats')
+
+
+stats = AccessStats()
+
+
+class CachedReadMixin:
+    """
+    Viewset mixin answering anonymous ``list`` and ``retrieve`` requests
+    from the response cache. Filterset, search, ordering, page, sparse
+    field and currency parameters are part of the key; requests with any
+    other parameter always reach the view.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_query_params(self):
+        # DRF and the modules built on it are imported here, not at the top:
+        # the signals import this module in workers, which never serve a request.
+        from rest_framework.settings import api_settings
+        from .currency import CURRENCY_PARAM
+        from .fieldsets import FIELDS_PARAM, OMIT_PARAM
+        
+        params = {FIELDS_PARAM, OMIT_PARAM, CURRENCY_PARAM, *getattr(self, 'filterset_fields', ())}
+        if getattr(self, 'search_fields', None):
+            params.add(api_settings.SEARCH_PARAM)
+        if getattr(self, 'ordering_fields', None):
+            params.add(api_settings.ORDERING_PARAM)
+        if self.paginator is not None:
+            params.add(self.paginator.page_query_param)
+        return params
+
+    def cached_response(self, view, request, *args, **kwargs):
+        query = None
+        if settings.RESPONSE_CACHE_TIMEOUT and request.method == 'GET' and not request.user.is_authenticated:
+            defaults = {(self.paginator.page_query_param, '1')} if self.paginator is not None else ()
+            query = normalized_query(request, self.cached_query_params(), defaults)
+        if query is None:
+            return view(request, *args, **kwargs)
+
+        key = response_key(query, response_scope(type(self), kwargs))
+        data = cache.get(key)
+        hit = data is not None
+        if hit:
+            from rest_framework.response import Response
+            
+            response = Response(data)
+        else:
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        response[CACHE_HEADER] = 'HIT' if hit else 'MISS'
+        # Warm-ups would otherwise make the queries they replay look popular.
+        if not getattr(request, 'warming', False):
+            stats.record(query, hit)
+        return response
+
+
+def popular_queries(limit=None, hours=None):
+    """The most read normalized queries of the last ``hours``, most read first"""
+    since = timezone.now() - timedelta(hours=hours or settings.WARMING_LOOKBACK_HOURS)
+    return list(
+        CacheAccessStats.objects.filter(bucket__gte=since)
+        .values('query').annotate(reads=Sum(F('hits') + F('misses')))
+        .order_by('-reads', 'query').values_list('query', flat=True)[:limit or settings.WARMING_TOP_QUERIES]
+    )
+
+
+def hit_rates(hours):
+    """``(bucket, hits, misses)`` for each bucket of the last ``hours``, oldest first"""
+    since = timezone.now() - timedelta(hours=hours)
+    return list(
+        CacheAccessStats.objects.filter(bucket__gte=since)
+        .values('bucket').annotate(total_hits=Sum('hits'), total_misses=Sum('misses'))
+        .order_by('bucket').values_list('bucket', 'total_hits', 'total_misses')
+    )
+
+
+def replay(query):
+    """Serve ``query`` anonymously through its view as a warm-up; returns the response"""
+    from django.test import RequestFactory
+
+    url = urlsplit(query)
+    match = resolve(url.path)
+    initkwargs = {**getattr(match.func, 'initkwargs', {}), 'throttle_classes': []}
+    if hasattr(match.func, 'actions'):
+        view = match.func.cls.as_view(match.func.actions, **initkwargs)
+    else:
+        view = match.func.cls.as_view(**initkwargs)
+    request = RequestFactory().get(
+        url.path + (f'?{url.query}' if url.query else ''),
+        HTTP_HOST=url.netloc,
+        secure=url.scheme == 'https',
+    )
+    request.warming = True
+    return view(request, *match.args, **match.kwargs)
+
+
+def _warm_one(query):
+    try:
+        response = replay(query)
+    except Exception:
+        logger.exception('Warming %s failed', query)
+        return 'failed'
+    finally:
+        # Pool threads would otherwise each keep a connection open.
+        connection.close()
+    if response.status_code != 200:
+        return 'failed'
+    return 'already cached' if response.get(CACHE_HEADER) == 'HIT' else 'warmed'
+
+
+def warm(queries, concurrency=None, rate=None):
+    """Replay ``queries``, ``concurrency`` at a time and starting at most ``rate`` a second"""
+    concurrency = concurrency or settings.WARMING_CONCURRENCY
+    rate = rate or settings.WARMING_RATE
+    began = time.monotonic()
+    slots = threading.BoundedSemaphore(concurrency)
+    futures = []
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='warming') as pool:
+        for index, query in enumerate(queries):
+            wait = began + index / rate - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            # Hold back instead of queueing, so the rate is the rate requests start at.
+            slots.acquire()
+            future = pool.submit(_warm_one, query)
+            future.add_done_callback(lambda _: slots.release())
+            futures.append(future)
+    return Counter(future.result() for future in futures)
+
+
+def warm_schema():
+    """Build the schema artifacts for this ``APP_VERSION`` unless they exist; returns whether it did"""
+    from alx_travel_app import schema
+
+    if all(schema.artifact_path(fmt).exists() for fmt in schema.FORMATS):
+        return False
+    schema.write_artifacts()
+    return True
+
+
+def prune_stats():
+    cutoff = timezone.now() - timedelta(days=settings.CACHE_STATS_RETENTION_DAYS)
+    CacheAccessStats.objects.filter(bucket__lt=cutoff).delete()
+
+
+def run(limit=None, hours=None, concurrency=None, rate=None):
+    """Warm the schema and the most read queries; returns a ``WarmResult``"""
+    began = time.monotonic()
+    prune_stats()
+    schema_built = warm_schema()
+    queries = popular_queries(limit, hours)
+    outcomes = warm(queries, concurrency, rate)
+
+    # How many of them a request arriving now would find.
+    keys = [response_key(query, query_scope(query)) for query in queries]
+    cached = len(cache.get_many(keys)) if keys else 0
+    JobCheckpoint.objects.update_or_create(name=CHECKPOINT_NAME, defaults={'last_run_at': timezone.now()})
+    return WarmResult(queries, outcomes, cached, time.monotonic() - began, schema_built)
+
+
+@receiver(post_migrate)
+def warm_after_migrate(sender, **kwargs):
+    """Migrations may change what the endpoints return, so start over"""
+    if sender.name != 'listings' or not settings.WARMING_ON_DEPLOY:
+        return
+    try:
+        invalidate()
+    except Exception:
+        logger.warning('Could not schedule cache warming after migrating', exc_info=True)
+
+
+@celery_signals.worker_ready.connect
+def warm_after_deploy(sender=None, **kwargs):
+    """The first worker to start on a new ``APP_VERSION`` schedules a warm-up"""
+    if settings.WARMING_ON_DEPLOY and cache.add(DEPLOYED_KEY % settings.APP_VERSION, True, None):
+        schedule()